@@ -0,0 +1,69 @@
+"""
+Compare charts per second of the rendering backends of render_vwaps_chart,
+see CHART_BACKENDS, on the same synthetic daily charts.
+Without kaleido, only the figure build of the plotly backend is timed.
+Run from the repository root:
+python -m benchmarks.bench_backends
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from misc import record_spans
+from vwaps_plot_build_save import CHART_BACKENDS, compute_vwaps, render_vwaps_chart
+
+from .synthetic import make_anchor_dates, make_ohlcv
+
+
+def run(charts_count: int, bars_count: int, anchors_count: int) -> None:
+    ohlc_df = make_ohlcv(bars_count=bars_count, interval="1d")
+    chart_data = compute_vwaps(
+        input_df=ohlc_df,
+        anchor_dates=make_anchor_dates(ohlc_df=ohlc_df, anchors_count=anchors_count),
+        add_last_min_max=True,
+    )
+    print(f"{charts_count=}, {bars_count=}, {anchors_count=}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for backend in CHART_BACKENDS:
+            error = None
+            with record_spans() as recorder:
+                start = time.perf_counter()
+                try:
+                    for counter in range(charts_count):
+                        render_vwaps_chart(
+                            chart_data=chart_data,
+                            chart_title=f"chart {counter}",
+                            file_name=os.path.join(
+                                temp_dir, f"{backend}_{counter}.png"
+                            ),
+                            backend=backend,
+                        )
+                except Exception as render_error:  # pylint: disable=W0718
+                    error = render_error
+                total_time = time.perf_counter() - start
+            summary = recorder.get_summary()  # type: ignore
+            build_time = summary.loc["figure_build", "total_s"]
+            build_count = summary.loc["figure_build", "count"]
+            if error is not None:
+                print(
+                    f"{backend:>6}: figure build {build_count / build_time:.2f} charts/s, image write failed: {error!r}"
+                )
+                continue
+            print(
+                f"{backend:>6}: {charts_count / total_time:.2f} charts/s, figure build {build_time / charts_count * 1000:.1f} ms, image write {summary.loc['image_write', 'total_s'] / charts_count * 1000:.1f} ms per chart"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--charts", type=int, default=20)
+    parser.add_argument("--bars", type=int, default=1000)
+    parser.add_argument("--anchors", type=int, default=4)
+    args = parser.parse_args()
+    run(
+        charts_count=args.charts,
+        bars_count=args.bars,
+        anchors_count=args.anchors,
+    )
@@ -0,0 +1,122 @@
+"""
+Record the peak memory of the two daily charts of a ticker with tracemalloc
+and fail if it grows beyond a set multiple of the input size.
+The compute stage is checked separately, it doesn't depend on plotly.
+The figures are built but not saved, kaleido is not needed.
+Run from the repository root:
+python -m benchmarks.bench_chart_memory
+"""
+
+import argparse
+import sys
+import tracemalloc
+from typing import Callable, List
+
+import pandas as pd
+from plotly.graph_objects import Figure
+
+from benchmarks.synthetic import make_anchor_dates, make_history
+from vwaps_plot_build_save import (
+    compute_vwaps,
+    prepare_chart_bars,
+    vwaps_plot_build_save,
+)
+
+# NOTE Peak memory limits in input sizes, for the two charts of a ticker together.
+# Before the charts shared one working frame, they were about 4.3 and 6.9.
+MAX_COMPUTE_PEAK_TO_INPUT = 2.5
+MAX_CHARTS_PEAK_TO_INPUT = 5.0
+
+
+class _DiscardImageExporter:
+    """
+    Takes the place of BatchImageExporter, drops the figures.
+    """
+
+    def add(self, fig: Figure, file_name: str) -> None:
+        pass
+
+
+def _compute_two_charts(ohlc_df: pd.DataFrame) -> None:
+    anchor_dates = make_anchor_dates(ohlc_df=ohlc_df, anchors_count=2)
+    chart_bars = prepare_chart_bars(input_df=ohlc_df, add_last_min_max=True)
+    for chart_anchor_dates in (anchor_dates, anchor_dates[1:]):
+        compute_vwaps(
+            input_df=ohlc_df,
+            anchor_dates=chart_anchor_dates,
+            add_last_min_max=True,
+            chart_bars=chart_bars,
+        )
+
+
+def _draw_two_charts(ohlc_df: pd.DataFrame) -> None:
+    """
+    The same two charts as draw_all_daily_charts builds for a ticker.
+    """
+    anchor_dates = make_anchor_dates(ohlc_df=ohlc_df, anchors_count=2)
+    chart_bars = prepare_chart_bars(input_df=ohlc_df, add_last_min_max=True)
+    for chart_anchor_dates in (anchor_dates, anchor_dates[1:]):
+        vwaps_plot_build_save(
+            input_df=ohlc_df,
+            anchor_dates=chart_anchor_dates,
+            add_last_min_max=True,
+            print_df=False,
+            image_exporter=_DiscardImageExporter(),  # type: ignore
+            chart_bars=chart_bars,
+        )
+
+
+def measure_peak_memory(func: Callable, ohlc_df: pd.DataFrame) -> float:
+    """
+    Return the peak memory allocated by func(ohlc_df), in input sizes.
+    """
+    input_size = ohlc_df.memory_usage(index=True, deep=True).sum()
+    tracemalloc.start()
+    try:
+        func(ohlc_df)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / input_size
+
+
+def run(
+    sizes: List[int], max_compute_peak_to_input: float, max_charts_peak_to_input: float
+) -> bool:
+    print(f"{'bars':>10} {'input, MB':>10} {'compute':>8} {'charts':>8}")
+    all_ok = True
+    for bars_count in sizes:
+        ohlc_df = make_history(bars_count=bars_count)
+        # NOTE The first run warms up imports and caches
+        _draw_two_charts(ohlc_df=ohlc_df.iloc[:1000])
+        compute_peak = measure_peak_memory(func=_compute_two_charts, ohlc_df=ohlc_df)
+        charts_peak = measure_peak_memory(func=_draw_two_charts, ohlc_df=ohlc_df)
+        input_mb = ohlc_df.memory_usage(index=True, deep=True).sum() / 2**20
+        is_ok = (
+            compute_peak <= max_compute_peak_to_input
+            and charts_peak <= max_charts_peak_to_input
+        )
+        print(
+            f"{bars_count:>10} {input_mb:>10.1f} {compute_peak:>8.2f} {charts_peak:>8.2f}"
+            f" {'ok' if is_ok else 'TOO HIGH'}"
+        )
+        all_ok = all_ok and is_ok
+    return all_ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument(
+        "--max-compute-peak", type=float, default=MAX_COMPUTE_PEAK_TO_INPUT
+    )
+    parser.add_argument(
+        "--max-charts-peak", type=float, default=MAX_CHARTS_PEAK_TO_INPUT
+    )
+    args = parser.parse_args()
+    if not run(
+        sizes=args.sizes,
+        max_compute_peak_to_input=args.max_compute_peak,
+        max_charts_peak_to_input=args.max_charts_peak,
+    ):
+        sys.exit(1)
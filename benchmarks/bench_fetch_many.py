@@ -0,0 +1,87 @@
+"""
+Compare sequential fetching with fetch_many using a stub provider
+that sleeps to imitate the network latency and fails for some tickers.
+Run from the repository root:
+python -m benchmarks.bench_fetch_many
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from import_ohlc import fetch_many
+
+
+def _make_stub_provider(latency_seconds: float, bad_tickers: set):
+    def _get_ohlc_stub(
+        ticker: str, period: str = "2y", interval: str = "1d"
+    ) -> pd.DataFrame:
+        time.sleep(latency_seconds)
+        if ticker in bad_tickers:
+            raise RuntimeError(f"_get_ohlc_stub: no data for {ticker=}")
+        res = pd.DataFrame(
+            {
+                column: np.ones(10)
+                for column in ["Open", "High", "Low", "Close", "Volume"]
+            },
+            index=pd.date_range("2024-01-01", periods=10, freq="D"),
+        )
+        res.attrs["ticker"] = ticker
+        res.attrs["period"] = period
+        res.attrs["interval"] = interval
+        return res
+
+    return _get_ohlc_stub
+
+
+def run(
+    tickers_count: int,
+    latency_seconds: float,
+    max_workers: int,
+    requests_per_second: float,
+) -> None:
+    tickers = [f"T{counter}" for counter in range(tickers_count)]
+    get_ohlc_stub = _make_stub_provider(
+        latency_seconds=latency_seconds, bad_tickers={"T3"}
+    )
+
+    start = time.perf_counter()
+    for ticker in tickers:
+        try:
+            get_ohlc_stub(ticker=ticker, period="max", interval="1d")
+        except RuntimeError:
+            pass
+    sequential_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results, errors = fetch_many(
+        tickers=tickers,
+        interval="1d",
+        period="max",
+        get_ohlc_func=get_ohlc_stub,
+        max_workers=max_workers,
+        requests_per_second=requests_per_second,
+        retries=0,
+    )
+    concurrent_time = time.perf_counter() - start
+
+    print(f"{tickers_count=}, {latency_seconds=}, {max_workers=}")
+    print(f"sequential: {sequential_time:.2f} s")
+    print(f"fetch_many: {concurrent_time:.2f} s, {len(results)} ok, {errors=}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tickers", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--requests-per-second", type=float, default=50.0)
+    args = parser.parse_args()
+    run(
+        tickers_count=args.tickers,
+        latency_seconds=args.latency,
+        max_workers=args.workers,
+        requests_per_second=args.requests_per_second,
+    )
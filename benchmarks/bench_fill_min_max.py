@@ -0,0 +1,128 @@
+"""
+Compare the iterrows-based fill_is_min_max with the NumPy state machine.
+Run from the repository root:
+python -m benchmarks.bench_fill_min_max
+"""
+
+import argparse
+import time
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_history
+from constants import ATR_MULTIPLIER, ATR_SMOOTHING_N
+from misc import add_atr_col_to_df, fill_is_min_max
+from misc.fill_min_max import find_min_max_positions
+
+
+def _fill_is_min_max_iterrows(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The previous implementation of fill_is_min_max, kept as a reference.
+    """
+    internal_df = df.copy()
+    internal_df["is_min"] = False
+    internal_df["is_max"] = False
+    if f"atr_{ATR_SMOOTHING_N}" not in internal_df.columns:
+        internal_df = add_atr_col_to_df(df=internal_df)
+    start_date = df.index.min()
+    current_candidate = {
+        "extremum_to_detect": "min",
+        "date": start_date,
+        "price_val": internal_df[internal_df.index == start_date]["Close"].values[0],
+    }
+    for i, row in (
+        internal_df[internal_df.index >= current_candidate["date"]]
+        .sort_index()
+        .iterrows()
+    ):
+        if current_candidate["extremum_to_detect"] == "max":
+            if row["Close"] >= current_candidate["price_val"]:
+                current_candidate["price_val"] = row["Close"]
+                current_candidate["date"] = i
+            elif (current_candidate["price_val"] - row["Close"]) > (
+                row[f"atr_{ATR_SMOOTHING_N}"] * ATR_MULTIPLIER
+            ):
+                internal_df.loc[
+                    internal_df.index == current_candidate["date"], "is_max"
+                ] = True
+                current_candidate["extremum_to_detect"] = "min"
+                current_candidate["date"] = i
+                current_candidate["price_val"] = row["Close"]
+        else:
+            if row["Close"] <= current_candidate["price_val"]:
+                current_candidate["price_val"] = row["Close"]
+                current_candidate["date"] = i
+            elif (row["Close"] - current_candidate["price_val"]) > (
+                row[f"atr_{ATR_SMOOTHING_N}"] * ATR_MULTIPLIER
+            ):
+                internal_df.loc[
+                    internal_df.index == current_candidate["date"], "is_min"
+                ] = True
+                current_candidate["extremum_to_detect"] = "max"
+                current_candidate["date"] = i
+                current_candidate["price_val"] = row["Close"]
+    return internal_df
+
+
+def _best_time(func, repeat: int) -> float:
+    res = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        res = min(res, time.perf_counter() - start)
+    return res
+
+
+def run(sizes: List[int], max_legacy_size: int, repeat: int) -> None:
+    # NOTE The first call compiles the numba kernel, don't count it
+    find_min_max_positions(close=np.ones(2), atr=np.ones(2))
+
+    print(
+        f"{'bars':>10} {'iterrows, s':>12} {'numpy, s':>10} {'numba, s':>10} {'speedup':>10}"
+    )
+    for size in sizes:
+        df = add_atr_col_to_df(df=make_history(bars_count=size))
+        close = df["Close"].to_numpy()
+        atr = df[f"atr_{ATR_SMOOTHING_N}"].to_numpy()
+
+        new_df = fill_is_min_max(df=df)
+        numpy_time = _best_time(
+            lambda: find_min_max_positions(close=close, atr=atr, use_numba=False),
+            repeat=repeat,
+        )
+        numba_time = _best_time(
+            lambda: find_min_max_positions(close=close, atr=atr), repeat=repeat
+        )
+
+        legacy_time = float("nan")
+        if size <= max_legacy_size:
+            start = time.perf_counter()
+            legacy_df = _fill_is_min_max_iterrows(df=df)
+            legacy_time = time.perf_counter() - start
+            if not (
+                legacy_df["is_min"].equals(new_df["is_min"])
+                and legacy_df["is_max"].equals(new_df["is_max"])
+            ):
+                raise AssertionError(f"is_min / is_max mismatch for {size=}")
+        print(
+            f"{size:>10} {legacy_time:>12.3f} {numpy_time:>10.4f} {numba_time:>10.5f} "
+            f"{legacy_time / numba_time:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument(
+        "--max-legacy-size",
+        type=int,
+        default=100_000,
+        help="skip the slow iterrows version above this number of bars",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(sizes=args.sizes, max_legacy_size=args.max_legacy_size, repeat=args.repeat)
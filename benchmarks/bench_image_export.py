@@ -0,0 +1,72 @@
+"""
+Compare charts per second of fig.write_image called for every chart
+with write_images_batch that renders all charts through one kaleido session.
+Run from the repository root, requires kaleido:
+python -m benchmarks.bench_image_export
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+import plotly.graph_objects as go
+
+from misc import write_images_batch
+
+
+def _make_figures(charts_count: int, bars_count: int) -> List[go.Figure]:
+    rng = np.random.default_rng(0)
+    res = list()
+    for _ in range(charts_count):
+        close = 100 + np.cumsum(rng.normal(0, 1, bars_count))
+        fig = go.Figure(
+            data=[
+                go.Candlestick(
+                    open=close,
+                    high=close + 1,
+                    low=close - 1,
+                    close=close,
+                    line=dict(width=1),
+                ),
+                go.Scatter(y=np.cumsum(close) / np.arange(1, bars_count + 1)),
+            ]
+        )
+        fig.update_xaxes(rangeslider_visible=False)
+        res.append(fig)
+    return res
+
+
+def run(charts_count: int, bars_count: int, image_format: str) -> None:
+    figures = _make_figures(charts_count=charts_count, bars_count=bars_count)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_names = [
+            os.path.join(temp_dir, f"chart_{counter}.{image_format}")
+            for counter in range(charts_count)
+        ]
+
+        start = time.perf_counter()
+        for fig, file_name in zip(figures, file_names):
+            fig.write_image(file_name)
+        single_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        errors = write_images_batch(figures_and_files=zip(figures, file_names))
+        batch_time = time.perf_counter() - start
+        if len(errors) > 0:
+            raise RuntimeError(f"write_images_batch failed: {errors=}")
+
+    print(f"{charts_count=}, {bars_count=}, {image_format=}")
+    print(f"write_image per chart: {charts_count / single_time:.2f} charts/s")
+    print(f"write_images_batch:    {charts_count / batch_time:.2f} charts/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--charts", type=int, default=20)
+    parser.add_argument("--bars", type=int, default=250)
+    parser.add_argument("--format", default="png", choices=["png", "svg", "pdf"])
+    args = parser.parse_args()
+    run(charts_count=args.charts, bars_count=args.bars, image_format=args.format)
@@ -0,0 +1,261 @@
+"""
+Check get_ohlc_from_av and get_ohlc_hedged against a local stand-in
+of the Alpha Vantage server, no network and no API key are needed.
+The server serves canned CSV responses built from synthetic bars,
+with an injected delay, and the JSON error note for unknown tickers.
+Exits with code 1 if any check fails.
+Run from the repository root:
+python -m benchmarks.bench_providers
+"""
+
+import argparse
+import functools
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+import requests
+
+from import_ohlc import (
+    OHLC_COLUMNS,
+    get_ohlc_from_av,
+    get_ohlc_hedged,
+    normalize_ohlc,
+    parse_av_csv,
+)
+
+from .synthetic import make_ohlcv
+
+_ERROR_BODY = b'{"Information": "Thank you for using Alpha Vantage! Please consider spreading out your free API requests more sparingly."}'
+
+
+def _to_av_csv(df: pd.DataFrame, interval: str) -> bytes:
+    """
+    Write the bars like Alpha Vantage does: naive timestamps, newest first.
+    """
+    timestamp_format = "%Y-%m-%d" if interval == "1d" else "%Y-%m-%d %H:%M:%S"
+    res = pd.DataFrame(
+        {
+            "timestamp": df.index.tz_localize(None).strftime(timestamp_format),  # type: ignore
+            "open": df["Open"].to_numpy(),
+            "high": df["High"].to_numpy(),
+            "low": df["Low"].to_numpy(),
+            "close": df["Close"].to_numpy(),
+            "volume": df["Volume"].to_numpy(dtype=np.int64),
+        }
+    )
+    return res.iloc[::-1].to_csv(index=False).encode("utf-8")
+
+
+class _StandInServer:
+    """
+    Serves bodies[(symbol, interval)] after delay seconds.
+    """
+
+    def __init__(self, bodies: Dict[tuple, bytes], delay: float):
+        self.requests_count = 0
+        self.connections_count = 0
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            # NOTE Keep-alive, so that the pooled session can reuse connections
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                server.connections_count += 1
+
+            def do_GET(self):  # pylint: disable=C0103
+                server.requests_count += 1
+                query = parse_qs(urlparse(self.path).query)
+                symbol = query["symbol"][0]
+                interval = query.get("interval", ["1d"])[0]
+                time.sleep(delay)
+                body = bodies.get((symbol, interval), _ERROR_BODY)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/csv")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):  # pylint: disable=W0221
+                pass
+
+        self._http_server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._http_server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self._http_server.server_port}/query"
+        self._thread = threading.Thread(
+            target=self._http_server.serve_forever, daemon=True
+        )
+
+    def __enter__(self) -> "_StandInServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._http_server.shutdown()
+        self._http_server.server_close()
+
+
+def _make_fake_primary(bars: Dict[str, pd.DataFrame], delay: float, fail: bool):
+    def _get_ohlc_fake(
+        ticker: str, period: str = "2y", interval: str = "1d"
+    ) -> pd.DataFrame:
+        time.sleep(delay)
+        if fail:
+            raise RuntimeError(f"_get_ohlc_fake: no data for {ticker=}")
+        res = bars[ticker].copy()
+        res.attrs = {"ticker": ticker, "period": period, "interval": interval}
+        return res
+
+    return _get_ohlc_fake
+
+
+def _check(failures: List[str], condition: bool, message: str) -> None:
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    if not condition:
+        failures.append(message)
+
+
+def run(bars_count: int, requests_count: int, server_delay: float) -> None:
+    failures: List[str] = list()
+    bars = {"SYNTH": make_ohlcv(bars_count=bars_count, interval="1d")}
+    intraday = make_ohlcv(bars_count=2_000, interval="1m", start="2024-03-07")
+    bodies = {
+        ("SYNTH", "1d"): _to_av_csv(bars["SYNTH"], interval="1d"),
+        ("SYNTH", "1min"): _to_av_csv(intraday, interval="1m"),
+    }
+
+    start = time.perf_counter()
+    parsed = parse_av_csv(bodies[("SYNTH", "1d")])
+    print(
+        f"parse_av_csv: {bars_count} bars, {len(bodies[('SYNTH', '1d')]) / 1e6:.1f} MB in {time.perf_counter() - start:.3f} s"
+    )
+    _check(failures, parsed.index.is_monotonic_increasing, "parsed bars ascending")
+
+    with _StandInServer(bodies=bodies, delay=server_delay) as server:
+        get_av = functools.partial(
+            get_ohlc_from_av, api_key="demo", base_url=server.base_url
+        )
+
+        # NOTE The same bars from both providers must give equal DataFrames
+        av_df = get_av(ticker="SYNTH", period="max", interval="1d")
+        yf_df = normalize_ohlc(
+            df=bars["SYNTH"], ticker="SYNTH", period="max", interval="1d"
+        )
+        _check(failures, list(av_df.columns) == OHLC_COLUMNS, "columns")
+        _check(failures, str(av_df.index.tz) == "America/New_York", "timezone")
+        _check(
+            failures,
+            av_df.attrs == {**yf_df.attrs, "provider": "alpha_vantage"},  # type: ignore
+            f"attrs {av_df.attrs}",
+        )
+        _check(
+            failures,
+            av_df.index.equals(yf_df.index)
+            and np.array_equal(
+                av_df.to_numpy(dtype=np.float64), yf_df.to_numpy(dtype=np.float64)
+            ),
+            "daily bars equal to the served ones",
+        )
+        av_intraday = get_av(ticker="SYNTH", period="max", interval="1m")
+        _check(
+            failures,
+            av_intraday.index.equals(intraday.index),  # type: ignore
+            "intraday timestamps equal to the served ones",
+        )
+        try:
+            get_av(ticker="BAD", period="max", interval="1d")
+            _check(failures, False, "JSON error note raises RuntimeError")
+        except RuntimeError as error:
+            _check(
+                failures,
+                "Thank you" in str(error),
+                "JSON error note raises RuntimeError",
+            )
+
+        # NOTE Pooled keep-alive session against a new connection per request
+        connections_before = server.connections_count
+        start = time.perf_counter()
+        for _ in range(requests_count):
+            get_av(ticker="SYNTH", period="max", interval="1m")
+        pooled_time = time.perf_counter() - start
+        pooled_connections = server.connections_count - connections_before
+        start = time.perf_counter()
+        for _ in range(requests_count):
+            with requests.Session() as session:
+                get_av(ticker="SYNTH", period="max", interval="1m", session=session)
+        unpooled_time = time.perf_counter() - start
+        print(
+            f"{requests_count} requests: pooled {pooled_time:.3f} s over {pooled_connections} connections, new session each {unpooled_time:.3f} s"
+        )
+        _check(
+            failures, pooled_connections <= 1, "pooled session reuses the connection"
+        )
+
+        for label, primary_delay, primary_fail, budget, expected in [
+            ("fast primary", 0.0, False, 0.2, "_get_ohlc_fake"),
+            ("slow primary", 3.0, False, 0.2, "alpha_vantage"),
+            ("failing primary", 0.0, True, 5.0, "alpha_vantage"),
+        ]:
+            start = time.perf_counter()
+            hedged_df = get_ohlc_hedged(
+                ticker="SYNTH",
+                period="max",
+                interval="1d",
+                primary_func=_make_fake_primary(
+                    bars=bars, delay=primary_delay, fail=primary_fail
+                ),
+                secondary_func=get_av,
+                latency_budget=budget,
+            )
+            seconds = time.perf_counter() - start
+            _check(
+                failures,
+                hedged_df.attrs["provider"] == expected
+                and list(hedged_df.columns) == OHLC_COLUMNS
+                and hedged_df.index.equals(yf_df.index),
+                f"{label}: {hedged_df.attrs['provider']} answered in {seconds:.2f} s",
+            )
+            if label == "slow primary":
+                _check(
+                    failures, seconds < primary_delay, "slow primary is not waited for"
+                )
+
+        try:
+            get_ohlc_hedged(
+                ticker="BAD",
+                period="max",
+                interval="1d",
+                primary_func=_make_fake_primary(bars=bars, delay=0.0, fail=True),
+                secondary_func=get_av,
+            )
+            _check(failures, False, "both failing raise the primary error")
+        except RuntimeError as error:
+            _check(
+                failures,
+                "_get_ohlc_fake" in str(error),
+                "both failing raise the primary error",
+            )
+
+    if len(failures) > 0:
+        print(f"{len(failures)} checks failed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bars", type=int, default=8_000)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--server-delay", type=float, default=0.01)
+    args = parser.parse_args()
+    run(
+        bars_count=args.bars,
+        requests_count=args.requests,
+        server_delay=args.server_delay,
+    )
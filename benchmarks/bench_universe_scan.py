@@ -0,0 +1,69 @@
+"""
+Time write_universe_scan on a BarStore of many synthetic daily tickers
+in a temporary directory, without plotting.
+Filling the store is timed separately, it is not part of the scan.
+Run from the repository root:
+python -m benchmarks.bench_universe_scan
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from import_ohlc import BarStore
+from misc import record_spans
+from universe_scan import write_universe_scan
+
+from .synthetic import make_ohlcv
+
+
+def run(tickers_count: int, bars_count: int, reclaim_bars: int, repeat: int) -> None:
+    print(f"{tickers_count=}, {bars_count=}, {reclaim_bars=}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store_dir = os.path.join(temp_dir, "bar_store")
+        bar_store = BarStore(store_dir=store_dir)
+        start = time.perf_counter()
+        for counter in range(tickers_count):
+            # NOTE Some tickers have shorter histories, like recent listings
+            ohlc_df = make_ohlcv(
+                bars_count=bars_count if counter % 10 != 0 else bars_count // 3,
+                seed=counter,
+                start="2019-01-02",
+                ticker=f"T{counter:05d}",
+            )
+            bar_store.write(df=ohlc_df)
+        print(f"store fill: {time.perf_counter() - start:.1f} s")
+
+        # NOTE The first scan also compiles the numba functions
+        # and reads the files from disk if they are not cached
+        for counter in range(repeat):
+            with record_spans() as recorder:
+                start = time.perf_counter()
+                res = write_universe_scan(
+                    file_name=os.path.join(temp_dir, "universe_scan.csv"),
+                    store_dir=store_dir,
+                    bars_count=bars_count,
+                    reclaim_bars=reclaim_bars,
+                )
+                total_time = time.perf_counter() - start
+            print(
+                f"scan {counter + 1}: {total_time:.2f} s, {tickers_count / total_time:.0f} tickers/s"
+            )
+            print(recorder.get_summary().to_string())  # type: ignore
+        print(res.head(10).to_string())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tickers", type=int, default=3000)
+    parser.add_argument("--bars", type=int, default=1260)
+    parser.add_argument("--reclaim-bars", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=2)
+    args = parser.parse_args()
+    run(
+        tickers_count=args.tickers,
+        bars_count=args.bars,
+        reclaim_bars=args.reclaim_bars,
+        repeat=args.repeat,
+    )
@@ -0,0 +1,277 @@
+"""
+Time the hot paths on seeded synthetic bars and save the results to JSON.
+Pass the JSON of a previous run as --baseline to check for regressions,
+the exit code is 1 if any case is slower than the threshold allows.
+Everything runs offline, the images are not saved, kaleido is not needed.
+Run from the repository root:
+python -m benchmarks.suite --output after.json --baseline before.json
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import plotly
+
+from constants import VWAP_BAND_MULTIPLIERS
+from benchmarks.synthetic import make_anchor_dates, make_history, make_ohlcv
+from misc import add_atr_col_to_df, align_bars, compute_ratio_matrix, fill_is_min_max
+from volume_profiles import VolumeProfileStore, compute_session_profiles
+from vwaps_plot_build_save import compute_vwaps, prepare_chart_bars, render_vwaps_chart
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+# NOTE --large adds 10M bars. It takes minutes and about 3 GB of memory,
+# so it is not run by default.
+LARGE_SIZES = DEFAULT_SIZES + [10_000_000]
+DEFAULT_ANCHORS = [1, 10, 100]
+
+# NOTE Bars x anchors of the VWAP array, larger cases are skipped.
+# 10M bars with 100 anchors would need 8 GB.
+MAX_VWAP_CELLS = 200_000_000
+
+# NOTE plotly serializes every point, the full charts are rendered only up to this size.
+# The decimated charts are rendered for all sizes.
+MAX_RENDER_BARS = 100_000
+RENDER_MAX_POINTS = 2_000
+
+# NOTE The ratio matrix holds 190 pairs of 20 tickers, it is built only up to this size
+MAX_RATIO_BARS = 100_000
+RATIO_TICKERS_COUNT = 20
+
+# NOTE The profile store keeps a row of tick-size bins per session
+# over the whole price range. The prices of 10M synthetic 1-minute bars
+# drift over millions of ticks, so the store is filled only up to this size.
+MAX_PROFILE_STORE_BARS = 1_000_000
+
+# NOTE Cases faster than this are too noisy to compare
+MIN_COMPARED_SECONDS = 0.005
+
+
+class _DiscardImageExporter:
+    """
+    Takes the place of BatchImageExporter, drops the figures.
+    """
+
+    def add(self, fig: Any, file_name: str) -> None:
+        pass
+
+
+def _time_best(func: Callable, repeat: int) -> float:
+    """
+    Best of repeat runs, the least disturbed by other processes.
+    """
+    res = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        res = min(res, time.perf_counter() - start)
+    return res
+
+
+def _iter_cases(
+    bars_count: int, anchors_counts: List[int], max_render_bars: int
+) -> Iterator[Tuple[str, Optional[int], str, Callable]]:
+    """
+    Yield case name, anchors count, interval of the bars and the function to time.
+    """
+    history = make_history(bars_count=bars_count)
+    interval = history.attrs["interval"]
+    yield "add_atr_col_to_df", None, interval, lambda: add_atr_col_to_df(df=history)
+    yield "fill_is_min_max", None, interval, lambda: fill_is_min_max(df=history)
+    yield "prepare_chart_bars", None, interval, lambda: prepare_chart_bars(
+        input_df=history, add_last_min_max=True
+    )
+
+    chart_bars = prepare_chart_bars(input_df=history, add_last_min_max=True)
+    for anchors_count in anchors_counts:
+        if bars_count * anchors_count > MAX_VWAP_CELLS:
+            continue
+        anchor_dates = make_anchor_dates(ohlc_df=history, anchors_count=anchors_count)
+
+        def compute(anchor_dates: List[str] = anchor_dates):
+            return compute_vwaps(
+                input_df=history,
+                anchor_dates=anchor_dates,
+                add_last_min_max=True,
+                chart_bars=chart_bars,
+            )
+
+        yield "compute_vwaps", anchors_count, interval, compute
+        # NOTE Every anchor gets 2 band columns per multiplier
+        bands_cells_count = (
+            bars_count * anchors_count * (1 + 2 * len(VWAP_BAND_MULTIPLIERS))
+        )
+        if bands_cells_count <= MAX_VWAP_CELLS:
+            yield "compute_vwaps_bands", anchors_count, interval, lambda: compute_vwaps(
+                input_df=history,
+                anchor_dates=anchor_dates,
+                add_last_min_max=True,
+                chart_bars=chart_bars,
+                band_multipliers=VWAP_BAND_MULTIPLIERS,
+            )
+        chart_data = compute()
+        if bars_count <= max_render_bars:
+            yield "render_vwaps_chart", anchors_count, interval, lambda: render_vwaps_chart(
+                chart_data=chart_data, image_exporter=_DiscardImageExporter()  # type: ignore
+            )
+        yield "render_vwaps_chart_decimated", anchors_count, interval, lambda: render_vwaps_chart(
+            chart_data=chart_data,
+            image_exporter=_DiscardImageExporter(),  # type: ignore
+            max_points=RENDER_MAX_POINTS,
+        )
+    del history, chart_bars
+
+    if bars_count <= MAX_RATIO_BARS:
+        ohlc_dfs = {
+            f"T{seed}": make_history(bars_count=bars_count, seed=seed)
+            for seed in range(RATIO_TICKERS_COUNT)
+        }
+        yield "align_bars", None, interval, lambda: align_bars(ohlc_dfs=ohlc_dfs)
+        aligned_bars = align_bars(ohlc_dfs=ohlc_dfs)
+        yield "compute_ratio_matrix", None, interval, lambda: compute_ratio_matrix(
+            aligned_bars=aligned_bars
+        )
+        del ohlc_dfs, aligned_bars
+
+    bars_1m = make_ohlcv(bars_count=bars_count, interval="1m", extended_hours=True)
+    yield "compute_session_profiles", None, "1m", lambda: compute_session_profiles(
+        df=bars_1m
+    )
+    if bars_count <= MAX_PROFILE_STORE_BARS:
+        store = VolumeProfileStore()
+        yield "profile_store_add_bars", None, "1m", lambda: store.add_bars(df=bars_1m)
+        store.add_bars(df=bars_1m)
+        yield "profile_composite_value_area", None, "1m", lambda: store.composite().get_value_area()
+
+
+def _get_environment() -> Dict[str, Any]:
+    try:
+        import numba  # pylint: disable=C0415
+
+        numba_version = numba.__version__
+    except ImportError:
+        numba_version = None
+    return {
+        "created_at": pd.Timestamp.now(tz="UTC").isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "plotly": plotly.__version__,
+        "numba": numba_version,
+    }
+
+
+def run(
+    sizes: List[int],
+    anchors_counts: List[int],
+    repeat: int,
+    max_render_bars: int = MAX_RENDER_BARS,
+) -> List[Dict[str, Any]]:
+    res = list()
+    print(f"{'case':>30} {'bars':>10} {'anchors':>8} {'interval':>8} {'seconds':>10}")
+    for bars_count in sizes:
+        for case, anchors_count, interval, func in _iter_cases(
+            bars_count=bars_count,
+            anchors_counts=anchors_counts,
+            max_render_bars=max_render_bars,
+        ):
+            # NOTE The first run warms up numba and caches, it is not counted
+            func()
+            seconds = _time_best(func=func, repeat=repeat)
+            print(
+                f"{case:>30} {bars_count:>10} {str(anchors_count):>8} {interval:>8} {seconds:>10.4f}"
+            )
+            res.append(
+                {
+                    "case": case,
+                    "bars": bars_count,
+                    "anchors": anchors_count,
+                    "interval": interval,
+                    "seconds": seconds,
+                }
+            )
+    return res
+
+
+def _get_result_key(result: Dict[str, Any]) -> Tuple:
+    return result["case"], result["bars"], result["anchors"], result["interval"]
+
+
+def find_regressions(
+    results: List[Dict[str, Any]],
+    baseline_results: List[Dict[str, Any]],
+    threshold: float,
+) -> List[Dict[str, Any]]:
+    """
+    Return the results that are more than threshold times slower than the baseline.
+    Only the cases present in both runs are compared.
+    """
+    baseline = {_get_result_key(result): result for result in baseline_results}
+    res = list()
+    for result in results:
+        baseline_result = baseline.get(_get_result_key(result))
+        if baseline_result is None:
+            continue
+        if max(result["seconds"], baseline_result["seconds"]) < MIN_COMPARED_SECONDS:
+            continue
+        ratio = result["seconds"] / baseline_result["seconds"]
+        if ratio > threshold:
+            res.append(
+                dict(result, baseline_seconds=baseline_result["seconds"], ratio=ratio)
+            )
+    return res
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=None)
+    parser.add_argument(
+        "--large", action="store_true", help="add 10M bars to the default sizes"
+    )
+    parser.add_argument("--anchors", type=int, nargs="+", default=DEFAULT_ANCHORS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-render-bars", type=int, default=MAX_RENDER_BARS)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--threshold", type=float, default=1.25)
+    args = parser.parse_args()
+
+    results = run(
+        sizes=(
+            args.sizes
+            if args.sizes is not None
+            else (LARGE_SIZES if args.large else DEFAULT_SIZES)
+        ),
+        anchors_counts=args.anchors,
+        repeat=args.repeat,
+        max_render_bars=args.max_render_bars,
+    )
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(
+            {"environment": _get_environment(), "results": results}, file, indent=2
+        )
+    print(f"Saved to {args.output}")
+
+    if args.baseline is not None:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline_results = json.load(file)["results"]
+        regressions = find_regressions(
+            results=results,
+            baseline_results=baseline_results,
+            threshold=args.threshold,
+        )
+        for regression in regressions:
+            print(
+                f"REGRESSION {regression['case']}, bars={regression['bars']}, "
+                f"anchors={regression['anchors']}: {regression['baseline_seconds']:.4f} s "
+                f"-> {regression['seconds']:.4f} s, x{regression['ratio']:.2f}"
+            )
+        if len(regressions) > 0:
+            sys.exit(1)
+        print(f"No regressions over x{args.threshold} of {args.baseline}")
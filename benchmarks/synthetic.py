@@ -0,0 +1,136 @@
+"""
+Seeded synthetic OHLCV bars for the benchmarks, no network is needed.
+The same seed always gives the same bars.
+"""
+
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+TIMEZONE = "America/New_York"
+
+# NOTE 50k weekdays from 1990 end in the 22nd century
+MAX_DAILY_BARS = 50_000
+
+# NOTE Minutes from midnight, New York time
+REGULAR_SESSION = (9 * 60 + 30, 16 * 60)
+EXTENDED_SESSION = (4 * 60, 20 * 60)
+
+
+def _get_daily_index(
+    bars_count: int, rng: np.random.Generator, gap_share: float, start: str
+) -> pd.DatetimeIndex:
+    # NOTE Weekdays only, some of them are dropped like holidays
+    days_count = int(bars_count / (1 - gap_share)) + 10
+    days = pd.bdate_range(start=start, periods=days_count)
+    days = days[rng.random(days_count) >= gap_share]
+    return days[:bars_count].tz_localize(TIMEZONE)
+
+
+def _get_intraday_index(
+    bars_count: int,
+    rng: np.random.Generator,
+    gap_share: float,
+    start: str,
+    extended_hours: bool,
+) -> pd.DatetimeIndex:
+    session_start, session_end = EXTENDED_SESSION if extended_hours else REGULAR_SESSION
+    session_minutes = np.arange(session_start, session_end, dtype=np.int64)
+    sessions_count = int(bars_count / (1 - gap_share) / len(session_minutes)) + 2
+    days = pd.bdate_range(start=start, periods=sessions_count)
+    # NOTE Local times are built first, then localized,
+    # so that the sessions keep their hours across daylight saving changes
+    local_ns = (
+        days.as_unit("ns").asi8[:, None] + session_minutes[None, :] * 60 * 10**9
+    ).ravel()
+    # Minutes without trades are missing
+    local_ns = local_ns[rng.random(local_ns.shape[0]) >= gap_share][:bars_count]
+    return pd.DatetimeIndex(local_ns.astype("datetime64[ns]")).tz_localize(TIMEZONE)
+
+
+def make_ohlcv(
+    bars_count: int,
+    interval: str = "1d",
+    seed: int = 0,
+    extended_hours: bool = False,
+    gap_share: float = 0.01,
+    start: str = "1990-01-02",
+    ticker: str = "SYNTH",
+) -> pd.DataFrame:
+    """
+    Make bars like get_ohlc_from_yf returns: Open, High, Low, Close, Volume columns,
+    tz-aware index and ticker and interval in attrs.
+    interval is 1d or 1m. Daily bars skip weekends, 1-minute bars cover
+    the regular or the extended trading hours of weekdays.
+    gap_share of days or minutes are missing, and the price may jump between bars.
+    """
+    if interval not in ("1d", "1m"):
+        raise ValueError(f"make_ohlcv: {interval=}, must be 1d or 1m")
+    rng = np.random.default_rng(seed)
+    if interval == "1d":
+        index = _get_daily_index(
+            bars_count=bars_count, rng=rng, gap_share=gap_share, start=start
+        )
+        volatility = 0.015
+    else:
+        index = _get_intraday_index(
+            bars_count=bars_count,
+            rng=rng,
+            gap_share=gap_share,
+            start=start,
+            extended_hours=extended_hours,
+        )
+        volatility = 0.001
+    bars_count = len(index)
+
+    returns = rng.normal(0, volatility, bars_count)
+    # NOTE Rare large moves, like the price gaps after news
+    is_jump = rng.random(bars_count) < gap_share
+    returns[is_jump] += rng.normal(0, volatility * 10, int(is_jump.sum()))
+    close = 100 * np.exp(np.cumsum(returns))
+    open_ = np.empty(bars_count)
+    open_[0] = close[0]
+    open_[1:] = close[:-1] * np.exp(rng.normal(0, volatility / 4, bars_count - 1))
+    spread = close * rng.uniform(0.2, 1.0, bars_count) * volatility
+    volume = rng.lognormal(np.log(1_000_000 if interval == "1d" else 10_000), 0.5)
+    volume = rng.lognormal(np.log(volume), 0.5, bars_count)
+    if interval != "1d":
+        minutes = index.hour * 60 + index.minute
+        is_regular = (minutes >= REGULAR_SESSION[0]) & (minutes < REGULAR_SESSION[1])
+        # Trading outside the regular hours is thin
+        volume[~np.asarray(is_regular)] *= 0.05
+    res = pd.DataFrame(
+        {
+            "Open": np.round(open_, 2),
+            "High": np.round(np.maximum(open_, close) + spread, 2),
+            "Low": np.round(np.minimum(open_, close) - spread, 2),
+            "Close": np.round(close, 2),
+            "Volume": np.round(volume),
+        },
+        index=index,
+    )
+    res.attrs = {"ticker": ticker, "interval": interval}
+    return res
+
+
+def make_history(bars_count: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Daily bars, or 1-minute bars if there are too many of them for daily ones:
+    the timestamps of pandas end in 2262.
+    """
+    interval = "1d" if bars_count <= MAX_DAILY_BARS else "1m"
+    return make_ohlcv(bars_count=bars_count, interval=interval, seed=seed)
+
+
+def make_anchor_dates(ohlc_df: pd.DataFrame, anchors_count: int) -> List[str]:
+    """
+    Anchor dates spread evenly over the bars, in the format that
+    vwaps_plot_build_save accepts for the bars of ohlc_df.
+    """
+    positions = np.linspace(0, ohlc_df.shape[0] - 1, anchors_count + 2)[1:-1]
+    # NOTE vwaps_plot_build_save converts the index to UTC without timezone
+    index = ohlc_df.index
+    if index.tz is not None:  # type: ignore
+        index = index.tz_convert(None)  # type: ignore
+    return [str(index[int(position)]) for position in positions]
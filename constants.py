@@ -1,4 +1,27 @@
 first_day_of_year = "2024-01-01 00:00:00"
 DEFAULT_RESULTS_FILE = "ANCHORED_VWAP.png"
+RENDER_MANIFEST_FILE = "render_manifest.json"
 ATR_SMOOTHING_N = 14
 ATR_MULTIPLIER = 2.5
+# NOTE Standard deviations of the VWAP bands, e.g. for band_multipliers
+VWAP_BAND_MULTIPLIERS = [1.0, 2.0]
+OHLC_CACHE_DIR = "ohlc_cache"
+OHLC_CACHE_TTL_SECONDS = 15 * 60
+BAR_STORE_DIR = "bar_store"
+# NOTE About 5 years of daily bars per ticker for the universe scan
+UNIVERSE_BARS_COUNT = 1260
+RECLAIM_LOOKBACK_BARS = 5
+RESAMPLED_STORE_DIR = "resampled_store"
+# NOTE Minutes from midnight, exchange time
+SESSION_OPEN_MINUTE = 9 * 60 + 30
+SESSION_CLOSE_MINUTE = 16 * 60
+FETCH_WORKERS = 4
+FETCH_REQUESTS_PER_SECOND = 2.0
+FETCH_RETRIES = 3
+AV_BASE_URL = "https://www.alphavantage.co/query"
+AV_API_KEY_ENV = "ALPHA_VANTAGE_API_KEY"
+AV_TIMEOUT_SECONDS = 30
+# NOTE Seconds to wait for the primary provider before asking the secondary one
+HEDGE_LATENCY_SECONDS = 5.0
+VOLUME_PROFILE_STORE_DIR = "volume_profile_store"
+VOLUME_PROFILE_TICK_SIZE = 0.05
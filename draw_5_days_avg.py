@@ -1,26 +1,35 @@
+from typing import Callable
+
 import mplfinance as mpf
 import pandas as pd
 
 from import_ohlc import get_ohlc_from_yf
+from misc import rolling_mean
 
 
-def draw_5_days_avg(ticker: str, interval: str = "15m"):
+def draw_5_days_avg(
+    ticker: str, interval: str = "15m", get_ohlc_func: Callable = get_ohlc_from_yf
+):
     """
     Create and save plot 5_d_avg_{ticker}.png
     containing OHLC candles and 5 days simple moving average (SMA).
     Usage: avoid buying the dip until the price consolidates above 5 days SMA.
     For details, see Appendix B
     of the book "Maximum Trading Gains With Anchored VWAP".
+    Pass get_ohlc_resampled as get_ohlc_func to build the bars
+    from the 1-minute bars that other charts already use.
     """
     if interval not in ["15m", "30m"]:
         raise ValueError(f"draw_5_days_avg: {interval=}, must be 15m or 30m")
-    df = get_ohlc_from_yf(ticker=ticker, period="1mo", interval=interval)
+    df = get_ohlc_func(ticker=ticker, period="1mo", interval=interval)
     df.index = df.index.tz_convert(None)
     if interval == "15m":
         ma_candles_count = 130
     else:
         ma_candles_count = 65
-    ma_values = df["Close"].rolling(ma_candles_count).mean().values
+    ma_values = rolling_mean(
+        values=df["Close"].to_numpy(dtype="float64"), window=ma_candles_count
+    )
     ma_df = pd.DataFrame(dict(ma_vals=ma_values), index=df.index)
     ap = mpf.make_addplot(ma_df, type="line")
     mpf.plot(
@@ -1,11 +1,25 @@
-from typing import Callable
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import pandas as pd
 
-from constants import first_day_of_year
-from import_ohlc import get_ohlc_from_yf
-from misc import get_chart_annotation_1d
-from vwaps_plot_build_save import vwaps_plot_build_save
+from constants import FETCH_WORKERS, first_day_of_year
+from import_ohlc import StoredBarsRef, get_ohlc_from_yf, iter_fetch_many
+from misc import (
+    get_chart_annotation_1d,
+    get_span_recorder,
+    profiling,
+    record_spans,
+    span,
+    span_labels,
+)
+from render_cache import RenderCache
+from vwaps_plot_build_save import (
+    CHART_BACKENDS,
+    prepare_chart_bars,
+    vwaps_plot_build_save,
+)
 
 # NOTE In case of problems with Yahoo Finance,
 # pass another function as the get_ohlc_func parameter
@@ -13,10 +27,151 @@ from vwaps_plot_build_save import vwaps_plot_build_save
 # For example, from Alpha Vantage.
 
 
+def read_watchlist(
+    file_name: str = "tickers_follow_daily.xlsx",
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Read the Notes and Anchor_Dates worksheets, see README.md.
+    """
+    xls = pd.ExcelFile(file_name)
+    tickers_notes = pd.read_excel(xls, "Notes")
+    tickers_anchor_dates = pd.read_excel(xls, "Anchor_Dates")
+    return tickers_notes, tickers_anchor_dates
+
+
+def get_custom_anchor_dates(ticker: str, tickers_anchor_dates: pd.DataFrame) -> List:
+    """
+    Get custom anchor dates of the ticker if they are available.
+    Empty cells below shorter columns are skipped.
+    """
+    if ticker not in tickers_anchor_dates.columns:
+        return list()
+    return tickers_anchor_dates[ticker].dropna().values.tolist()
+
+
+def print_progress(
+    done_count: int, total_count: int, ticker: str, error: Optional[Exception]
+) -> None:
+    """
+    Default progress_func of draw_all_daily_charts.
+    """
+    status = "ok" if error is None else f"FAILED, {error=}"
+    print(f"draw_all_daily_charts: {done_count} of {total_count}, {ticker=} {status}")
+
+
+def _draw_ticker_charts(
+    ticker: str,
+    ohlc_df: Union[pd.DataFrame, StoredBarsRef],
+    custom_anchor_dates: List,
+    chart_annotation_func: Callable,
+    min_max_checkpoint_file: Optional[str],
+    record_timings: bool = False,
+    profile_file: Optional[str] = None,
+    ohlc_attrs: Optional[Dict[str, Any]] = None,
+    render_manifest_file: Optional[str] = None,
+    backend: str = "plotly",
+    band_multipliers: Optional[List[float]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Build and save two daily charts of one ticker.
+    It is a module-level function, so that it can run in a worker process.
+    If ohlc_df is a reference to the bars in a BarStore, they are mapped
+    from the store files with ohlc_attrs, see get_ohlc_from_bar_store.
+    If record_timings is True, the spans of the ticker are recorded and returned.
+    It is needed in worker processes, their spans don't reach the recorder
+    of the main process. In the main process, the spans go to its recorder anyway.
+    If profile_file is passed, the ticker is profiled, see profiling in misc/spans.py.
+    If render_manifest_file is passed, unchanged charts are not rendered again,
+    see RenderCache. backend and band_multipliers are passed
+    to vwaps_plot_build_save.
+    """
+    with record_spans(enabled=record_timings) as recorder, span_labels(
+        ticker=ticker
+    ), profiling(file_name=profile_file), span("ticker_charts"):
+        if isinstance(ohlc_df, StoredBarsRef):
+            ohlc_df = ohlc_df.load(attrs=ohlc_attrs)
+        _build_ticker_charts(
+            ticker=ticker,
+            ohlc_df=ohlc_df,
+            custom_anchor_dates=custom_anchor_dates,
+            chart_annotation_func=chart_annotation_func,
+            min_max_checkpoint_file=min_max_checkpoint_file,
+            render_cache=(
+                None
+                if render_manifest_file is None
+                else RenderCache(manifest_file=render_manifest_file)
+            ),
+            backend=backend,
+            band_multipliers=band_multipliers,
+        )
+    if recorder is None:
+        return list()
+    return recorder.records
+
+
+def _build_ticker_charts(
+    ticker: str,
+    ohlc_df: pd.DataFrame,
+    custom_anchor_dates: List,
+    chart_annotation_func: Callable,
+    min_max_checkpoint_file: Optional[str],
+    render_cache: Optional[RenderCache] = None,
+    backend: str = "plotly",
+    band_multipliers: Optional[List[float]] = None,
+) -> None:
+    interval = "1d"
+    all_anchor_dates = custom_anchor_dates + [first_day_of_year]
+    chart_title = {"ticker": ticker, "interval": interval}
+    chart_title_str = str(chart_title)
+
+    # NOTE ATR and the last min and max are computed once for both charts
+    chart_bars = prepare_chart_bars(
+        input_df=ohlc_df,
+        add_last_min_max=True,
+        min_max_checkpoint_file=min_max_checkpoint_file,
+    )
+    vwaps_plot_build_save(
+        input_df=ohlc_df,
+        anchor_dates=all_anchor_dates,
+        chart_annotation_func=chart_annotation_func,
+        chart_title=chart_title_str,
+        add_last_min_max=True,
+        file_name=f"daily_{ticker}_1.png",
+        print_df=False,
+        chart_bars=chart_bars,
+        render_cache=render_cache,
+        backend=backend,
+        band_multipliers=band_multipliers,
+    )
+    vwaps_plot_build_save(
+        input_df=ohlc_df,
+        anchor_dates=custom_anchor_dates,
+        chart_annotation_func=chart_annotation_func,
+        chart_title=chart_title_str,
+        add_last_min_max=True,
+        file_name=f"daily_{ticker}_2.png",
+        print_df=False,
+        chart_bars=chart_bars,
+        render_cache=render_cache,
+        backend=backend,
+        band_multipliers=band_multipliers,
+    )
+
+
 def draw_all_daily_charts(
     get_ohlc_func: Callable = get_ohlc_from_yf,
     chart_annotation_func: Callable = get_chart_annotation_1d,
-):
+    min_max_checkpoint_dir: Optional[str] = None,
+    fetch_workers: int = FETCH_WORKERS,
+    workers: int = 1,
+    progress_func: Callable = print_progress,
+    report_file: Optional[str] = None,
+    profile_ticker: Optional[str] = None,
+    profile_file: Optional[str] = None,
+    render_manifest_file: Optional[str] = None,
+    backend: str = "plotly",
+    band_multipliers: Optional[List[float]] = None,
+) -> Dict[str, Optional[Exception]]:
     """
     For every ticker in tickers_notes draw and save
     two daily OHLC + VWAPs charts.
@@ -29,53 +184,183 @@ def draw_all_daily_charts(
     Please note that anchor dates for the last recent low and high
     are added automatically, i.e. you don't have to add and update them manually.
 
+    If min_max_checkpoint_dir is passed, the state of the last low and high search
+    is saved there for every ticker. The next run continues from it
+    and processes only the bars that arrived since then.
+
+    The data of up to fetch_workers tickers is downloaded concurrently.
+    If workers > 1, the charts are built and saved in a pool of worker processes.
+    On Windows, call this function under if __name__ == "__main__".
+    A ticker that fails doesn't stop the others. After every ticker,
+    progress_func(done_count, total_count, ticker, error) is called.
+
+    Return a dict with the tickers in the order of the Notes worksheet,
+    the values are None for successful tickers and errors for failed ones.
+
+    If report_file is passed, the time of every stage of every ticker
+    (fetch, indicators, anchor resolution, VWAP compute, figure build, image write)
+    is saved there as JSON lines, and a summary table is printed at the end.
+    If profile_ticker is passed, the charts of that ticker are profiled
+    and saved to profile_file, by default profile_{ticker}.prof.
+    Use the .html extension for a pyinstrument report.
+
+    If render_manifest_file is passed, e.g. RENDER_MANIFEST_FILE, a chart
+    is not built and saved again if its visible bars, anchors, note, annotation
+    and style are the same as when it was saved last time,
+    e.g. on weekends or when a run is repeated after a failed ticker.
+    See RenderCache in render_cache.py.
+
+    Pass backend="agg" to save the charts with Matplotlib instead of Plotly
+    and kaleido, it is much faster for long watchlists, see CHART_BACKENDS.
+    Pass band_multipliers, e.g. VWAP_BAND_MULTIPLIERS from constants.py,
+    to add the standard deviation bands around every anchored VWAP.
+
     See detailed explanations in the README.md.
     """
 
-    xls = pd.ExcelFile("tickers_follow_daily.xlsx")
-    tickers_notes = pd.read_excel(xls, "Notes")
-    tickers_anchor_dates = pd.read_excel(xls, "Anchor_Dates")
-    total_count = tickers_notes.shape[0]
-    interval = "1d"
-    counter = 0
-    for ticker in tickers_notes["Ticker"].values:
-        counter = counter + 1
-        print(
-            f"draw_all_daily_charts: running {ticker=} - {counter} of {total_count}..."
-        )
-        ohlc_df = get_ohlc_func(ticker=ticker, period="max", interval=interval)
-
-        # adding your custom anchor dates for the ticker if they are available
-        custom_anchor_dates = list()
-        if ticker in tickers_anchor_dates.columns:
-            custom_anchor_dates = tickers_anchor_dates[ticker].values.tolist()
-        all_anchor_dates = custom_anchor_dates + [first_day_of_year]
-
-        # adding the ticker note so that it will appear in the chart annotation
-        ticker_note = tickers_notes.loc[
-            tickers_notes["Ticker"] == ticker, "Note"
-        ].values[0]
-        if ticker_note != "":
-            ohlc_df.attrs["note"] = ticker_note
-
-        chart_title = {"ticker": ticker, "interval": interval}
-        chart_title_str = str(chart_title)
-
-        vwaps_plot_build_save(
-            input_df=ohlc_df,
-            anchor_dates=all_anchor_dates,
-            chart_annotation_func=chart_annotation_func,
-            chart_title=chart_title_str,
-            add_last_min_max=True,
-            file_name=f"daily_{ticker}_1.png",
-            print_df=False,
+    if backend not in CHART_BACKENDS:
+        raise ValueError(
+            f"draw_all_daily_charts: {backend=}, must be one of {CHART_BACKENDS}"
         )
-        vwaps_plot_build_save(
-            input_df=ohlc_df,
-            anchor_dates=custom_anchor_dates,
+    with record_spans(enabled=report_file is not None) as recorder:
+        results = _draw_all_daily_charts(
+            get_ohlc_func=get_ohlc_func,
             chart_annotation_func=chart_annotation_func,
-            chart_title=chart_title_str,
-            add_last_min_max=True,
-            file_name=f"daily_{ticker}_2.png",
-            print_df=False,
+            min_max_checkpoint_dir=min_max_checkpoint_dir,
+            fetch_workers=fetch_workers,
+            workers=workers,
+            progress_func=progress_func,
+            profile_ticker=profile_ticker,
+            profile_file=profile_file,
+            render_manifest_file=render_manifest_file,
+            backend=backend,
+            band_multipliers=band_multipliers,
         )
+    if recorder is not None:
+        recorder.write_jsonl(file_name=report_file)  # type: ignore
+        print(recorder.get_summary().to_string(float_format="{:.3f}".format))
+        print(f"draw_all_daily_charts: stage timings saved to {report_file}")
+    return results
+
+
+def _draw_all_daily_charts(
+    get_ohlc_func: Callable,
+    chart_annotation_func: Callable,
+    min_max_checkpoint_dir: Optional[str],
+    fetch_workers: int,
+    workers: int,
+    progress_func: Callable,
+    profile_ticker: Optional[str],
+    profile_file: Optional[str],
+    render_manifest_file: Optional[str],
+    backend: str,
+    band_multipliers: Optional[List[float]],
+) -> Dict[str, Optional[Exception]]:
+    with span("read_watchlist"):
+        tickers_notes, tickers_anchor_dates = read_watchlist()
+    tickers = tickers_notes["Ticker"].values.tolist()
+    total_count = len(tickers)
+    interval = "1d"
+    if min_max_checkpoint_dir is not None:
+        os.makedirs(min_max_checkpoint_dir, exist_ok=True)
+
+    results: Dict[str, Optional[Exception]] = dict()
+
+    def _on_ticker_done(ticker: str, error: Optional[Exception]) -> None:
+        results[ticker] = error
+        progress_func(len(results), total_count, ticker, error)
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    recorder = get_span_recorder()
+
+    def _collect(future: Future, ticker: str) -> None:
+        error = future.exception()
+        if error is None and recorder is not None:
+            recorder.extend(future.result())
+        _on_ticker_done(ticker=ticker, error=error)  # type: ignore
+
+    in_flight: Dict[Future, str] = dict()
+    try:
+        # NOTE The next tickers are fetched in background threads
+        # while the charts of the current ticker are built.
+        for ticker, ohlc_df, error in iter_fetch_many(
+            tickers=tickers,
+            interval=interval,
+            period="max",
+            get_ohlc_func=get_ohlc_func,
+            max_workers=fetch_workers,
+        ):
+            if error is not None:
+                _on_ticker_done(ticker=ticker, error=error)
+                continue
+
+            # adding your custom anchor dates for the ticker if they are available
+            custom_anchor_dates = get_custom_anchor_dates(
+                ticker=ticker, tickers_anchor_dates=tickers_anchor_dates
+            )
+
+            # adding the ticker note so that it will appear in the chart annotation
+            ticker_note = tickers_notes.loc[
+                tickers_notes["Ticker"] == ticker, "Note"
+            ].values[0]
+            if ticker_note != "":
+                ohlc_df.attrs["note"] = ticker_note  # type: ignore
+
+            min_max_checkpoint_file = None
+            if min_max_checkpoint_dir is not None:
+                min_max_checkpoint_file = os.path.join(
+                    min_max_checkpoint_dir, f"min_max_{ticker}_{interval}.json"
+                )
+
+            job_kwargs = dict(
+                ticker=ticker,
+                ohlc_df=ohlc_df,
+                custom_anchor_dates=custom_anchor_dates,
+                chart_annotation_func=chart_annotation_func,
+                min_max_checkpoint_file=min_max_checkpoint_file,
+                record_timings=executor is not None and recorder is not None,
+                render_manifest_file=render_manifest_file,
+                backend=backend,
+                band_multipliers=band_multipliers,
+            )
+            if ticker == profile_ticker:
+                job_kwargs["profile_file"] = (
+                    profile_file
+                    if profile_file is not None
+                    else f"profile_{ticker}.prof"
+                )
+            # NOTE The workers map the bars from the store files
+            # instead of receiving a pickled copy of the DataFrame
+            stored_bars_ref = ohlc_df.attrs.get("stored_bars")  # type: ignore
+            if (
+                executor is not None
+                and isinstance(stored_bars_ref, StoredBarsRef)
+                and stored_bars_ref.stop - stored_bars_ref.start == ohlc_df.shape[0]  # type: ignore
+            ):
+                job_kwargs["ohlc_df"] = stored_bars_ref
+                job_kwargs["ohlc_attrs"] = dict(ohlc_df.attrs)  # type: ignore
+            if executor is None:
+                try:
+                    _draw_ticker_charts(**job_kwargs)  # type: ignore
+                    _on_ticker_done(ticker=ticker, error=None)
+                except Exception as chart_error:  # pylint: disable=W0718
+                    _on_ticker_done(ticker=ticker, error=chart_error)
+                continue
+
+            # NOTE Don't queue more jobs than the workers can take soon,
+            # otherwise all fetched DataFrames pile up in memory.
+            if len(in_flight) >= 2 * workers:
+                done_futures, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done_futures:
+                    _collect(future=future, ticker=in_flight.pop(future))
+            in_flight[executor.submit(_draw_ticker_charts, **job_kwargs)] = ticker
+
+        while len(in_flight) > 0:
+            done_futures, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done_futures:
+                _collect(future=future, ticker=in_flight.pop(future))
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    return {ticker: results.get(ticker) for ticker in tickers}
@@ -7,7 +7,8 @@ from vwaps_plot_build_save import vwaps_plot_build_save
 # NOTE In case of problems with Yahoo Finance,
 # pass another function as the get_ohlc_func parameter
 # to retrieve data from another provider.
-# For example, from Alpha Vantage.
+# For example, get_ohlc_from_av for Alpha Vantage,
+# or get_ohlc_hedged to fall back to it automatically.
 
 
 def draw_daily_chart_ticker(
@@ -1,9 +1,22 @@
-from typing import Callable, Optional
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 
-from import_ohlc import get_ohlc_from_yf
+from import_ohlc import get_ohlc_from_yf, iter_fetch_many
+from misc import (
+    RATIO_WEIGHTS,
+    RatioMatrix,
+    align_bars,
+    compute_ratio_matrix,
+    get_anchor_positions,
+    span,
+)
 
 
 def draw_ratio(
@@ -33,3 +46,175 @@ def draw_ratio(
     df["CloseCloseRatio"].plot(title=plot_title)
     plt.savefig(f"ratio_{ticker_1}_{ticker_2}.png")
     print(df)
+
+
+def _to_naive_index(index: pd.DatetimeIndex) -> pd.DatetimeIndex:
+    # Otherwise, TypeError: Invalid comparison between
+    # dtype=datetime64[ns, America/New_York] and Timestamp
+    if index.tz is not None:
+        return index.tz_convert(None)  # type: ignore
+    return index
+
+
+def _save_pair_charts(
+    dates: pd.DatetimeIndex,
+    pairs: List[Tuple[str, str]],
+    ratios: np.ndarray,
+    anchored_vwaps: Optional[np.ndarray],
+    charts_dir: str,
+    title_suffix: str,
+    dpi: int,
+) -> List[str]:
+    """
+    Save the charts of the pairs, the columns of ratios and anchored_vwaps.
+    It is a module-level function, so that it can run in a worker process.
+
+    All charts are drawn on one figure. Only the data of its lines
+    is replaced for every pair, so the figure, axes and dates
+    are built once for the whole batch.
+    """
+    anchors_count = 0 if anchored_vwaps is None else anchored_vwaps.shape[2]
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    (ratio_line,) = ax.plot(dates, ratios[:, 0], linewidth=1)
+    vwap_lines = [
+        ax.plot(dates, anchored_vwaps[:, 0, counter], linewidth=1)[0]  # type: ignore
+        for counter in range(anchors_count)
+    ]
+    res = list()
+    for position, (ticker_1, ticker_2) in enumerate(pairs):
+        ratio_line.set_ydata(ratios[:, position])
+        for counter, vwap_line in enumerate(vwap_lines):
+            vwap_line.set_ydata(anchored_vwaps[:, position, counter])  # type: ignore
+        ax.relim()
+        ax.autoscale_view()
+        ax.set_title(f"{ticker_1}-{ticker_2} Close-Close Ratio{title_suffix}")
+        file_name = os.path.join(charts_dir, f"ratio_{ticker_1}_{ticker_2}.png")
+        with span("image_write", pair=f"{ticker_1}/{ticker_2}"):
+            # NOTE The fastest zlib level, the charts are mostly background
+            fig.savefig(file_name, dpi=dpi, pil_kwargs={"compress_level": 1})
+        res.append(file_name)
+    return res
+
+
+def save_ratio_charts(
+    ratio_matrix: RatioMatrix,
+    anchored_vwaps: Optional[np.ndarray] = None,
+    charts_dir: str = "ratio_charts",
+    title_suffix: str = "",
+    dpi: int = 100,
+    workers: int = 1,
+) -> List[str]:
+    """
+    Save a chart of every pair to charts_dir/ratio_{ticker_1}_{ticker_2}.png,
+    with the anchored VWAPs of the pair if they are passed,
+    see RatioMatrix.get_anchored_vwaps. Return the file names.
+    If workers > 1, the pairs are split between that many worker processes.
+    On Windows, call this function under if __name__ == "__main__".
+    """
+    os.makedirs(charts_dir, exist_ok=True)
+    dates = _to_naive_index(ratio_matrix.index)
+    chunks = [
+        chunk
+        for chunk in np.array_split(np.arange(len(ratio_matrix.pairs)), workers)
+        if chunk.shape[0] > 0
+    ]
+    jobs_kwargs = [
+        dict(
+            dates=dates,
+            pairs=[ratio_matrix.pairs[position] for position in chunk],
+            ratios=ratio_matrix.ratios[:, chunk],
+            anchored_vwaps=(
+                None if anchored_vwaps is None else anchored_vwaps[:, chunk]
+            ),
+            charts_dir=charts_dir,
+            title_suffix=title_suffix,
+            dpi=dpi,
+        )
+        for chunk in chunks
+    ]
+    if len(jobs_kwargs) <= 1:
+        return [
+            file_name
+            for job_kwargs in jobs_kwargs
+            for file_name in _save_pair_charts(**job_kwargs)  # type: ignore
+        ]
+    with ProcessPoolExecutor(max_workers=len(jobs_kwargs)) as executor:
+        futures = [
+            executor.submit(_save_pair_charts, **job_kwargs)
+            for job_kwargs in jobs_kwargs
+        ]
+        return [file_name for future in futures for file_name in future.result()]
+
+
+def draw_ratio_matrix(
+    tickers: List[str],
+    cutoff_date: Optional[str] = None,
+    anchor_dates: Optional[List[str]] = None,
+    weight: str = "geometric",
+    get_ohlc_func: Callable = get_ohlc_from_yf,
+    charts_dir: Optional[str] = "ratio_charts",
+    workers: int = 1,
+) -> RatioMatrix:
+    """
+    Draw Close-Close ratios of all pairs of tickers, e.g. a basket of ETFs.
+    20 tickers give 190 pairs.
+    1. Fetch the daily bars of all tickers concurrently.
+    2. Put them on the timestamps that all tickers have, once for all pairs.
+    3. Compute all ratios in one array operation, see compute_ratio_matrix.
+    4. If anchor_dates are passed, add the anchored VWAPs of every ratio.
+    The volume of a ratio bar is set by weight, one of RATIO_WEIGHTS.
+    5. Save a chart of every pair to charts_dir, unless it is None,
+    in workers processes, see save_ratio_charts.
+
+    Return the RatioMatrix, call its to_frame method to get all ratios.
+    A ticker that fails to download stops the function,
+    because the pairs would change silently.
+    """
+    if weight not in RATIO_WEIGHTS:
+        raise ValueError(
+            f"draw_ratio_matrix: {weight=}, must be one of {RATIO_WEIGHTS}"
+        )
+    interval = "1d"
+    ohlc_dfs: Dict[str, pd.DataFrame] = dict()
+    for ticker, df, error in iter_fetch_many(
+        tickers=tickers,
+        interval=interval,
+        period="max",
+        get_ohlc_func=get_ohlc_func,
+    ):
+        if error is not None:
+            raise error
+        ohlc_dfs[ticker] = df  # type: ignore
+
+    with span("ratio_compute", tickers=len(tickers)):
+        aligned_bars = align_bars(ohlc_dfs=ohlc_dfs)
+        del ohlc_dfs
+        title_suffix = ""
+        if cutoff_date is not None:
+            start = _to_naive_index(aligned_bars.index).searchsorted(
+                pd.to_datetime(cutoff_date), side="left"
+            )
+            aligned_bars = aligned_bars.get_slice(start=int(start))
+            title_suffix = f", Min Date {cutoff_date}"
+        ratio_matrix = compute_ratio_matrix(aligned_bars=aligned_bars, weight=weight)
+
+    anchored_vwaps = None
+    if anchor_dates is not None and len(anchor_dates) > 0:
+        with span("vwap_compute", pairs=len(ratio_matrix.pairs)):
+            anchored_vwaps = ratio_matrix.get_anchored_vwaps(
+                anchor_positions=get_anchor_positions(
+                    index=_to_naive_index(ratio_matrix.index),
+                    anchors=[pd.Timestamp(anchor) for anchor in anchor_dates],
+                )
+            )
+    if charts_dir is not None:
+        save_ratio_charts(
+            ratio_matrix=ratio_matrix,
+            anchored_vwaps=anchored_vwaps,
+            charts_dir=charts_dir,
+            title_suffix=title_suffix,
+            workers=workers,
+        )
+    return ratio_matrix
@@ -1,2 +1,20 @@
 from .yahoo_finance import get_ohlc_from_yf
-from .alpha_vantage import get_ohlc_from_av
+from .alpha_vantage import get_av_session, get_ohlc_from_av, parse_av_csv
+from .failover import get_ohlc_hedged
+from .normalize import OHLC_COLUMNS, normalize_ohlc
+from .batch import TokenBucket, fetch_many, iter_fetch_many
+from .cache import get_ohlc_cached
+from .bar_store import (
+    BarStore,
+    StoredBars,
+    StoredBarsRef,
+    fill_bar_store,
+    get_ohlc_from_bar_store,
+)
+from .resample import (
+    RESAMPLE_INTERVALS,
+    extend_resampled,
+    get_bin_starts,
+    get_ohlc_resampled,
+    resample_bars,
+)
@@ -1,11 +1,173 @@
+import io
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
 import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
 
+from constants import (
+    AV_API_KEY_ENV,
+    AV_BASE_URL,
+    AV_TIMEOUT_SECONDS,
+    FETCH_WORKERS,
+)
+
+from .cache import cut_period, get_period_duration
+from .normalize import normalize_ohlc
+
+# NOTE Interval of get_ohlc_from_yf -> function and interval of Alpha Vantage
+_AV_INTERVALS: Dict[str, Tuple[str, Optional[str]]] = {
+    "1m": ("TIME_SERIES_INTRADAY", "1min"),
+    "5m": ("TIME_SERIES_INTRADAY", "5min"),
+    "15m": ("TIME_SERIES_INTRADAY", "15min"),
+    "30m": ("TIME_SERIES_INTRADAY", "30min"),
+    "60m": ("TIME_SERIES_INTRADAY", "60min"),
+    "1h": ("TIME_SERIES_INTRADAY", "60min"),
+    "1d": ("TIME_SERIES_DAILY", None),
+    "1wk": ("TIME_SERIES_WEEKLY", None),
+    "1mo": ("TIME_SERIES_MONTHLY", None),
+}
+
+# NOTE The compact output has the last 100 bars, about 140 calendar days of daily bars
+_COMPACT_MAX_DURATION = pd.Timedelta(days=92)
+
+_CSV_DTYPES = {
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "volume": np.int64,
+}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
 
-def get_ohlc_from_av(
-    ticker: str, period: str = "2y", interval: str = "1d"
-) -> pd.DataFrame:
-    pass
 
+def get_av_session() -> requests.Session:
+    """
+    Get the HTTP session shared by all calls of get_ohlc_from_av.
+    It keeps the connections to Alpha Vantage alive,
+    so the concurrent fetches of many tickers don't open a connection each.
+    """
+    global _session  # pylint: disable=W0603
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1, pool_maxsize=max(FETCH_WORKERS, 10)
+            )
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
 
-# TODO implement similar to get_ohlc_from_yf,
-# as a backup data provider in case of Yahoo Finance failure.
+
+def parse_av_csv(content: bytes) -> pd.DataFrame:
+    """
+    Parse the CSV response of Alpha Vantage in one pass
+    with the column types set in advance, nothing is inferred.
+    Alpha Vantage sends the newest bar first, the result is sorted ascending.
+    The timestamps are left without timezone, they are US/Eastern wall clock times.
+    """
+    df = pd.read_csv(
+        io.BytesIO(content),
+        usecols=["timestamp", *_CSV_DTYPES.keys()],
+        dtype=_CSV_DTYPES,  # type: ignore
+        engine="c",
+    )
+    index = pd.DatetimeIndex(pd.to_datetime(df["timestamp"], format="ISO8601"))
+    res = pd.DataFrame(
+        {
+            "Open": df["open"].to_numpy(),
+            "High": df["high"].to_numpy(),
+            "Low": df["low"].to_numpy(),
+            "Close": df["close"].to_numpy(),
+            "Volume": df["volume"].to_numpy(),
+        },
+        index=index,
+    )
+    return res.iloc[::-1]
+
+
+def _get_av_error(content: bytes) -> Optional[str]:
+    """
+    Alpha Vantage answers errors and rate limit notes
+    with a JSON object instead of CSV, and status 200.
+    """
+    if not content.lstrip().startswith(b"{"):
+        return None
+    return content.decode("utf-8", errors="replace").strip()
+
+
+def get_ohlc_from_av(
+    ticker: str,
+    period: str = "2y",
+    interval: str = "1d",
+    api_key: Optional[str] = None,
+    base_url: str = AV_BASE_URL,
+    timeout: float = AV_TIMEOUT_SECONDS,
+    session: Optional[requests.Session] = None,
+) -> pd.DataFrame:
+    """
+    Get OHLC DataFrame with Volume from Alpha Vantage,
+    with the same columns, index timezone and attrs as get_ohlc_from_yf.
+    It can replace get_ohlc_from_yf as the get_ohlc_func parameter
+    or back it up, see get_ohlc_hedged.
+    The API key is taken from the ALPHA_VANTAGE_API_KEY environment variable
+    if it is not passed.
+    Valid periods: see get_ohlc_from_yf. The free plan returns about
+    the last month of intraday bars, so longer intraday periods are cut short.
+    Valid intervals: 1m, 5m, 15m, 30m, 60m, 1h, 1d, 1wk, 1mo.
+    Prices are not adjusted for splits and dividends.
+    """
+    if interval not in _AV_INTERVALS:
+        raise ValueError(
+            f"get_ohlc_from_av: {interval=}, must be one of {list(_AV_INTERVALS)}"
+        )
+    duration = get_period_duration(period)
+    if api_key is None:
+        api_key = os.environ.get(AV_API_KEY_ENV)
+    if api_key is None:
+        raise ValueError(
+            f"get_ohlc_from_av: pass api_key or set the {AV_API_KEY_ENV} environment variable"
+        )
+    function, av_interval = _AV_INTERVALS[interval]
+    params = {
+        "function": function,
+        "symbol": ticker,
+        "apikey": api_key,
+        "datatype": "csv",
+        "outputsize": (
+            "compact"
+            if av_interval is None
+            and duration is not None
+            and duration <= _COMPACT_MAX_DURATION
+            else "full"
+        ),
+    }
+    if av_interval is not None:
+        params["interval"] = av_interval
+        params["extended_hours"] = "false"
+    if session is None:
+        session = get_av_session()
+    response = session.get(base_url, params=params, timeout=timeout)
+    response.raise_for_status()
+    av_error = _get_av_error(response.content)
+    if av_error is not None:
+        raise RuntimeError(f"get_ohlc_from_av: {ticker=}, {av_error}")
+    res = parse_av_csv(response.content)
+    if res.shape[0] == 0:
+        raise RuntimeError(
+            f"get_ohlc_from_av: Alpha Vantage returned empty Df for {ticker=}, {interval=}"
+        )
+    # NOTE Alpha Vantage timestamps are US/Eastern wall clock times
+    res = normalize_ohlc(
+        df=res,
+        ticker=ticker,
+        period=period,
+        interval=interval,
+        provider="alpha_vantage",
+    )
+    return cut_period(df=res, period=period)
@@ -0,0 +1,398 @@
+import contextlib
+import glob
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from constants import BAR_STORE_DIR
+
+from .batch import iter_fetch_many
+from .cache import file_lock, get_period_duration
+from .yahoo_finance import get_ohlc_from_yf
+
+# NOTE Typical is saved if present, e.g. in resampled bars
+BAR_COLUMNS = ["Open", "High", "Low", "Close", "Volume", "Typical"]
+
+# NOTE Timestamps are stored in this column as int64 nanoseconds, UTC
+_TIMESTAMP_COLUMN = "timestamp"
+
+
+def _get_ticker_dir(store_dir: str, ticker: str, interval: str) -> str:
+    return os.path.join(store_dir, f"{ticker}_{interval}")
+
+
+def _get_column_path(ticker_dir: str, column: str, generation: int) -> str:
+    return os.path.join(ticker_dir, f"{column}.{generation}.npy")
+
+
+def _get_period_start(timestamps: np.ndarray, tz: Optional[str], period: str) -> int:
+    """
+    Get the position of the first bar of the period,
+    counted back from the last bar like get_ohlc_cached does.
+    """
+    if timestamps.shape[0] == 0:
+        return 0
+    last_date = pd.Timestamp(int(timestamps[-1]), tz="UTC")
+    if tz is not None:
+        last_date = last_date.tz_convert(tz)
+    if period == "ytd":
+        first_date = last_date.replace(month=1, day=1).normalize()
+        side = "left"
+    else:
+        duration = get_period_duration(period)
+        if duration is None:
+            return 0
+        first_date = last_date - duration
+        side = "right"
+    return int(np.searchsorted(timestamps, first_date.value, side=side))
+
+
+@dataclass(frozen=True)
+class StoredBarsRef:
+    """
+    Small picklable reference to the bars of a ticker in a BarStore.
+    Pass it to a worker process instead of the DataFrame,
+    and the worker maps the same files instead of receiving a pickled copy.
+    """
+
+    store_dir: str
+    ticker: str
+    interval: str
+    generation: int
+    start: int
+    stop: int
+
+    def load(self, attrs: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+        """
+        Get the bars as a DataFrame whose columns are memory-mapped.
+        attrs replace the attrs saved in the store if passed.
+        """
+        stored_bars = BarStore(store_dir=self.store_dir).open(
+            ticker=self.ticker, interval=self.interval, generation=self.generation
+        )
+        res = stored_bars.to_frame(start=self.start, stop=self.stop)
+        if attrs is not None:
+            res.attrs = dict(attrs, stored_bars=res.attrs["stored_bars"])
+        return res
+
+
+@dataclass
+class StoredBars:
+    """
+    Bars of one ticker and interval, every column is a read-only
+    np.memmap of its own .npy file. The pages are loaded on access
+    and shared by all processes that open the same files.
+    """
+
+    store_dir: str
+    ticker: str
+    interval: str
+    generation: int
+    timestamps: np.ndarray
+    columns: Dict[str, np.ndarray]
+    tz: Optional[str]
+    unit: str
+    attrs: Dict[str, Any]
+
+    def __len__(self) -> int:
+        return self.timestamps.shape[0]
+
+    def get_index(self, start: int = 0, stop: Optional[int] = None) -> pd.DatetimeIndex:
+        # NOTE pandas copies the timestamps when it localizes them,
+        # the index is the only column that is not memory-mapped.
+        res = pd.DatetimeIndex(
+            self.timestamps[start:stop].view("datetime64[ns]"), copy=False
+        )
+        if self.tz is not None:
+            res = res.tz_localize("UTC").tz_convert(self.tz)
+        return res.as_unit(self.unit)
+
+    def to_frame(self, start: int = 0, stop: Optional[int] = None) -> pd.DataFrame:
+        """
+        Get the bars from start to stop positions as a DataFrame
+        like get_ohlc_from_yf returns. The columns are not copied,
+        the DataFrame is backed by the memory-mapped files.
+        """
+        res = pd.DataFrame(
+            {column: values[start:stop] for column, values in self.columns.items()},
+            index=self.get_index(start=start, stop=stop),
+            copy=False,
+        )
+        res.attrs = dict(self.attrs)
+        res.attrs["stored_bars"] = self.get_ref(start=start, stop=stop)
+        return res
+
+    def get_ref(self, start: int = 0, stop: Optional[int] = None) -> StoredBarsRef:
+        start, stop, _ = slice(start, stop).indices(len(self))
+        return StoredBarsRef(
+            store_dir=self.store_dir,
+            ticker=self.ticker,
+            interval=self.interval,
+            generation=self.generation,
+            start=start,
+            stop=stop,
+        )
+
+
+class BarStore:
+    """
+    Local store of OHLCV bars, one directory per ticker and interval,
+    one NumPy .npy file per column, the timestamps included.
+    The files are opened with np.load(mmap_mode="r"), so loading doesn't copy
+    or parse anything, and worker processes share the pages of the same files.
+
+    Every write creates a new generation of the files and then replaces
+    meta.json, which names the current generation. Readers never see
+    a half-written ticker. The previous generation is kept for the readers
+    that opened it, older ones are removed.
+    """
+
+    def __init__(self, store_dir: str = BAR_STORE_DIR):
+        self.store_dir = store_dir
+
+    def _read_meta(self, ticker: str, interval: str) -> Optional[Dict[str, Any]]:
+        meta_path = os.path.join(
+            _get_ticker_dir(store_dir=self.store_dir, ticker=ticker, interval=interval),
+            "meta.json",
+        )
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def has(self, ticker: str, interval: str = "1d") -> bool:
+        return self._read_meta(ticker=ticker, interval=interval) is not None
+
+    def get_tickers(self, interval: str = "1d") -> List[str]:
+        """
+        Get the sorted tickers that have stored bars of the interval.
+        """
+        suffix = f"_{interval}"
+        res = list()
+        for meta_path in glob.glob(os.path.join(self.store_dir, "*", "meta.json")):
+            ticker_dir = os.path.basename(os.path.dirname(meta_path))
+            if ticker_dir.endswith(suffix):
+                res.append(ticker_dir[: -len(suffix)])
+        return sorted(res)
+
+    def write(
+        self,
+        df: pd.DataFrame,
+        ticker: Optional[str] = None,
+        interval: Optional[str] = None,
+    ) -> None:
+        """
+        Save the bars of df, replacing the stored bars of the ticker.
+        ticker and interval are taken from df.attrs if not passed.
+        The columns are saved as float64, the index must be sorted ascending.
+        """
+        if ticker is None:
+            ticker = df.attrs.get("ticker")
+        if interval is None:
+            interval = df.attrs.get("interval")
+        if ticker is None or interval is None:
+            raise ValueError(
+                f"BarStore.write: {ticker=}, {interval=}, pass them or set df.attrs"
+            )
+        if not isinstance(df.index, pd.DatetimeIndex):
+            raise ValueError("BarStore.write: df index must be DatetimeIndex")
+        if not df.index.is_monotonic_increasing:
+            raise ValueError("BarStore.write: df index must be sorted ascending")
+        columns = [column for column in BAR_COLUMNS if column in df.columns]
+        tz = None if df.index.tz is None else str(df.index.tz)
+        index = df.index if tz is None else df.index.tz_convert("UTC")
+        attrs = {key: value for key, value in df.attrs.items() if key != "stored_bars"}
+
+        ticker_dir = _get_ticker_dir(
+            store_dir=self.store_dir, ticker=ticker, interval=interval
+        )
+        os.makedirs(ticker_dir, exist_ok=True)
+        with file_lock(os.path.join(ticker_dir, "write.lock")):
+            meta = self._read_meta(ticker=ticker, interval=interval)
+            previous_generation = -1 if meta is None else meta["generation"]
+            generation = previous_generation + 1
+            arrays = {_TIMESTAMP_COLUMN: index.as_unit("ns").asi8}
+            for column in columns:
+                arrays[column] = df[column].to_numpy(dtype=np.float64)
+            for column, values in arrays.items():
+                np.save(
+                    _get_column_path(
+                        ticker_dir=ticker_dir, column=column, generation=generation
+                    ),
+                    values,
+                )
+            meta = {
+                "generation": generation,
+                "columns": columns,
+                "tz": tz,
+                "unit": index.unit,
+                "rows": df.shape[0],
+                "written_at": time.time(),
+                "attrs": attrs,
+            }
+            meta_path = os.path.join(ticker_dir, "meta.json")
+            with open(f"{meta_path}.tmp", "w", encoding="utf-8") as file:
+                json.dump(meta, file, indent=2, default=str)
+            os.replace(f"{meta_path}.tmp", meta_path)
+            self._remove_old_generations(
+                ticker_dir=ticker_dir, keep=(previous_generation, generation)
+            )
+
+    @staticmethod
+    def _remove_old_generations(ticker_dir: str, keep: Tuple[int, int]) -> None:
+        for path in glob.glob(os.path.join(ticker_dir, "*.npy")):
+            generation = int(os.path.basename(path).split(".")[-2])
+            if generation not in keep:
+                # NOTE On Windows, files that are still mapped can't be removed,
+                # they are removed by one of the next writes
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+
+    def open(
+        self, ticker: str, interval: str = "1d", generation: Optional[int] = None
+    ) -> StoredBars:
+        """
+        Map the stored bars of the ticker, the current generation by default.
+        """
+        meta = self._read_meta(ticker=ticker, interval=interval)
+        if meta is None:
+            raise ValueError(
+                f"BarStore.open: no bars of {ticker=}, {interval=} in {self.store_dir}"
+            )
+        if generation is None:
+            generation = meta["generation"]
+        ticker_dir = _get_ticker_dir(
+            store_dir=self.store_dir, ticker=ticker, interval=interval
+        )
+        timestamps, *column_values = [
+            np.load(
+                _get_column_path(
+                    ticker_dir=ticker_dir, column=column, generation=generation
+                ),
+                mmap_mode="r",
+            )
+            for column in [_TIMESTAMP_COLUMN] + meta["columns"]
+        ]
+        attrs = dict(meta["attrs"])
+        attrs["ticker"] = ticker
+        attrs["interval"] = interval
+        return StoredBars(
+            store_dir=self.store_dir,
+            ticker=ticker,
+            interval=interval,
+            generation=generation,
+            timestamps=timestamps,
+            columns=dict(zip(meta["columns"], column_values)),
+            tz=meta["tz"],
+            unit=meta["unit"],
+            attrs=attrs,
+        )
+
+    def get_ohlc(
+        self, ticker: str, period: str = "max", interval: str = "1d"
+    ) -> pd.DataFrame:
+        """
+        Get the stored bars of the period like get_ohlc_from_yf returns them,
+        counting the period back from the last stored bar.
+        The columns are memory-mapped, not copied.
+        """
+        stored_bars = self.open(ticker=ticker, interval=interval)
+        start = _get_period_start(
+            timestamps=stored_bars.timestamps, tz=stored_bars.tz, period=period
+        )
+        res = stored_bars.to_frame(start=start)
+        res.attrs["period"] = period
+        return res
+
+    def load_aligned(
+        self, tickers: List[str], interval: str = "1d", column: str = "Close"
+    ) -> pd.DataFrame:
+        """
+        Get one column of every ticker on the shared timestamps,
+        i.e. only the bars that all tickers have. The columns of the result
+        are named by the tickers. It replaces joining the full DataFrames.
+        """
+        if len(tickers) == 0:
+            raise ValueError("BarStore.load_aligned: tickers must not be empty")
+        all_stored_bars = [
+            self.open(ticker=ticker, interval=interval) for ticker in tickers
+        ]
+        shared_timestamps = all_stored_bars[0].timestamps
+        for stored_bars in all_stored_bars[1:]:
+            shared_timestamps = np.intersect1d(
+                shared_timestamps, stored_bars.timestamps, assume_unique=True
+            )
+        columns = dict()
+        for ticker, stored_bars in zip(tickers, all_stored_bars):
+            positions = np.searchsorted(stored_bars.timestamps, shared_timestamps)
+            columns[ticker] = stored_bars.columns[column][positions]
+        index = pd.DatetimeIndex(shared_timestamps.view("datetime64[ns]"))
+        tz = all_stored_bars[0].tz
+        if tz is not None:
+            index = index.tz_localize("UTC").tz_convert(tz)
+        res = pd.DataFrame(columns, index=index.as_unit(all_stored_bars[0].unit))
+        res.attrs["interval"] = interval
+        return res
+
+
+def get_ohlc_from_bar_store(
+    ticker: str,
+    period: str = "max",
+    interval: str = "1d",
+    store_dir: str = BAR_STORE_DIR,
+    get_ohlc_func: Optional[Callable] = None,
+) -> pd.DataFrame:
+    """
+    Get OHLC DataFrame from the BarStore in store_dir.
+    Can be passed as get_ohlc_func to the draw_* functions
+    with functools.partial if the store_dir is not the default one.
+    If the ticker is not in the store and get_ohlc_func is passed,
+    its bars are fetched with period "max" and saved first.
+    Use fill_bar_store to update the stored bars.
+    """
+    bar_store = BarStore(store_dir=store_dir)
+    if get_ohlc_func is not None and not bar_store.has(
+        ticker=ticker, interval=interval
+    ):
+        bar_store.write(
+            df=get_ohlc_func(ticker=ticker, period="max", interval=interval),
+            ticker=ticker,
+            interval=interval,
+        )
+    return bar_store.get_ohlc(ticker=ticker, period=period, interval=interval)
+
+
+def fill_bar_store(
+    tickers: Iterable[str],
+    interval: str = "1d",
+    period: str = "max",
+    get_ohlc_func: Callable = get_ohlc_from_yf,
+    store_dir: str = BAR_STORE_DIR,
+    **fetch_kwargs: Any,
+) -> Dict[str, Optional[Exception]]:
+    """
+    Fetch the bars of the tickers concurrently and save them to the BarStore,
+    replacing the stored ones. fetch_kwargs are passed to iter_fetch_many.
+    Return a dict with None for saved tickers and errors for failed ones.
+    """
+    bar_store = BarStore(store_dir=store_dir)
+    res: Dict[str, Optional[Exception]] = dict()
+    for ticker, df, error in iter_fetch_many(
+        tickers=tickers,
+        interval=interval,
+        period=period,
+        get_ohlc_func=get_ohlc_func,
+        **fetch_kwargs,
+    ):
+        if error is None:
+            try:
+                bar_store.write(df=df, ticker=ticker, interval=interval)  # type: ignore
+            except Exception as write_error:  # pylint: disable=W0718
+                error = write_error
+        res[ticker] = error
+    return res
@@ -0,0 +1,164 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Iterable, Iterator, Optional, Tuple
+
+import pandas as pd
+
+from constants import FETCH_REQUESTS_PER_SECOND, FETCH_RETRIES, FETCH_WORKERS
+from misc import span
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+    Allows bursts of up to capacity requests,
+    then rate_per_second requests per second on average.
+    """
+
+    def __init__(self, rate_per_second: float, capacity: Optional[float] = None):
+        if rate_per_second <= 0:
+            raise ValueError(f"TokenBucket: {rate_per_second=} must be positive")
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_second)
+        self._tokens = self.capacity
+        self._last_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Take one token, wait until it is available.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._last_time) * self.rate_per_second,
+                )
+                self._last_time = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.rate_per_second
+            time.sleep(wait_seconds)
+
+
+def fetch_with_retries(
+    get_ohlc_func: Callable,
+    ticker: str,
+    period: str,
+    interval: str,
+    rate_limiter: Optional[TokenBucket] = None,
+    retries: int = FETCH_RETRIES,
+    backoff_seconds: float = 1.0,
+) -> pd.DataFrame:
+    """
+    Call get_ohlc_func, retry with exponential backoff and jitter if it fails.
+    Every attempt takes a token from rate_limiter if it is passed.
+    """
+    attempt = 0
+    while True:
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            with span("fetch", ticker=ticker, interval=interval, attempt=attempt):
+                return get_ohlc_func(ticker=ticker, period=period, interval=interval)
+        except Exception:  # pylint: disable=W0718
+            if attempt >= retries:
+                raise
+            time.sleep(backoff_seconds * (2**attempt) * (0.5 + random.random()))
+            attempt += 1
+
+
+def iter_fetch_many(
+    tickers: Iterable[str],
+    interval: str,
+    period: str,
+    get_ohlc_func: Callable,
+    max_workers: int = FETCH_WORKERS,
+    requests_per_second: Optional[float] = FETCH_REQUESTS_PER_SECOND,
+    retries: int = FETCH_RETRIES,
+    backoff_seconds: float = 1.0,
+    prefetch: Optional[int] = None,
+) -> Iterator[Tuple[str, Optional[pd.DataFrame], Optional[Exception]]]:
+    """
+    Fetch OHLC data for many tickers in a bounded thread pool.
+    Yield (ticker, df, None) or (ticker, None, error) in the order of tickers,
+    as soon as the result of the next ticker is ready.
+    One failed ticker doesn't stop the others.
+
+    While the caller processes one ticker, the next ones are being fetched.
+    At most prefetch tickers (by default 2 * max_workers) are fetched ahead,
+    so the memory doesn't grow if the caller is slower than the network.
+    """
+    rate_limiter = None
+    if requests_per_second is not None:
+        rate_limiter = TokenBucket(rate_per_second=requests_per_second)
+    if prefetch is None:
+        prefetch = 2 * max_workers
+    tickers_iter = iter(tickers)
+    pending: Deque[Tuple[str, Future]] = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        def _submit_next() -> bool:
+            ticker = next(tickers_iter, None)
+            if ticker is None:
+                return False
+            future = executor.submit(
+                fetch_with_retries,
+                get_ohlc_func=get_ohlc_func,
+                ticker=ticker,
+                period=period,
+                interval=interval,
+                rate_limiter=rate_limiter,
+                retries=retries,
+                backoff_seconds=backoff_seconds,
+            )
+            pending.append((ticker, future))
+            return True
+
+        while len(pending) < prefetch and _submit_next():
+            pass
+        while len(pending) > 0:
+            ticker, future = pending.popleft()
+            _submit_next()
+            try:
+                yield ticker, future.result(), None
+            except Exception as error:  # pylint: disable=W0718
+                yield ticker, None, error
+
+
+def fetch_many(
+    tickers: Iterable[str],
+    interval: str,
+    period: str,
+    get_ohlc_func: Callable,
+    max_workers: int = FETCH_WORKERS,
+    requests_per_second: Optional[float] = FETCH_REQUESTS_PER_SECOND,
+    retries: int = FETCH_RETRIES,
+    backoff_seconds: float = 1.0,
+) -> Tuple[Dict[str, pd.DataFrame], Dict[str, Exception]]:
+    """
+    Fetch OHLC data for many tickers concurrently, see iter_fetch_many.
+    Return two dicts: ticker -> DataFrame and ticker -> error for failed tickers.
+    """
+    results: Dict[str, pd.DataFrame] = dict()
+    errors: Dict[str, Exception] = dict()
+    for ticker, df, error in iter_fetch_many(
+        tickers=tickers,
+        interval=interval,
+        period=period,
+        get_ohlc_func=get_ohlc_func,
+        max_workers=max_workers,
+        requests_per_second=requests_per_second,
+        retries=retries,
+        backoff_seconds=backoff_seconds,
+    ):
+        if error is not None:
+            errors[ticker] = error
+        else:
+            results[ticker] = df  # type: ignore
+    return results, errors
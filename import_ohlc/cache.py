@@ -0,0 +1,264 @@
+import contextlib
+import json
+import os
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from constants import OHLC_CACHE_DIR, OHLC_CACHE_TTL_SECONDS
+
+from .yahoo_finance import get_ohlc_from_yf
+
+# NOTE Approximate durations of the periods that Yahoo Finance accepts.
+# They are used to decide whether the cached data covers the requested period
+# and which period is enough to fetch the missing tail.
+_PERIOD_DURATIONS: Dict[str, Optional[pd.Timedelta]] = {
+    "1d": pd.Timedelta(days=1),
+    "5d": pd.Timedelta(days=5),
+    "1mo": pd.Timedelta(days=31),
+    "3mo": pd.Timedelta(days=92),
+    "6mo": pd.Timedelta(days=183),
+    "ytd": pd.Timedelta(days=366),
+    "1y": pd.Timedelta(days=366),
+    "2y": pd.Timedelta(days=731),
+    "5y": pd.Timedelta(days=1827),
+    "10y": pd.Timedelta(days=3653),
+    "max": None,
+}
+_TAIL_PERIODS = ["1d", "5d", "1mo", "3mo", "6mo", "1y", "2y", "5y", "10y"]
+
+# NOTE The longest periods that Yahoo Finance returns for intraday intervals,
+# it rejects longer ones. The other intervals have no limit.
+_INTERVAL_MAX_DURATIONS: Dict[str, pd.Timedelta] = {
+    "1m": pd.Timedelta(days=7),
+    "2m": pd.Timedelta(days=60),
+    "5m": pd.Timedelta(days=60),
+    "15m": pd.Timedelta(days=60),
+    "30m": pd.Timedelta(days=60),
+    "60m": pd.Timedelta(days=730),
+    "90m": pd.Timedelta(days=60),
+    "1h": pd.Timedelta(days=730),
+}
+
+
+def get_period_duration(period: str) -> Optional[pd.Timedelta]:
+    """
+    Get the duration of a Yahoo Finance period, e.g. 5d or 1y,
+    None for max. The duration of ytd is its longest one.
+    """
+    if period not in _PERIOD_DURATIONS:
+        raise ValueError(
+            f"get_period_duration: {period=} is not one of {list(_PERIOD_DURATIONS.keys())}"
+        )
+    return _PERIOD_DURATIONS[period]
+
+
+def _is_period_covered(cached_period: str, period: str) -> bool:
+    # NOTE The duration of ytd is its longest one, on December 31.
+    # Usually it is shorter, so it covers no other period.
+    if cached_period == "ytd":
+        return period == "ytd"
+    cached_duration = get_period_duration(cached_period)
+    duration = get_period_duration(period)
+    if cached_duration is None:
+        return True
+    if duration is None:
+        return False
+    return cached_duration >= duration
+
+
+def _get_tail_period(
+    last_cached_date: pd.Timestamp, now: pd.Timestamp, interval: str
+) -> Optional[str]:
+    """
+    Get the shortest period that reaches back to the last cached bar,
+    so that the last bar, which may have been incomplete, is fetched again.
+    Return None if the provider doesn't give such a period of the interval,
+    e.g. more than 7 days of 1-minute bars, then the whole period is fetched.
+    """
+    gap = now - last_cached_date + pd.Timedelta(days=1)
+    max_duration = _INTERVAL_MAX_DURATIONS.get(interval)
+    for period in _TAIL_PERIODS:
+        duration: pd.Timedelta = _PERIOD_DURATIONS[period]  # type: ignore
+        if max_duration is not None and duration > max_duration:
+            return None
+        if duration >= gap:
+            return period
+    return "max"
+
+
+def cut_period(df: pd.DataFrame, period: str) -> pd.DataFrame:
+    """
+    Keep only the bars of df within period before its last bar.
+    """
+    if df.shape[0] == 0:
+        return df
+    last_date = df.index[-1]
+    if period == "ytd":
+        return df[df.index >= last_date.replace(month=1, day=1).normalize()]
+    duration = get_period_duration(period)
+    if duration is None:
+        return df
+    return df[df.index > last_date - duration]
+
+
+@contextlib.contextmanager
+def file_lock(
+    lock_path: str, timeout: float = 60, stale_after: float = 600
+) -> Iterator[None]:
+    """
+    Cross-process lock based on exclusive creation of the lock file.
+    It works on Windows and Linux, so concurrent jobs can share the cache.
+    A lock file older than stale_after seconds is considered left
+    by a crashed process and is removed.
+    """
+    start = time.monotonic()
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > stale_after:
+                    os.remove(lock_path)
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() - start > timeout:
+                raise TimeoutError(
+                    f"file_lock: can't acquire {lock_path} in {timeout=}"
+                )
+            time.sleep(0.05)
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        yield
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(lock_path)
+
+
+def _get_cache_paths(
+    cache_dir: str, ticker: str, interval: str
+) -> Tuple[str, str, str]:
+    base_name = os.path.join(cache_dir, f"{ticker}_{interval}")
+    return f"{base_name}.parquet", f"{base_name}.json", f"{base_name}.lock"
+
+
+def _read_cache(
+    data_path: str, meta_path: str
+) -> Tuple[Optional[pd.DataFrame], Dict[str, Any]]:
+    if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+        return None, dict()
+    with open(meta_path, "r", encoding="utf-8") as file:
+        meta = json.load(file)
+    df = pd.read_parquet(data_path)
+    return df, meta
+
+
+def _write_cache(
+    df: pd.DataFrame, meta: Dict[str, Any], data_path: str, meta_path: str
+) -> None:
+    # NOTE Write to temporary files and rename them,
+    # so that readers never see a half-written file.
+    df = df.copy()
+    df.attrs = dict()
+    df.to_parquet(f"{data_path}.tmp")
+    os.replace(f"{data_path}.tmp", data_path)
+    with open(f"{meta_path}.tmp", "w", encoding="utf-8") as file:
+        json.dump(meta, file, indent=2, default=str)
+    os.replace(f"{meta_path}.tmp", meta_path)
+
+
+def _is_history_unchanged(cached: pd.DataFrame, new: pd.DataFrame) -> bool:
+    """
+    Check that the bars present in both DataFrames have the same Close,
+    except the last cached bar, which may have been incomplete.
+    Providers adjust the whole history after splits and dividends.
+    """
+    overlap = cached.index[:-1].intersection(new.index)
+    if len(overlap) == 0:
+        return True
+    return bool(
+        np.allclose(
+            cached.loc[overlap, "Close"].to_numpy(dtype=np.float64),
+            new.loc[overlap, "Close"].to_numpy(dtype=np.float64),
+            equal_nan=True,
+        )
+    )
+
+
+def get_ohlc_cached(
+    ticker: str,
+    period: str = "2y",
+    interval: str = "1d",
+    get_ohlc_func: Callable = get_ohlc_from_yf,
+    cache_dir: str = OHLC_CACHE_DIR,
+    ttl_seconds: float = OHLC_CACHE_TTL_SECONDS,
+    force_refresh: bool = False,
+) -> pd.DataFrame:
+    """
+    Get OHLC DataFrame through a local Parquet cache,
+    one file per ticker and interval, attrs are saved next to it in JSON.
+    Can be passed as get_ohlc_func to the draw_* functions.
+
+    1. If the cache is younger than ttl_seconds, return it without fetching.
+    2. If the cache is older, fetch only the missing tail since the last cached bar
+    and append it. The last cached bar is replaced because it may have been incomplete.
+    3. If there is no cache, it doesn't cover the period, the provider
+    has changed the history, the missing tail is longer than the provider
+    gives for the interval, or force_refresh is True, fetch the whole period.
+
+    Use functools.partial to pass another get_ohlc_func, e.g. a fake provider for tests.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    data_path, meta_path, lock_path = _get_cache_paths(
+        cache_dir=cache_dir, ticker=ticker, interval=interval
+    )
+    with file_lock(lock_path):
+        cached, meta = _read_cache(data_path=data_path, meta_path=meta_path)
+        now = time.time()
+        res = None
+        if (
+            not force_refresh
+            and cached is not None
+            and cached.shape[0] > 0
+            and _is_period_covered(cached_period=meta["period"], period=period)
+        ):
+            if now - meta["fetched_at"] <= ttl_seconds:
+                res = cached
+            else:
+                last_cached_date = cached.index[-1]
+                tail_period = _get_tail_period(
+                    last_cached_date=last_cached_date,
+                    now=pd.Timestamp.now(tz=last_cached_date.tz),
+                    interval=interval,
+                )
+                new = None
+                if tail_period is not None:
+                    new = get_ohlc_func(
+                        ticker=ticker, period=tail_period, interval=interval
+                    )
+                if (
+                    new is not None
+                    and new.index[0] <= last_cached_date
+                    and _is_history_unchanged(cached=cached, new=new)
+                ):
+                    res = pd.concat([cached[cached.index < new.index[0]], new])
+                    meta["attrs"].update(new.attrs)
+                    meta["attrs"]["period"] = meta["period"]
+                    meta["fetched_at"] = now
+                    _write_cache(
+                        df=res, meta=meta, data_path=data_path, meta_path=meta_path
+                    )
+        if res is None:
+            res = get_ohlc_func(ticker=ticker, period=period, interval=interval)
+            meta = {"period": period, "fetched_at": now, "attrs": dict(res.attrs)}
+            _write_cache(df=res, meta=meta, data_path=data_path, meta_path=meta_path)
+
+    res = cut_period(df=res, period=period).copy()
+    res.attrs = dict(meta["attrs"])
+    res.attrs["period"] = period
+    return res
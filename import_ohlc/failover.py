@@ -0,0 +1,74 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict
+
+import pandas as pd
+
+from constants import HEDGE_LATENCY_SECONDS
+from misc import span
+
+from .alpha_vantage import get_ohlc_from_av
+from .normalize import normalize_ohlc
+from .yahoo_finance import get_ohlc_from_yf
+
+
+def _get_provider_name(func: Callable) -> str:
+    # NOTE functools.partial has no __name__
+    func = getattr(func, "func", func)
+    return getattr(func, "__name__", repr(func))
+
+
+def get_ohlc_hedged(
+    ticker: str,
+    period: str = "2y",
+    interval: str = "1d",
+    primary_func: Callable = get_ohlc_from_yf,
+    secondary_func: Callable = get_ohlc_from_av,
+    latency_budget: float = HEDGE_LATENCY_SECONDS,
+) -> pd.DataFrame:
+    """
+    Get OHLC DataFrame from primary_func, backed up by secondary_func.
+    Can be passed as get_ohlc_func to the draw_* functions.
+    1. Ask the primary provider.
+    2. If it fails, or hasn't answered within latency_budget seconds,
+    ask the secondary provider too.
+    3. Take the first successful answer, the slower request is abandoned
+    in the background.
+    4. If both fail, raise the error of the primary provider.
+    The result is normalized with normalize_ohlc, so it doesn't matter
+    which provider answered. attrs["provider"] is set to the winner,
+    attrs["hedged"] is True if the secondary provider was asked.
+    """
+    kwargs = dict(ticker=ticker, period=period, interval=interval)
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="get_ohlc_hedged")
+    try:
+        start = time.perf_counter()
+        primary = executor.submit(primary_func, **kwargs)
+        funcs: Dict[Future, Callable] = {primary: primary_func}
+        done, _ = wait([primary], timeout=latency_budget)
+        if len(done) == 0 or primary.exception() is not None:
+            funcs[executor.submit(secondary_func, **kwargs)] = secondary_func
+        pending = set(funcs.keys())
+        while len(pending) > 0:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    continue
+                func = funcs[future]
+                with span("normalize", ticker=ticker, interval=interval):
+                    res = normalize_ohlc(
+                        df=future.result(),
+                        ticker=ticker,
+                        period=period,
+                        interval=interval,
+                        provider=future.result().attrs.get(
+                            "provider", _get_provider_name(func)
+                        ),
+                    )
+                res.attrs["hedged"] = len(funcs) > 1
+                res.attrs["fetch_seconds"] = time.perf_counter() - start
+                return res
+        raise primary.exception()  # type: ignore
+    finally:
+        # NOTE Don't wait for the abandoned request, its result is dropped
+        executor.shutdown(wait=False)
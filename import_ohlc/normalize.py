@@ -0,0 +1,43 @@
+from typing import Optional
+
+import pandas as pd
+
+OHLC_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+# NOTE Timezone of the naive timestamps, e.g. those of Alpha Vantage
+DEFAULT_TIMEZONE = "America/New_York"
+
+_DAILY_INTERVALS = ("1d", "5d", "1wk", "1mo", "3mo")
+
+
+def normalize_ohlc(
+    df: pd.DataFrame,
+    ticker: str,
+    period: str,
+    interval: str,
+    provider: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Bring OHLC data of any provider to the form of get_ohlc_from_yf:
+    Open, High, Low, Close, Volume columns in this order,
+    tz-aware index sorted ascending without duplicates and NaT,
+    named Date for daily and longer bars and Datetime for intraday bars,
+    and ticker, period and interval in attrs. provider is added to attrs if passed.
+    A naive index is localized to DEFAULT_TIMEZONE.
+    """
+    missing_columns = [column for column in OHLC_COLUMNS if column not in df.columns]
+    if len(missing_columns) > 0:
+        raise ValueError(f"normalize_ohlc: {ticker=}, {missing_columns=}")
+    res = df[OHLC_COLUMNS]
+    if res.index.tz is None:  # type: ignore
+        res = res.tz_localize(DEFAULT_TIMEZONE, ambiguous="NaT", nonexistent="NaT")
+    res = res[res.index.notna()]
+    if not res.index.is_monotonic_increasing:
+        res = res.sort_index(kind="stable")
+    if res.index.has_duplicates:
+        res = res[~res.index.duplicated(keep="last")]
+    res.index.name = "Date" if interval in _DAILY_INTERVALS else "Datetime"
+    res.attrs = {"ticker": ticker, "period": period, "interval": interval}
+    if provider is not None:
+        res.attrs["provider"] = provider
+    return res
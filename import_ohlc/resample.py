@@ -0,0 +1,220 @@
+import os
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from constants import RESAMPLED_STORE_DIR, SESSION_CLOSE_MINUTE, SESSION_OPEN_MINUTE
+from misc import get_typical_x_volume, span
+
+from .bar_store import BarStore
+from .cache import file_lock
+from .yahoo_finance import get_ohlc_from_yf
+
+# NOTE Bar durations in minutes, None for daily bars
+RESAMPLE_INTERVALS = {
+    "1m": 1,
+    "2m": 2,
+    "5m": 5,
+    "15m": 15,
+    "30m": 30,
+    "60m": 60,
+    "90m": 90,
+    "1h": 60,
+    "1d": None,
+}
+
+_RESAMPLED_COLUMNS = ["Open", "High", "Low", "Close", "Volume", "Typical"]
+
+_MINUTE_NS = 60 * 10**9
+_DAY_NS = 24 * 60 * _MINUTE_NS
+
+
+def _get_interval_minutes(interval: str) -> Optional[int]:
+    if interval not in RESAMPLE_INTERVALS:
+        raise ValueError(
+            f"resample_bars: {interval=}, must be one of {list(RESAMPLE_INTERVALS)}"
+        )
+    return RESAMPLE_INTERVALS[interval]
+
+
+def _get_local_ns(index: pd.DatetimeIndex) -> np.ndarray:
+    """
+    Wall clock times of the exchange as int64 nanoseconds.
+    """
+    if index.tz is not None:
+        index = index.tz_localize(None)  # type: ignore
+    return index.as_unit("ns").asi8
+
+
+def get_bin_starts(index: pd.DatetimeIndex, interval: str) -> np.ndarray:
+    """
+    Get the start of the bar of interval that every bar of index falls into,
+    as wall clock int64 nanoseconds in the timezone of index.
+    Intraday bars are aligned to the session open, like those of Yahoo Finance:
+    30-minute bars start at 9:30, 10:00, ..., hourly bars at 9:30, 10:30, ...
+    Daily bars start at midnight.
+    """
+    minutes = _get_interval_minutes(interval)
+    local_ns = _get_local_ns(index)
+    day_ns = local_ns - local_ns % _DAY_NS
+    if minutes is None:
+        return day_ns
+    minute_of_day = (local_ns - day_ns) // _MINUTE_NS
+    bin_minute = (
+        SESSION_OPEN_MINUTE + (minute_of_day - SESSION_OPEN_MINUTE) // minutes * minutes
+    )
+    return day_ns + bin_minute * _MINUTE_NS
+
+
+def resample_bars(
+    df: pd.DataFrame, interval: str, extended_hours: bool = False
+) -> pd.DataFrame:
+    """
+    Build bars of interval from the finer bars of df, e.g. 15m bars from 1m bars.
+    Open is the first Open, Close the last Close, High and Low are the extremes,
+    Volume is the sum.
+    The Typical column is the volume-weighted mean of the typical prices
+    of the finer bars, so the anchored VWAPs of the resampled bars
+    are equal to those of the finer bars at the end of every resampled bar.
+    For daily bars, only the regular session is used unless extended_hours is True,
+    like Yahoo Finance does. The index of df must be sorted.
+    """
+    minutes = _get_interval_minutes(interval)
+    if minutes is None and not extended_hours and df.shape[0] > 0:
+        local_ns = _get_local_ns(df.index)  # type: ignore
+        minute_of_day = local_ns % _DAY_NS // _MINUTE_NS
+        df = df[
+            (minute_of_day >= SESSION_OPEN_MINUTE)
+            & (minute_of_day < SESSION_CLOSE_MINUTE)
+        ]
+    attrs = {key: value for key, value in df.attrs.items() if key != "stored_bars"}
+    attrs["interval"] = interval
+    attrs["base_interval"] = df.attrs.get("interval")
+    if df.shape[0] == 0:
+        # NOTE E.g. daily bars before the open, there are no bars of the session yet
+        res = pd.DataFrame(
+            {column: np.empty(0, dtype=np.float64) for column in _RESAMPLED_COLUMNS},
+            index=df.index[:0],
+        )
+        res.attrs = attrs
+        return res
+    bin_starts = get_bin_starts(index=df.index, interval=interval)  # type: ignore
+    is_first = np.ones(bin_starts.shape[0], dtype=bool)
+    is_first[1:] = bin_starts[1:] != bin_starts[:-1]
+    starts = np.flatnonzero(is_first)
+    ends = np.append(starts[1:], bin_starts.shape[0]) - 1
+
+    typical_x_volume, volume = get_typical_x_volume(df=df)
+    # NOTE Like the anchored VWAPs, skip the NaN values in the sums
+    typical_x_volume = np.nan_to_num(typical_x_volume, nan=0.0)
+    volume = np.nan_to_num(volume, nan=0.0)
+    res_volume = np.add.reduceat(volume, starts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        typical = np.add.reduceat(typical_x_volume, starts) / res_volume
+
+    index = pd.DatetimeIndex(bin_starts[starts].astype("datetime64[ns]"))
+    if df.index.tz is not None:  # type: ignore
+        index = index.tz_localize(df.index.tz)  # type: ignore
+    res = pd.DataFrame(
+        {
+            "Open": df["Open"].to_numpy(dtype=np.float64)[starts],
+            "High": np.maximum.reduceat(df["High"].to_numpy(dtype=np.float64), starts),
+            "Low": np.minimum.reduceat(df["Low"].to_numpy(dtype=np.float64), starts),
+            "Close": df["Close"].to_numpy(dtype=np.float64)[ends],
+            "Volume": res_volume,
+            "Typical": typical,
+        },
+        index=index.as_unit(df.index.unit),  # type: ignore
+    )
+    res.attrs = attrs
+    return res
+
+
+def extend_resampled(
+    resampled: Optional[pd.DataFrame],
+    base: pd.DataFrame,
+    interval: str,
+    extended_hours: bool = False,
+) -> pd.DataFrame:
+    """
+    Add the bars of base to the bars resampled from it earlier.
+    Only the base bars from the start of the last resampled bar on
+    are resampled again, that bar may have been incomplete.
+    If base starts after that, e.g. after a long break, the resampled bars
+    before the first base bar are kept, and the bar it falls into
+    is built from the base bars only.
+    """
+    if resampled is None or resampled.shape[0] == 0:
+        return resample_bars(df=base, interval=interval, extended_hours=extended_hours)
+    if base.shape[0] == 0:
+        return resampled
+    last_start = resampled.index[-1]
+    if base.index[0] > last_start:
+        last_start = pd.Timestamp(
+            int(get_bin_starts(index=base.index[:1], interval=interval)[0])  # type: ignore
+        )
+        if base.index.tz is not None:  # type: ignore
+            last_start = last_start.tz_localize(base.index.tz)  # type: ignore
+    new = resample_bars(
+        df=base[base.index >= last_start],
+        interval=interval,
+        extended_hours=extended_hours,
+    )
+    if new.shape[0] == 0:
+        return resampled
+    res = pd.concat([resampled[resampled.index < new.index[0]][new.columns], new])
+    res.attrs = new.attrs
+    return res
+
+
+def get_ohlc_resampled(
+    ticker: str,
+    period: str = "5d",
+    interval: str = "15m",
+    base_get_ohlc_func: Callable = get_ohlc_from_yf,
+    base_interval: str = "1m",
+    base_period: str = "5d",
+    store_dir: str = RESAMPLED_STORE_DIR,
+    extended_hours: bool = False,
+) -> pd.DataFrame:
+    """
+    Get OHLC DataFrame of interval built from the base_interval bars
+    of base_get_ohlc_func, so that all intervals of a ticker
+    come from one download. Can be passed as get_ohlc_func to the draw_* functions
+    with functools.partial, e.g. base_get_ohlc_func=get_ohlc_cached.
+
+    The resampled bars are kept in a BarStore in store_dir
+    and extended with the new base bars on every call, see extend_resampled.
+    So they can reach further back than base_period,
+    e.g. daily bars from months of 1-minute bars collected day by day.
+    The period is counted back from the last bar.
+    """
+    base_minutes = _get_interval_minutes(base_interval)
+    minutes = _get_interval_minutes(interval)
+    if base_minutes is None or (minutes is not None and minutes % base_minutes != 0):
+        raise ValueError(
+            f"get_ohlc_resampled: can't build {interval=} bars from {base_interval=} bars"
+        )
+    base = base_get_ohlc_func(ticker=ticker, period=base_period, interval=base_interval)
+    if interval == base_interval:
+        return base
+
+    bar_store = BarStore(store_dir=store_dir)
+    os.makedirs(store_dir, exist_ok=True)
+    with file_lock(os.path.join(store_dir, f"{ticker}_{interval}.lock")), span(
+        "resample", ticker=ticker, interval=interval
+    ):
+        resampled = None
+        if bar_store.has(ticker=ticker, interval=interval):
+            resampled = bar_store.get_ohlc(ticker=ticker, interval=interval)
+        resampled = extend_resampled(
+            resampled=resampled,
+            base=base,
+            interval=interval,
+            extended_hours=extended_hours,
+        )
+        bar_store.write(df=resampled, ticker=ticker, interval=interval)
+    res = bar_store.get_ohlc(ticker=ticker, period=period, interval=interval)
+    res.attrs["ticker"] = ticker
+    return res
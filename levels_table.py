@@ -0,0 +1,73 @@
+import os
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from constants import FETCH_WORKERS, first_day_of_year
+from draw_all_daily_charts import get_custom_anchor_dates, read_watchlist
+from import_ohlc import get_ohlc_from_yf, iter_fetch_many
+from vwaps_plot_build_save import compute_vwaps
+
+
+def write_levels_table(
+    file_name: str = "levels.csv",
+    get_ohlc_func: Callable = get_ohlc_from_yf,
+    min_max_checkpoint_dir: Optional[str] = None,
+    fetch_workers: int = FETCH_WORKERS,
+) -> pd.DataFrame:
+    """
+    For every ticker in tickers_follow_daily.xlsx, compute the same
+    daily anchored VWAPs as draw_all_daily_charts chart 1
+    (custom anchor dates, year's 1st day, last low and high),
+    without building any chart.
+    Save one table with the last VWAP values and their distances from Close,
+    one row per ticker and anchor, to file_name (.csv or .parquet).
+    Tickers that fail are reported and skipped.
+    """
+    if os.path.splitext(file_name)[1] not in (".csv", ".parquet"):
+        raise ValueError(f"write_levels_table: {file_name=} must be .csv or .parquet")
+    tickers_notes, tickers_anchor_dates = read_watchlist()
+    interval = "1d"
+    if min_max_checkpoint_dir is not None:
+        os.makedirs(min_max_checkpoint_dir, exist_ok=True)
+
+    levels: List[pd.DataFrame] = list()
+    errors: Dict[str, Exception] = dict()
+    for ticker, ohlc_df, error in iter_fetch_many(
+        tickers=tickers_notes["Ticker"].values.tolist(),
+        interval=interval,
+        period="max",
+        get_ohlc_func=get_ohlc_func,
+        max_workers=fetch_workers,
+    ):
+        if error is None:
+            min_max_checkpoint_file = None
+            if min_max_checkpoint_dir is not None:
+                min_max_checkpoint_file = os.path.join(
+                    min_max_checkpoint_dir, f"min_max_{ticker}_{interval}.json"
+                )
+            custom_anchor_dates = get_custom_anchor_dates(
+                ticker=ticker, tickers_anchor_dates=tickers_anchor_dates
+            )
+            try:
+                chart_data = compute_vwaps(
+                    input_df=ohlc_df,  # type: ignore
+                    anchor_dates=custom_anchor_dates + [first_day_of_year],
+                    add_last_min_max=True,
+                    min_max_checkpoint_file=min_max_checkpoint_file,
+                )
+                ticker_levels = chart_data.get_levels()
+                ticker_levels["ticker"] = ticker
+                levels.append(ticker_levels)
+            except Exception as compute_error:  # pylint: disable=W0718
+                error = compute_error
+        if error is not None:
+            print(f"write_levels_table: {ticker=} skipped, {error=}")
+            errors[ticker] = error
+
+    res = pd.concat(levels, ignore_index=True) if len(levels) > 0 else pd.DataFrame()
+    if file_name.endswith(".parquet"):
+        res.to_parquet(file_name, index=False)
+    else:
+        res.to_csv(file_name, index=False)
+    return res
@@ -1,3 +1,47 @@
-from .atr import add_atr_col_to_df
+from .anchored_vwap import (
+    AnchoredVWAPState,
+    anchored_vwaps_and_stds_from_arrays,
+    anchored_vwaps_from_arrays,
+    compute_anchored_vwaps,
+    get_anchor_positions,
+    get_typical_x_volume,
+    get_vwap_band_column,
+)
+from .atr import StreamingATR, add_atr_col_to_df, get_atr_arrays
 from .chart_annotation import get_chart_annotation_1d
-from .fill_min_max import fill_is_min_max
+from .decimation import decimate_line, decimate_ohlc, lttb_indices
+from .fill_min_max import (
+    MinMaxCheckpoint,
+    fill_is_min_max,
+    find_min_max_positions,
+    update_min_max_checkpoint_file,
+)
+from .image_export import BatchImageExporter, get_image_format, write_images_batch
+from .indicators import (
+    StreamingEMA,
+    StreamingRollingMean,
+    StreamingTrueRange,
+    ema,
+    rolling_mean,
+    true_range,
+    wilder_average,
+)
+
+# NOTE agg_chart is not imported here, it loads matplotlib.
+# Import it from misc.agg_chart where the Agg charts are drawn.
+from .plotly_colors import PLOTLY_COLORWAY, PLOTLY_PLOT_BGCOLOR
+from .ratio_matrix import (
+    RATIO_WEIGHTS,
+    AlignedBars,
+    RatioMatrix,
+    align_bars,
+    compute_ratio_matrix,
+)
+from .spans import (
+    SpanRecorder,
+    get_span_recorder,
+    profiling,
+    record_spans,
+    span,
+    span_labels,
+)
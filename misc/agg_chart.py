@@ -0,0 +1,153 @@
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from matplotlib.axes import Axes
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.colors import to_rgba
+from matplotlib.ticker import FuncFormatter, MaxNLocator
+
+from .plotly_colors import PLOTLY_DECREASING_COLOR, PLOTLY_INCREASING_COLOR
+
+_HOUR_NS = 3600 * 10**9
+_DAY_NS = 24 * _HOUR_NS
+
+
+def draw_candles(
+    ax: Axes,
+    x: np.ndarray,
+    open_values: np.ndarray,
+    high: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray,
+    width: float = 0.8,
+    increasing_color: str = PLOTLY_INCREASING_COLOR,
+    decreasing_color: str = PLOTLY_DECREASING_COLOR,
+) -> Tuple[LineCollection, PolyCollection]:
+    """
+    Draw all candles with two collections, one for the wicks
+    and one for the bodies, instead of two artists per candle.
+    Their vertices are built with array operations.
+    Bars with NaN prices are skipped.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    open_values = np.asarray(open_values, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    is_valid = ~(
+        np.isnan(open_values) | np.isnan(high) | np.isnan(low) | np.isnan(close)
+    )
+    x = x[is_valid]
+    open_values = open_values[is_valid]
+    high = high[is_valid]
+    low = low[is_valid]
+    close = close[is_valid]
+
+    colors = np.where(
+        (close >= open_values)[:, None],
+        np.array(to_rgba(increasing_color)),
+        np.array(to_rgba(decreasing_color)),
+    )
+    wicks = np.empty((x.shape[0], 2, 2), dtype=np.float64)
+    wicks[:, :, 0] = x[:, None]
+    wicks[:, 0, 1] = low
+    wicks[:, 1, 1] = high
+    bottom = np.minimum(open_values, close)
+    top = np.maximum(open_values, close)
+    left = x - width / 2
+    right = x + width / 2
+    bodies = np.empty((x.shape[0], 4, 2), dtype=np.float64)
+    bodies[:, 0] = np.column_stack([left, bottom])
+    bodies[:, 1] = np.column_stack([left, top])
+    bodies[:, 2] = np.column_stack([right, top])
+    bodies[:, 3] = np.column_stack([right, bottom])
+
+    # NOTE Like in Plotly, the bodies are filled with a half-transparent color
+    fill_colors = colors.copy()
+    fill_colors[:, 3] = 0.5
+    wick_collection = LineCollection(wicks, colors=colors, linewidths=1)  # type: ignore
+    body_collection = PolyCollection(
+        bodies, facecolors=fill_colors, edgecolors=colors, linewidths=1  # type: ignore
+    )
+    ax.add_collection(wick_collection)
+    ax.add_collection(body_collection)
+    if x.shape[0] > 0:
+        ax.update_datalim([(x.min() - width, low.min()), (x.max() + width, high.max())])
+        ax.autoscale_view()
+    return wick_collection, body_collection
+
+
+def get_chart_x(
+    index: pd.DatetimeIndex, hidden_hours: Optional[Sequence[float]] = None
+) -> np.ndarray:
+    """
+    Get the x coordinates of the bars of index, with the time removed
+    that the rangebreaks of the Plotly chart hide: the weekends,
+    from Saturday to Monday, and if hidden_hours are passed,
+    the hours from hidden_hours[0] to hidden_hours[1], e.g. [21, 13.5].
+    The other gaps take space like in the Plotly chart:
+    holidays, missing bars, and the nights if no hours are hidden.
+    The unit is the usual distance between neighboring bars,
+    so the candles are about 1 wide. The first bar is at 0.
+    """
+    if len(index) == 0:
+        return np.empty(0, dtype=np.float64)
+    timestamps = index.as_unit("ns").asi8
+    days = timestamps // _DAY_NS
+    time_of_day = timestamps - days * _DAY_NS
+    dates = days.astype("datetime64[D]")
+    visible_day_ns = _DAY_NS
+    visible_time = time_of_day
+    if hidden_hours is not None:
+        hidden_start = int(hidden_hours[0] * _HOUR_NS)
+        hidden_end = int(hidden_hours[1] * _HOUR_NS)
+        if hidden_start > hidden_end:
+            # NOTE The hidden hours go past midnight, e.g. from 21:00 to 13:30
+            visible_day_ns = hidden_start - hidden_end
+            visible_time = np.clip(time_of_day - hidden_end, 0, visible_day_ns)
+        else:
+            visible_day_ns = _DAY_NS - (hidden_end - hidden_start)
+            visible_time = time_of_day - np.clip(
+                time_of_day - hidden_start, 0, hidden_end - hidden_start
+            )
+    # NOTE The bars on weekends, if any, are put at the end of Friday
+    visible_time = np.where(np.is_busday(dates), visible_time, 0)
+    res = (
+        np.busday_count(dates[0], dates).astype(np.float64) * visible_day_ns
+        + visible_time
+    )
+    res -= res[0]
+    steps = np.diff(res)
+    steps = steps[steps > 0]
+    if steps.shape[0] > 0:
+        res /= np.median(steps)
+    return res
+
+
+def set_position_axis_dates(
+    ax: Axes,
+    index: pd.DatetimeIndex,
+    date_format: str = "%Y-%m-%d",
+    x: Optional[np.ndarray] = None,
+) -> None:
+    """
+    The bars are drawn at the x coordinates of get_chart_x
+    or at their positions 0, 1, 2, ... if x is None, instead of their dates.
+    Label the ticks of such an x axis with the dates of the nearest bars.
+    """
+    if x is None:
+        x = np.arange(len(index), dtype=np.float64)
+
+    def _format(value: float, _) -> str:
+        if len(index) == 0 or value < x[0] - 0.5 or value > x[-1] + 0.5:
+            return ""
+        position = int(np.searchsorted(x, value))
+        if position == len(index) or (
+            position > 0 and value - x[position - 1] < x[position] - value
+        ):
+            position -= 1
+        return index[position].strftime(date_format)
+
+    ax.xaxis.set_major_locator(MaxNLocator(nbins=6, integer=True))
+    ax.xaxis.set_major_formatter(FuncFormatter(_format))
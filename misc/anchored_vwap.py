@@ -0,0 +1,459 @@
+import bisect
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+
+def get_typical_x_volume(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Get typical price multiplied by volume and volume as float64 arrays.
+    Reuse the Typical and TypicalMultiplyVolume columns if they are present.
+    """
+    volume = df["Volume"].to_numpy(dtype=np.float64)
+    if "TypicalMultiplyVolume" in df.columns:
+        typical_x_volume = df["TypicalMultiplyVolume"].to_numpy(dtype=np.float64)
+    else:
+        if "Typical" in df.columns:
+            typical = df["Typical"].to_numpy(dtype=np.float64)
+        else:
+            # NOTE The same operations as (Open + High + Low + Close) / 4,
+            # without a temporary array for each of them
+            typical = df["Open"].to_numpy(dtype=np.float64) + df["High"].to_numpy(
+                dtype=np.float64
+            )
+            typical += df["Low"].to_numpy(dtype=np.float64)
+            typical += df["Close"].to_numpy(dtype=np.float64)
+            typical /= 4
+        typical_x_volume = typical * volume
+    return typical_x_volume, volume
+
+
+def get_anchor_positions(
+    index: pd.DatetimeIndex, anchors: Iterable[pd.Timestamp]
+) -> np.ndarray:
+    """
+    For every anchor, get the position of the first bar
+    with timestamp greater than or equal to the anchor.
+    The position equals len(index) if the anchor is after the last bar
+    or is NaT, e.g. if no last min or max was found.
+    The index must be sorted in ascending order.
+    """
+    anchors_index = pd.DatetimeIndex(list(anchors))
+    if len(anchors_index) == 0:
+        return np.empty(0, dtype=np.int64)
+    res = index.searchsorted(anchors_index, side="left").astype(np.int64)
+    res[anchors_index.isna()] = len(index)
+    return res
+
+
+def _anchored_vwaps_from_cumsums(
+    cum_tpv: np.ndarray,
+    cum_vol: np.ndarray,
+    bar_is_nan: np.ndarray,
+    anchor_positions: np.ndarray,
+    first_position: int = 0,
+) -> np.ndarray:
+    """
+    Get the anchored VWAPs array from the running sums,
+    for the bars from first_position on.
+    The running sums are N or N x P arrays, the result is N x K or N x P x K.
+    """
+    # Prepend zero, so that base_*[k] is the sum of all bars before anchor k
+    zeros = np.zeros((1,) + cum_tpv.shape[1:])
+    base_tpv = np.moveaxis(np.concatenate((zeros, cum_tpv))[anchor_positions], 0, -1)
+    base_vol = np.moveaxis(np.concatenate((zeros, cum_vol))[anchor_positions], 0, -1)
+
+    res = cum_tpv[first_position:, ..., None] - base_tpv[None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        res /= cum_vol[first_position:, ..., None] - base_vol[None]
+    for counter, anchor_position in enumerate(anchor_positions):
+        res[: max(anchor_position - first_position, 0), ..., counter] = np.nan
+    res[bar_is_nan[first_position:]] = np.nan
+    return res
+
+
+def anchored_vwaps_from_arrays(
+    typical_x_volume: np.ndarray,
+    volume: np.ndarray,
+    anchor_positions: np.ndarray,
+    first_position: int = 0,
+) -> np.ndarray:
+    """
+    Calculate anchored VWAPs for many anchors in one pass.
+    Returns an N x K array, where N is the number of bars
+    and K is the number of anchor positions.
+    Values before the anchor position are NaN.
+    If first_position is passed, the rows before it are not computed,
+    e.g. the bars before the chart start, and N is smaller by first_position.
+
+    Both cumulative sums are taken once. The VWAP of an anchor
+    is the difference of the cumulative sums
+    at the current bar and just before the anchor.
+    typical_x_volume and volume may also be N x P arrays of P series
+    on the same bars, e.g. the pairs of RatioMatrix,
+    then the result is an N x P x K array.
+    """
+    # NOTE Like pandas cumsum, skip NaN values in the running sums,
+    # but keep NaN in the result for the bars where the input is NaN.
+    return _anchored_vwaps_from_cumsums(
+        cum_tpv=np.nancumsum(typical_x_volume, axis=0),
+        cum_vol=np.nancumsum(volume, axis=0),
+        bar_is_nan=np.isnan(typical_x_volume) | np.isnan(volume),
+        anchor_positions=anchor_positions,
+        first_position=first_position,
+    )
+
+
+def get_vwap_band_column(anchor_number: int, multiplier: float, side: str) -> str:
+    """
+    Name of the column of the VWAP band of the A_VWAP_{anchor_number} column,
+    multiplier standard deviations above (side UP) or below (side DN) it,
+    e.g. VWAP_BAND_1_UP_2. It doesn't start with A_VWAP_,
+    so the band columns are not taken for VWAPs.
+    """
+    if side not in ("UP", "DN"):
+        raise ValueError(f"get_vwap_band_column: {side=}, must be UP or DN")
+    return f"VWAP_BAND_{anchor_number}_{side}_{multiplier:g}"
+
+
+def anchored_vwaps_and_stds_from_arrays(
+    typical_x_volume: np.ndarray,
+    volume: np.ndarray,
+    anchor_positions: np.ndarray,
+    first_position: int = 0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calculate anchored VWAPs and the volume-weighted standard deviations
+    of the typical price since every anchor, for the VWAP bands.
+    Returns two N x K arrays like anchored_vwaps_from_arrays,
+    the VWAPs are equal to its result.
+
+    The VWAPs are taken from the cumulative sums once, like there.
+    The sums for the variance are taken per anchor, from the anchor on:
+    volume and volume * (squared) deviation of the typical price
+    from a shift. The variance is E[deviation^2] - E[deviation]^2
+    over the bars since the anchor.
+    NOTE With the raw prices instead of the deviations, E[price^2]
+    and E[price]^2 are nearly equal, and their difference loses most digits
+    when the deviation is small relative to the price, e.g. for 1-minute bars.
+    The shift of each anchor is the typical price of its first bar
+    with volume, so the deviations stay small since the anchor,
+    and the standard deviation at that bar is exactly 0.
+    A single shift and the sums over the whole history minus the sums
+    before the anchor would cancel the same way for late anchors
+    of a long history.
+    """
+    bar_is_nan = np.isnan(typical_x_volume) | np.isnan(volume)
+    vwaps = _anchored_vwaps_from_cumsums(
+        cum_tpv=np.nancumsum(typical_x_volume),
+        cum_vol=np.nancumsum(volume),
+        bar_is_nan=bar_is_nan,
+        anchor_positions=anchor_positions,
+        first_position=first_position,
+    )
+    is_summed = ~bar_is_nan & (volume > 0)
+    weights = np.where(is_summed, volume, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        typical = np.where(is_summed, typical_x_volume / volume, 0.0)
+    stds = np.full(vwaps.shape, np.nan)
+    for counter, anchor_position in enumerate(anchor_positions):
+        summed_positions = np.flatnonzero(is_summed[anchor_position:])
+        if summed_positions.shape[0] == 0:
+            continue
+        shift = typical[anchor_position + summed_positions[0]]
+        deviation = np.where(
+            is_summed[anchor_position:], typical[anchor_position:] - shift, 0.0
+        )
+        weighted_deviation = weights[anchor_position:] * deviation
+        cum_weight = np.cumsum(weights[anchor_position:])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean_deviation = np.cumsum(weighted_deviation) / cum_weight
+            variance = np.cumsum(weighted_deviation * deviation) / cum_weight
+        variance -= mean_deviation**2
+        # NOTE Rounding can make a zero variance slightly negative
+        np.maximum(variance, 0.0, out=variance)
+        skipped_count = max(first_position - anchor_position, 0)
+        stds[max(anchor_position - first_position, 0) :, counter] = np.sqrt(
+            variance[skipped_count:]
+        )
+    stds[bar_is_nan[first_position:]] = np.nan
+    return vwaps, stds
+
+
+def compute_anchored_vwaps(
+    df: pd.DataFrame,
+    anchors: Iterable[pd.Timestamp],
+    as_frame: bool = True,
+) -> Union[pd.DataFrame, np.ndarray]:
+    """
+    Calculate anchored VWAPs for all anchors.
+    The df must have the Volume column
+    and either TypicalMultiplyVolume, Typical or OHLC columns.
+    The anchors must be comparable with the df index.
+
+    Return a DataFrame with columns A_VWAP_1 ... A_VWAP_K
+    in the order of the anchors, or an N x K array if as_frame is False.
+    The cost grows with the number of bars plus the number of anchors.
+    """
+    if not df.index.is_monotonic_increasing:
+        raise ValueError("compute_anchored_vwaps: df index must be sorted ascending")
+    anchors_list: List[pd.Timestamp] = list(anchors)
+    typical_x_volume, volume = get_typical_x_volume(df)
+    anchor_positions = get_anchor_positions(index=df.index, anchors=anchors_list)  # type: ignore
+    res = anchored_vwaps_from_arrays(
+        typical_x_volume=typical_x_volume,
+        volume=volume,
+        anchor_positions=anchor_positions,
+    )
+    if not as_frame:
+        return res
+    return pd.DataFrame(
+        res,
+        index=df.index,
+        columns=[f"A_VWAP_{counter}" for counter in range(1, len(anchors_list) + 1)],
+    )
+
+
+def _to_naive_timestamp(value) -> pd.Timestamp:
+    """
+    Convert to pd.Timestamp without timezone,
+    the same way vwaps_plot_build_save converts the df index.
+    """
+    res = pd.Timestamp(value)
+    if res.tzinfo is not None:
+        res = res.tz_convert(None)
+    return res
+
+
+class AnchoredVWAPState:
+    """
+    Running sums for many anchored VWAPs, updated bar by bar.
+    Every new bar costs O(K) work, where K is the number of anchors.
+
+    The state keeps the cumulative sums of typical price * volume
+    and of volume for every bar received. For every anchor,
+    it keeps the sums just before the anchor bar,
+    so the running sums of the anchor are the difference.
+    The arithmetic is the same as in compute_anchored_vwaps,
+    so the values are equal to the vwaps_plot_build_save output.
+
+    Timestamps with timezone are converted to UTC without timezone,
+    like in vwaps_plot_build_save.
+    """
+
+    def __init__(self, anchors: Iterable = ()):
+        self._timestamps: List[pd.Timestamp] = list()
+        self._cum_tpv: List[float] = list()
+        self._cum_vol: List[float] = list()
+        self._bar_is_nan: List[bool] = list()
+
+        # anchor -> position of the anchor bar, None if the anchor is not reached yet
+        self._anchor_positions: Dict[pd.Timestamp, Optional[int]] = dict()
+        for anchor in anchors:
+            self.add_anchor(anchor)
+
+    @property
+    def anchors(self) -> List[pd.Timestamp]:
+        """
+        Anchors in the order of A_VWAP_1 ... A_VWAP_K columns.
+        """
+        return list(self._anchor_positions.keys())
+
+    def __len__(self) -> int:
+        return len(self._timestamps)
+
+    def _get_base(self, position: int) -> Tuple[float, float]:
+        if position == 0:
+            return 0.0, 0.0
+        return self._cum_tpv[position - 1], self._cum_vol[position - 1]
+
+    def add_anchor(self, anchor) -> None:
+        """
+        Add anchor. If it is in the past, find its bar among the bars received.
+        """
+        anchor_ts = _to_naive_timestamp(anchor)
+        if anchor_ts in self._anchor_positions:
+            return
+        position: Optional[int] = bisect.bisect_left(self._timestamps, anchor_ts)
+        if position == len(self._timestamps):
+            position = None
+        self._anchor_positions[anchor_ts] = position
+
+    def remove_anchor(self, anchor) -> None:
+        del self._anchor_positions[_to_naive_timestamp(anchor)]
+
+    def _append(
+        self, timestamp: pd.Timestamp, typical_x_volume: float, volume: float
+    ) -> None:
+        if len(self._timestamps) > 0 and timestamp <= self._timestamps[-1]:
+            if timestamp < self._timestamps[-1]:
+                raise ValueError(
+                    f"AnchoredVWAPState: {timestamp=} is before the last bar {self._timestamps[-1]}"
+                )
+            # NOTE The last bar of the live data is often updated
+            # until it is complete, so replace it.
+            # The anchor sums before the last bar remain the same.
+            self._timestamps.pop()
+            self._cum_tpv.pop()
+            self._cum_vol.pop()
+            self._bar_is_nan.pop()
+
+        position = len(self._timestamps)
+        prev_tpv, prev_vol = self._get_base(position)
+        bar_is_nan = bool(np.isnan(typical_x_volume) or np.isnan(volume))
+        self._timestamps.append(timestamp)
+        self._cum_tpv.append(
+            prev_tpv + (0.0 if np.isnan(typical_x_volume) else typical_x_volume)
+        )
+        self._cum_vol.append(prev_vol + (0.0 if np.isnan(volume) else volume))
+        self._bar_is_nan.append(bar_is_nan)
+
+        for anchor, anchor_position in self._anchor_positions.items():
+            if anchor_position is None and timestamp >= anchor:
+                self._anchor_positions[anchor] = position
+
+    def update(self, bar: pd.Series, timestamp=None) -> None:
+        """
+        Add one bar, e.g. a row of iterrows().
+        If timestamp is None, bar.name is used.
+        A bar with the same timestamp as the last bar replaces it.
+        """
+        if timestamp is None:
+            timestamp = bar.name
+        volume = float(bar["Volume"])
+        if "TypicalMultiplyVolume" in bar.index:
+            typical_x_volume = float(bar["TypicalMultiplyVolume"])
+        else:
+            if "Typical" in bar.index:
+                typical = float(bar["Typical"])
+            else:
+                typical = (
+                    float(bar["Open"])
+                    + float(bar["High"])
+                    + float(bar["Low"])
+                    + float(bar["Close"])
+                ) / 4
+            typical_x_volume = typical * volume
+        self._append(
+            timestamp=_to_naive_timestamp(timestamp),
+            typical_x_volume=typical_x_volume,
+            volume=volume,
+        )
+
+    def extend(self, bars_df: pd.DataFrame) -> None:
+        """
+        Add many bars. The bars_df must be sorted by its index.
+        Bars that are not newer than the last bar received are skipped,
+        except the last one, which is replaced.
+        """
+        if bars_df.shape[0] == 0:
+            return
+        index = bars_df.index
+        if isinstance(index, pd.DatetimeIndex) and index.tz is not None:
+            index = index.tz_convert(None)
+        if len(self._timestamps) > 0:
+            new_bars_mask = index >= self._timestamps[-1]
+            bars_df = bars_df[new_bars_mask]
+            index = index[new_bars_mask]
+            if bars_df.shape[0] == 0:
+                return
+            if index[0] == self._timestamps[-1]:
+                self.update(bars_df.iloc[0], timestamp=index[0])
+                bars_df = bars_df.iloc[1:]
+                index = index[1:]
+                if bars_df.shape[0] == 0:
+                    return
+
+        typical_x_volume, volume = get_typical_x_volume(bars_df)
+        start_position = len(self._timestamps)
+        prev_tpv, prev_vol = self._get_base(start_position)
+
+        # NOTE Start the cumulative sums from the previous totals,
+        # so that the additions happen in the same order
+        # as in compute_anchored_vwaps over the whole history.
+        cum_tpv = np.nancumsum(np.concatenate(([prev_tpv], typical_x_volume)))[1:]
+        cum_vol = np.nancumsum(np.concatenate(([prev_vol], volume)))[1:]
+        bar_is_nan = np.isnan(typical_x_volume) | np.isnan(volume)
+
+        self._timestamps.extend(pd.DatetimeIndex(index))
+        self._cum_tpv.extend(cum_tpv.tolist())
+        self._cum_vol.extend(cum_vol.tolist())
+        self._bar_is_nan.extend(bar_is_nan.tolist())
+
+        for anchor, anchor_position in self._anchor_positions.items():
+            if anchor_position is None:
+                position = index.searchsorted(anchor, side="left")
+                if position < len(index):
+                    self._anchor_positions[anchor] = start_position + int(position)
+
+    def current_values(self) -> pd.Series:
+        """
+        Get the anchored VWAPs of the last bar.
+        NaN if the anchor is not reached yet.
+        """
+        res = dict()
+        for counter, (anchor, position) in enumerate(
+            self._anchor_positions.items(), start=1
+        ):
+            value = np.nan
+            if position is not None and not self._bar_is_nan[-1]:
+                base_tpv, base_vol = self._get_base(position)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    value = np.float64(self._cum_tpv[-1] - base_tpv) / np.float64(
+                        self._cum_vol[-1] - base_vol
+                    )
+            res[f"A_VWAP_{counter}"] = value
+        return pd.Series(res, dtype=np.float64)
+
+    def tail_values(self, bars_count: int) -> np.ndarray:
+        """
+        Get the anchored VWAPs of the last bars_count bars
+        as an array with the columns of history().
+        Only those bars are computed, so the work doesn't grow with the history.
+        """
+        bars_count = min(bars_count, len(self._timestamps))
+        first_position = len(self._timestamps) - bars_count
+        cum_tpv = np.array(self._cum_tpv[first_position:], dtype=np.float64)
+        cum_vol = np.array(self._cum_vol[first_position:], dtype=np.float64)
+        bar_is_nan = np.array(self._bar_is_nan[first_position:], dtype=bool)
+        res = np.full((bars_count, len(self._anchor_positions)), np.nan)
+        for counter, position in enumerate(self._anchor_positions.values()):
+            if position is None:
+                continue
+            base_tpv, base_vol = self._get_base(position)
+            start = max(position - first_position, 0)
+            # NOTE The same arithmetic as _anchored_vwaps_from_cumsums,
+            # so the values are equal to those of history()
+            with np.errstate(divide="ignore", invalid="ignore"):
+                res[start:, counter] = (cum_tpv[start:] - base_tpv) / (
+                    cum_vol[start:] - base_vol
+                )
+        res[bar_is_nan] = np.nan
+        return res
+
+    def history(self) -> pd.DataFrame:
+        """
+        Get the anchored VWAPs of all bars received,
+        with columns A_VWAP_1 ... A_VWAP_K in the order of anchors.
+        """
+        anchor_positions = np.array(
+            [
+                len(self._timestamps) if position is None else position
+                for position in self._anchor_positions.values()
+            ],
+            dtype=np.int64,
+        )
+        res = _anchored_vwaps_from_cumsums(
+            cum_tpv=np.array(self._cum_tpv, dtype=np.float64),
+            cum_vol=np.array(self._cum_vol, dtype=np.float64),
+            bar_is_nan=np.array(self._bar_is_nan, dtype=bool),
+            anchor_positions=anchor_positions,
+        )
+        return pd.DataFrame(
+            res,
+            index=pd.DatetimeIndex(self._timestamps),
+            columns=[
+                f"A_VWAP_{counter}" for counter in range(1, len(anchor_positions) + 1)
+            ],
+        )
@@ -1,10 +1,55 @@
+from typing import Tuple, Union
+
+import numpy as np
 import pandas as pd
 
 from constants import ATR_SMOOTHING_N
 
+from .indicators import (
+    StreamingEMA,
+    StreamingRollingMean,
+    StreamingTrueRange,
+    ema,
+    rolling_mean,
+    true_range,
+)
+
+
+def get_atr_arrays(
+    high: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray,
+    n: int = ATR_SMOOTHING_N,
+    exponential: bool = False,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Get the tr and atr_{n} columns of add_atr_col_to_df as float64 arrays.
+    """
+    tr = true_range(
+        high=np.asarray(high, dtype=np.float64),
+        low=np.asarray(low, dtype=np.float64),
+        close=np.asarray(close, dtype=np.float64),
+    )
+    np.round(tr, 2, out=tr)
+
+    # today use yesterday's ATR -
+    # this operation is currently essential, maybe remove later
+    tr[1:] = tr[:-1].copy()
+    tr[:1] = np.nan
+
+    if exponential:
+        atr = ema(values=tr, alpha=2 / (n + 1), min_periods=n)
+    else:
+        atr = rolling_mean(values=tr, window=n)
+    np.round(atr, 2, out=atr)
+    return tr, atr
+
 
 def add_atr_col_to_df(
-    df: pd.DataFrame, n: int = ATR_SMOOTHING_N, exponential: bool = False
+    df: pd.DataFrame,
+    n: int = ATR_SMOOTHING_N,
+    exponential: bool = False,
+    inplace: bool = False,
 ) -> pd.DataFrame:
     """
     Add ATR (Average True Range) column to DataFrame.
@@ -14,31 +59,50 @@ def add_atr_col_to_df(
     use ewm - exponentially weighted values,
     to give more weight to the recent data point.
     Otherwise, calculate simple moving average.
+    If inplace is true, add the columns to df itself and return it.
     """
 
-    data = df.copy(deep=True)
-    high = data["High"]
-    low = data["Low"]
-    close = data["Close"]
-    data["tr0"] = abs(high - low)
-    data["tr1"] = abs(high - close.shift())
-    data["tr2"] = abs(low - close.shift())
-    data["tr"] = data[["tr0", "tr1", "tr2"]].max(axis=1)
-    data["tr"] = round(data["tr"], 2)
+    # NOTE The shallow copy shares the OHLC data with df,
+    # the new columns are added to the copy only
+    data = df if inplace else df.copy(deep=False)
+    tr, atr = get_atr_arrays(
+        high=data["High"].to_numpy(dtype=np.float64),
+        low=data["Low"].to_numpy(dtype=np.float64),
+        close=data["Close"].to_numpy(dtype=np.float64),
+        n=n,
+        exponential=exponential,
+    )
+    data["tr"] = tr
+    data[f"atr_{n}"] = atr
+    return data
 
-    # today use yesterday's ATR -
-    # this operation is currently essential, maybe remove later
-    data["tr"] = data["tr"].shift()
 
-    if exponential:
-        data[f"atr_{n}"] = (
-            data["tr"].ewm(alpha=2 / (n + 1), min_periods=n, adjust=False).mean()
+class StreamingATR:
+    """
+    ATR updated bar by bar, the values are equal to
+    the column added by add_atr_col_to_df with the same parameters.
+    Like there, the ATR of a bar uses the true ranges of the previous bars.
+    """
+
+    def __init__(self, n: int = ATR_SMOOTHING_N, exponential: bool = False):
+        self.n = n
+        self.exponential = exponential
+        self._true_range = StreamingTrueRange()
+        self._average: Union[StreamingEMA, StreamingRollingMean] = (
+            StreamingEMA(alpha=2 / (n + 1), min_periods=n)
+            if exponential
+            else StreamingRollingMean(window=n)
         )
-    else:
-        data[f"atr_{n}"] = data["tr"].rolling(window=n, min_periods=n).mean()
-    data[f"atr_{n}"] = round(data[f"atr_{n}"], 2)
-    del data["tr0"]
-    del data["tr1"]
-    del data["tr2"]
-    # del data["tr"]
-    return data
+        self._previous_tr = np.nan
+        self.value = np.nan
+
+    def update(self, high: float, low: float, close: float) -> float:
+        """
+        Add the next bar, return its ATR.
+        """
+        # NOTE np.round, not round, to get the same results as the arrays
+        self.value = float(np.round(self._average.update(self._previous_tr), 2))
+        self._previous_tr = float(
+            np.round(self._true_range.update(high=high, low=low, close=close), 2)
+        )
+        return self.value
@@ -2,10 +2,16 @@ import pandas as pd
 
 from constants import ATR_SMOOTHING_N
 
+from .anchored_vwap import get_vwap_band_column
 
-def get_chart_annotation_1d(df: pd.DataFrame) -> str:
+
+def get_chart_annotation_1d(df: pd.DataFrame, add_bands: bool = True) -> str:
     """
-    Get custom chart annotation for OHLC daily (1d) charts
+    Get custom chart annotation for OHLC daily (1d) charts.
+    If df has VWAP band columns and add_bands is True,
+    the last values of the bands are added, see get_vwap_band_column.
+    Pass functools.partial(get_chart_annotation_1d, add_bands=False)
+    as chart_annotation_func to leave them out.
     """
     # TODO Create custom chart annotation function for intraday charts
     vwap_values = list()
@@ -16,6 +22,10 @@ def get_chart_annotation_1d(df: pd.DataFrame) -> str:
     res_to_return = (
         res_to_return + "; Closed last: " + str(round(df[f"Close"].values[-1], 2))
     )
+    if add_bands:
+        res_to_return = res_to_return + _get_bands_annotation(
+            df=df, vwaps_count=len(vwap_columns)
+        )
 
     # NOTE You can add additional information to the annotation here,
     # or write your own custom function
@@ -36,3 +46,39 @@ def get_chart_annotation_1d(df: pd.DataFrame) -> str:
     ):
         res_to_return = res_to_return + "<br>" + str(df.attrs["note"])
     return res_to_return
+
+
+def _get_bands_annotation(df: pd.DataFrame, vwaps_count: int) -> str:
+    """
+    Last values of the VWAP bands, DN and UP pairs
+    in the order of the VWAPs last values.
+    """
+    multipliers = sorted(
+        {
+            float(column.rsplit("_", 1)[1])
+            for column in df.columns
+            if column.startswith("VWAP_BAND_")
+        }
+    )
+    res = ""
+    for multiplier in multipliers:
+        bands = list()
+        for anchor_number in range(1, vwaps_count + 1):
+            dn_column = get_vwap_band_column(anchor_number, multiplier, "DN")
+            up_column = get_vwap_band_column(anchor_number, multiplier, "UP")
+            if dn_column not in df.columns or up_column not in df.columns:
+                continue
+            bands.append(
+                (
+                    round(float(df[dn_column].iloc[-1]), 2),
+                    round(float(df[up_column].iloc[-1]), 2),
+                    float(df[f"A_VWAP_{anchor_number}"].iloc[-1]),
+                )
+            )
+        if len(bands) == 0:
+            continue
+        bands.sort(key=lambda band: band[2])
+        res = (
+            res + f"; {multiplier:g} sigma bands: " + str([band[:2] for band in bands])
+        )
+    return res
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+
+def decimate_ohlc(df: pd.DataFrame, max_points: int) -> pd.DataFrame:
+    """
+    Merge consecutive bars into at most max_points OHLC buckets:
+    first Open, max High, min Low, last Close, sum of Volume.
+    The bucket gets the timestamp of its first bar.
+    Highs and lows are preserved, so the extremes stay visible on the chart.
+    """
+    bars_count = df.shape[0]
+    if max_points <= 0:
+        raise ValueError(f"decimate_ohlc: {max_points=} must be positive")
+    if bars_count <= max_points:
+        return df
+    bucket_size = int(np.ceil(bars_count / max_points))
+    starts = np.arange(0, bars_count, bucket_size)
+    ends = np.append(starts[1:], bars_count) - 1
+    data = {
+        "Open": df["Open"].to_numpy()[starts],
+        "High": np.fmax.reduceat(df["High"].to_numpy(dtype=np.float64), starts),
+        "Low": np.fmin.reduceat(df["Low"].to_numpy(dtype=np.float64), starts),
+        "Close": df["Close"].to_numpy()[ends],
+    }
+    if "Volume" in df.columns:
+        data["Volume"] = np.add.reduceat(
+            np.nan_to_num(df["Volume"].to_numpy(dtype=np.float64)), starts
+        )
+    res = pd.DataFrame(data, index=df.index[starts])
+    res.attrs = dict(df.attrs)
+    return res
+
+
+def _lttb_selection(x: np.ndarray, y: np.ndarray, points_count: int) -> np.ndarray:
+    """
+    Indices of points_count points of x and y selected by LTTB, points_count >= 3.
+    """
+    # The first and the last points are buckets on their own
+    bucket_edges = np.linspace(1, len(y) - 1, points_count - 1).astype(np.int64)
+    res = np.empty(points_count, dtype=np.int64)
+    res[0] = 0
+    res[-1] = len(y) - 1
+    previous = 0
+    for counter in range(points_count - 2):
+        start, end = bucket_edges[counter], bucket_edges[counter + 1]
+        if counter + 2 < len(bucket_edges):
+            next_start, next_end = end, bucket_edges[counter + 2]
+            next_x = x[next_start:next_end].mean()
+            next_y = y[next_start:next_end].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        # Twice the area of the triangle (previous point, candidate, next bucket average)
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        res[counter + 1] = previous
+    return res
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling of a line.
+    Return sorted indices of at most max_points points that keep its shape.
+    The first and the last points are always kept. If max_points is 5 or more,
+    LTTB selects max_points - 2 points, and the global minimum and maximum
+    are added to them.
+    x must be increasing, y must not contain NaN.
+    """
+    points_count = len(y)
+    if points_count <= max_points or max_points < 3:
+        return np.arange(points_count)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if max_points < 5:
+        return _lttb_selection(x=x, y=y, points_count=max_points)
+    res = _lttb_selection(x=x, y=y, points_count=max_points - 2)
+    return np.unique(np.concatenate((res, [np.argmin(y), np.argmax(y)])))
+
+
+def decimate_line(series: pd.Series, max_points: int) -> pd.Series:
+    """
+    Downsample a line with LTTB, skipping NaN values,
+    e.g., the bars before the anchor of a VWAP.
+    """
+    series = series.dropna()
+    if series.shape[0] <= max_points:
+        return series
+    x = series.index.to_numpy()
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype("datetime64[ns]").astype(np.int64)
+    indices = lttb_indices(x=x, y=series.to_numpy(), max_points=max_points)
+    return series.iloc[indices]
@@ -1,9 +1,134 @@
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
 import pandas as pd
 
 from constants import ATR_MULTIPLIER, ATR_SMOOTHING_N
 
 from .atr import add_atr_col_to_df
 
+try:
+    from numba import njit
+except ImportError:
+    # NOTE numba is optional. Without it, the plain Python loop over
+    # NumPy arrays is used. It is much faster than iterrows anyway.
+    njit = None
+
+
+def _find_min_max_flags_py(
+    close: np.ndarray,
+    atr: np.ndarray,
+    atr_multiplier: float,
+    looking_for_max: bool,
+    candidate_position: int,
+    candidate_price: float,
+) -> Tuple[np.ndarray, np.ndarray, bool, int, float, bool]:
+    """
+    Zigzag state machine over Close prices.
+    The candidate extremum is confirmed when the price moves away from it
+    by more than atr_multiplier * ATR of the current bar.
+
+    Start from the given candidate. The candidate_position -1 means
+    that the candidate is before the first bar of the arrays,
+    i.e. it comes from a checkpoint.
+    Return boolean arrays is_min and is_max, the end state
+    and whether the candidate from before the arrays was confirmed.
+    """
+    bars_count = close.shape[0]
+    is_min = np.zeros(bars_count, dtype=np.bool_)
+    is_max = np.zeros(bars_count, dtype=np.bool_)
+    outside_candidate_confirmed = False
+    for i in range(bars_count):
+        price = close[i]
+        if looking_for_max:
+            if price >= candidate_price:
+                candidate_price = price
+                candidate_position = i
+            elif (candidate_price - price) > (atr[i] * atr_multiplier):
+                if candidate_position >= 0:
+                    is_max[candidate_position] = True
+                else:
+                    outside_candidate_confirmed = True
+                looking_for_max = False
+                candidate_position = i
+                candidate_price = price
+        else:
+            if price <= candidate_price:
+                candidate_price = price
+                candidate_position = i
+            elif (price - candidate_price) > (atr[i] * atr_multiplier):
+                if candidate_position >= 0:
+                    is_min[candidate_position] = True
+                else:
+                    outside_candidate_confirmed = True
+                looking_for_max = True
+                candidate_position = i
+                candidate_price = price
+    return (
+        is_min,
+        is_max,
+        looking_for_max,
+        candidate_position,
+        candidate_price,
+        outside_candidate_confirmed,
+    )
+
+
+if njit is not None:
+    _find_min_max_flags = njit(cache=True, nogil=True)(_find_min_max_flags_py)
+else:
+    _find_min_max_flags = _find_min_max_flags_py
+
+
+def _run_min_max_state_machine(
+    close: np.ndarray,
+    atr: np.ndarray,
+    atr_multiplier: float = ATR_MULTIPLIER,
+    use_numba: bool = True,
+    looking_for_max: bool = False,
+    candidate_position: int = 0,
+    candidate_price: Optional[float] = None,
+) -> Tuple[np.ndarray, np.ndarray, bool, int, float, bool]:
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    atr = np.ascontiguousarray(atr, dtype=np.float64)
+    if close.shape != atr.shape:
+        raise ValueError(
+            f"find_min_max_positions: {close.shape=} and {atr.shape=} must be equal"
+        )
+    if candidate_price is None:
+        # Start from the first bar, looking for min is an arbitrary choice
+        candidate_price = close[0] if close.shape[0] > 0 else np.nan
+    find_func = _find_min_max_flags if use_numba else _find_min_max_flags_py
+    return find_func(
+        close,
+        atr,
+        float(atr_multiplier),
+        bool(looking_for_max),
+        int(candidate_position),
+        float(candidate_price),  # type: ignore
+    )
+
+
+def find_min_max_positions(
+    close: np.ndarray,
+    atr: np.ndarray,
+    atr_multiplier: float = ATR_MULTIPLIER,
+    use_numba: bool = True,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find positions of significant minimums and maximums
+    in the Close prices array sorted by time.
+    Return two arrays of positions: minimums and maximums.
+    The numba-compiled version runs if numba is installed and use_numba is True.
+    """
+    is_min, is_max, *_ = _run_min_max_state_machine(
+        close=close, atr=atr, atr_multiplier=atr_multiplier, use_numba=use_numba
+    )
+    return np.flatnonzero(is_min), np.flatnonzero(is_max)
+
 
 def fill_is_min_max(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -11,65 +136,270 @@ def fill_is_min_max(df: pd.DataFrame) -> pd.DataFrame:
     put the True values in the corresponding rows
     of is_min and is_max columns.
     """
+    internal_df, _ = _fill_is_min_max_with_state(df=df)
+    return internal_df
 
-    internal_df = df.copy()
+
+def _fill_is_min_max_with_state(
+    df: pd.DataFrame,
+) -> Tuple[pd.DataFrame, Tuple[bool, int, float]]:
+    """
+    Run fill_is_min_max, also return the end state of the state machine:
+    looking_for_max, candidate position in df and candidate price.
+    """
+    # NOTE The shallow copy shares the data with df,
+    # the new columns are added to the copy only
+    internal_df = df.copy(deep=False)
     internal_df["is_min"] = False
     internal_df["is_max"] = False
     if f"atr_{ATR_SMOOTHING_N}" not in internal_df.columns:
-        internal_df = add_atr_col_to_df(df=internal_df)
-    # if "Typical" not in df.columns:
-    #     internal_df["Typical"] = (df["Open"] + df["High"] + df["Low"] + df["Close"]) / 4
-    start_date = df.index.min()
-    current_candidate = {
-        "extremum_to_detect": "min",  # arbitrary choice
-        "date": start_date,
-        "price_val": internal_df[internal_df.index == start_date]["Close"].values[0],
-    }
-    for i, row in (
-        internal_df[internal_df.index >= current_candidate["date"]]
-        .sort_index()
-        .iterrows()
-    ):
-        if current_candidate["extremum_to_detect"] == "max":
-            if row["Close"] >= current_candidate["price_val"]:
-                current_candidate["price_val"] = row["Close"]
-                current_candidate["date"] = i
-            elif (current_candidate["price_val"] - row["Close"]) > (
-                row[f"atr_{ATR_SMOOTHING_N}"] * ATR_MULTIPLIER
-            ):
-                internal_df.loc[
-                    internal_df.index == current_candidate["date"], "is_max"
-                ] = True
-                current_candidate["extremum_to_detect"] = "min"
-                current_candidate["date"] = i
-                current_candidate["price_val"] = row["Close"]
-
-        else:  # looking for min, current_candidate['extremum_to_detect'] == 'min'
-            if row["Close"] <= current_candidate["price_val"]:
-                current_candidate["price_val"] = row["Close"]
-                current_candidate["date"] = i
-            elif (row["Close"] - current_candidate["price_val"]) > (
-                row[f"atr_{ATR_SMOOTHING_N}"] * ATR_MULTIPLIER
-            ):
-                internal_df.loc[
-                    internal_df.index == current_candidate["date"], "is_min"
-                ] = True
-                current_candidate["extremum_to_detect"] = "max"
-                current_candidate["date"] = i
-                current_candidate["price_val"] = row["Close"]
-
-        # internal_df.loc[internal_df.index == i, "extremum_to_detect"] = (
-        #     current_candidate["extremum_to_detect"]
-        # )
-        # internal_df.loc[internal_df.index == i, "price_val"] = current_candidate[
-        #     "price_val"
-        # ]
-        # internal_df.loc[internal_df.index == i, "extremum_candidate_date"] = (
-        #     current_candidate["date"]
-        # )
-
-    # print(f"{current_candidate['extremum_to_detect']=}")
-    # print(f"{current_candidate['price_val']=}")
-    # print(f"{current_candidate['date']=}")
-    # internal_df.to_csv("temp.csv")
-    return internal_df
+        internal_df = add_atr_col_to_df(df=internal_df, inplace=True)
+
+    close = internal_df["Close"].to_numpy(dtype=np.float64)
+    atr = internal_df[f"atr_{ATR_SMOOTHING_N}"].to_numpy(dtype=np.float64)
+
+    # NOTE The state machine walks the bars in time order.
+    order = None
+    if not internal_df.index.is_monotonic_increasing:
+        order = np.argsort(internal_df.index.to_numpy(), kind="stable")
+        close = close[order]
+        atr = atr[order]
+
+    (
+        is_min_sorted,
+        is_max_sorted,
+        looking_for_max,
+        candidate_position,
+        candidate_price,
+        _,
+    ) = _run_min_max_state_machine(close=close, atr=atr)
+    min_positions = np.flatnonzero(is_min_sorted)
+    max_positions = np.flatnonzero(is_max_sorted)
+    if order is not None:
+        min_positions = order[min_positions]
+        max_positions = order[max_positions]
+        if len(order) > 0:
+            candidate_position = int(order[candidate_position])
+
+    is_min = np.zeros(internal_df.shape[0], dtype=bool)
+    is_max = np.zeros(internal_df.shape[0], dtype=bool)
+    is_min[min_positions] = True
+    is_max[max_positions] = True
+    if not internal_df.index.is_unique:
+        # All rows with the date of the extremum are marked
+        is_min = internal_df.index.isin(internal_df.index[is_min])
+        is_max = internal_df.index.isin(internal_df.index[is_max])
+    internal_df["is_min"] = is_min
+    internal_df["is_max"] = is_max
+    return internal_df, (looking_for_max, candidate_position, candidate_price)
+
+
+def _date_to_str(date: Optional[pd.Timestamp]) -> Optional[str]:
+    if date is None or pd.isna(date):
+        return None
+    return pd.Timestamp(date).isoformat()
+
+
+def _str_to_date(date_str: Optional[str]) -> Optional[pd.Timestamp]:
+    if date_str is None:
+        return None
+    return pd.Timestamp(date_str)
+
+
+@dataclass
+class MinMaxCheckpoint:
+    """
+    End state of the min / max detection, enough to continue it
+    when new bars arrive without going through the whole history again.
+    atr_tail holds High, Low and Close of the last ATR_SMOOTHING_N + 1 bars,
+    this is what the ATR of the next bars depends on.
+    """
+
+    last_bar_date: pd.Timestamp
+    last_bar_close: float
+    extremum_to_detect: str  # "min" or "max"
+    candidate_date: pd.Timestamp
+    candidate_price: float
+    last_min_date: Optional[pd.Timestamp]
+    last_max_date: Optional[pd.Timestamp]
+    atr_tail: pd.DataFrame
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "last_bar_date": _date_to_str(self.last_bar_date),
+            "last_bar_close": self.last_bar_close,
+            "extremum_to_detect": self.extremum_to_detect,
+            "candidate_date": _date_to_str(self.candidate_date),
+            "candidate_price": self.candidate_price,
+            "last_min_date": _date_to_str(self.last_min_date),
+            "last_max_date": _date_to_str(self.last_max_date),
+            "atr_tail": {
+                "index": [_date_to_str(date) for date in self.atr_tail.index],
+                "High": self.atr_tail["High"].tolist(),
+                "Low": self.atr_tail["Low"].tolist(),
+                "Close": self.atr_tail["Close"].tolist(),
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MinMaxCheckpoint":
+        atr_tail = pd.DataFrame(
+            {
+                "High": data["atr_tail"]["High"],
+                "Low": data["atr_tail"]["Low"],
+                "Close": data["atr_tail"]["Close"],
+            },
+            index=pd.DatetimeIndex(
+                [pd.Timestamp(date) for date in data["atr_tail"]["index"]]
+            ),
+            dtype=np.float64,
+        )
+        return cls(
+            last_bar_date=pd.Timestamp(data["last_bar_date"]),
+            last_bar_close=data["last_bar_close"],
+            extremum_to_detect=data["extremum_to_detect"],
+            candidate_date=pd.Timestamp(data["candidate_date"]),
+            candidate_price=data["candidate_price"],
+            last_min_date=_str_to_date(data["last_min_date"]),
+            last_max_date=_str_to_date(data["last_max_date"]),
+            atr_tail=atr_tail,
+        )
+
+    def save(self, file_name: str) -> None:
+        with open(file_name, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    @classmethod
+    def load(cls, file_name: str) -> "MinMaxCheckpoint":
+        with open(file_name, "r", encoding="utf-8") as file:
+            return cls.from_dict(json.load(file))
+
+
+def _last_flag_date(index: pd.Index, flags: np.ndarray) -> Optional[pd.Timestamp]:
+    if not flags.any():
+        return None
+    return index[flags].max()
+
+
+def get_min_max_checkpoint(df: pd.DataFrame) -> MinMaxCheckpoint:
+    """
+    Run the min / max detection over the whole df
+    and return its end state.
+    """
+    if df.shape[0] == 0:
+        raise ValueError("get_min_max_checkpoint: df is empty")
+    internal_df, (looking_for_max, candidate_position, candidate_price) = (
+        _fill_is_min_max_with_state(df=df)
+    )
+    if not internal_df.index.is_monotonic_increasing:
+        internal_df = internal_df.sort_index()
+    return MinMaxCheckpoint(
+        last_bar_date=internal_df.index[-1],
+        last_bar_close=float(internal_df["Close"].iloc[-1]),
+        extremum_to_detect="max" if looking_for_max else "min",
+        candidate_date=df.index[candidate_position],
+        candidate_price=float(candidate_price),
+        last_min_date=_last_flag_date(
+            internal_df.index, internal_df["is_min"].to_numpy()
+        ),
+        last_max_date=_last_flag_date(
+            internal_df.index, internal_df["is_max"].to_numpy()
+        ),
+        atr_tail=internal_df[["High", "Low", "Close"]]
+        .iloc[-(ATR_SMOOTHING_N + 1) :]
+        .astype(np.float64),
+    )
+
+
+def resume_min_max_checkpoint(
+    checkpoint: MinMaxCheckpoint, df: pd.DataFrame
+) -> MinMaxCheckpoint:
+    """
+    Continue the min / max detection from the checkpoint
+    over the bars of df that are newer than checkpoint.last_bar_date.
+    The df may contain the whole history or only the new bars,
+    it must be sorted by its index.
+    The work is proportional to the number of new bars.
+    """
+    new_bars = df.loc[df.index > checkpoint.last_bar_date, ["High", "Low", "Close"]]
+    if new_bars.shape[0] == 0:
+        return checkpoint
+
+    # NOTE The ATR of the new bars is calculated
+    # from the tail of the previous bars, not from the whole history.
+    atr_df = add_atr_col_to_df(
+        df=pd.concat([checkpoint.atr_tail, new_bars.astype(np.float64)])
+    )
+    atr = atr_df[f"atr_{ATR_SMOOTHING_N}"].to_numpy()[checkpoint.atr_tail.shape[0] :]
+
+    looking_for_max = checkpoint.extremum_to_detect == "max"
+    (
+        is_min,
+        is_max,
+        looking_for_max_new,
+        candidate_position,
+        candidate_price,
+        outside_candidate_confirmed,
+    ) = _run_min_max_state_machine(
+        close=new_bars["Close"].to_numpy(dtype=np.float64),
+        atr=atr,
+        looking_for_max=looking_for_max,
+        candidate_position=-1,
+        candidate_price=checkpoint.candidate_price,
+    )
+
+    last_min_date = checkpoint.last_min_date
+    last_max_date = checkpoint.last_max_date
+    if outside_candidate_confirmed:
+        if looking_for_max:
+            last_max_date = checkpoint.candidate_date
+        else:
+            last_min_date = checkpoint.candidate_date
+    if is_min.any():
+        last_min_date = _last_flag_date(new_bars.index, is_min)
+    if is_max.any():
+        last_max_date = _last_flag_date(new_bars.index, is_max)
+
+    if candidate_position >= 0:
+        candidate_date = new_bars.index[candidate_position]
+    else:
+        candidate_date = checkpoint.candidate_date
+
+    return MinMaxCheckpoint(
+        last_bar_date=new_bars.index[-1],
+        last_bar_close=float(new_bars["Close"].iloc[-1]),
+        extremum_to_detect="max" if looking_for_max_new else "min",
+        candidate_date=candidate_date,
+        candidate_price=float(candidate_price),
+        last_min_date=last_min_date,
+        last_max_date=last_max_date,
+        atr_tail=pd.concat([checkpoint.atr_tail, new_bars.astype(np.float64)]).iloc[
+            -(ATR_SMOOTHING_N + 1) :
+        ],
+    )
+
+
+def update_min_max_checkpoint_file(
+    df: pd.DataFrame, checkpoint_file: str
+) -> MinMaxCheckpoint:
+    """
+    Load the checkpoint from the file if it exists and is still valid for df,
+    resume it over the new bars of df, and save it back.
+    Otherwise, run the detection over the whole df.
+    """
+    checkpoint = None
+    if os.path.exists(checkpoint_file):
+        checkpoint = MinMaxCheckpoint.load(checkpoint_file)
+        # NOTE Providers may adjust the whole price history,
+        # e.g., after splits and dividends. Then the checkpoint is stale.
+        if checkpoint.last_bar_date not in df.index or not np.isclose(
+            df.loc[df.index == checkpoint.last_bar_date, "Close"].iloc[-1],
+            checkpoint.last_bar_close,
+        ):
+            checkpoint = None
+    if checkpoint is None:
+        checkpoint = get_min_max_checkpoint(df=df)
+    else:
+        checkpoint = resume_min_max_checkpoint(checkpoint=checkpoint, df=df)
+    checkpoint.save(checkpoint_file)
+    return checkpoint
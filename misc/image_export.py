@@ -0,0 +1,160 @@
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import plotly.io as pio
+from plotly.graph_objects import Figure
+
+from .spans import span
+
+try:
+    import kaleido
+
+    # NOTE Kaleido v1 renders with a browser. Starting it is the slow part
+    # of every write_image call, unless a sync server is kept running.
+    _KALEIDO_HAS_SYNC_SERVER = hasattr(kaleido, "start_sync_server")
+except ImportError:
+    kaleido = None
+    _KALEIDO_HAS_SYNC_SERVER = False
+
+IMAGE_FORMATS = ("png", "svg", "pdf")
+
+
+def get_image_format(file_name: str) -> str:
+    """
+    Get image format from the file extension.
+    """
+    image_format = os.path.splitext(file_name)[1].lstrip(".").lower()
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(
+            f"get_image_format: {file_name=}, the extension must be one of {IMAGE_FORMATS}"
+        )
+    return image_format
+
+
+class BatchImageExporter:
+    """
+    Collect (figure, file_name) pairs and save them in batches
+    through one long-lived kaleido renderer instead of one per image.
+    The format (png, svg or pdf) is taken from the file extension.
+
+    Use it as a context manager, so that the remaining figures
+    are saved and the renderer is stopped at the end:
+
+    with BatchImageExporter() as image_exporter:
+        vwaps_plot_build_save(..., image_exporter=image_exporter)
+        vwaps_plot_build_save(..., image_exporter=image_exporter)
+
+    If a batch fails, its figures are saved one by one, so that only
+    the broken ones are lost. Their errors are kept in the errors dict.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 20,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        scale: Optional[float] = None,
+    ):
+        self.batch_size = batch_size
+        self.width = width
+        self.height = height
+        self.scale = scale
+        self.errors: Dict[str, Exception] = dict()
+        self.saved_count = 0
+        self._pending: List[Tuple[Figure, str]] = list()
+        self._server_started = False
+
+    def start(self) -> None:
+        if _KALEIDO_HAS_SYNC_SERVER and not self._server_started:
+            kaleido.start_sync_server(silence_warnings=True)  # type: ignore
+            self._server_started = True
+
+    def add(self, fig: Figure, file_name: str) -> None:
+        """
+        Queue the figure, save the queue if it is full.
+        """
+        get_image_format(file_name=file_name)
+        self._pending.append((fig, file_name))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def _write_one(self, fig: Figure, file_name: str) -> None:
+        try:
+            pio.write_image(
+                fig,
+                file_name,
+                format=get_image_format(file_name=file_name),
+                width=self.width,
+                height=self.height,
+                scale=self.scale,
+            )
+            self.saved_count += 1
+        except Exception as error:  # pylint: disable=W0718
+            self.errors[file_name] = error
+
+    def flush(self) -> None:
+        """
+        Save all queued figures.
+        """
+        if len(self._pending) == 0:
+            return
+        self.start()
+        pending = self._pending
+        self._pending = list()
+        with span("image_write", images=len(pending)):
+            self._write_pending(pending=pending)
+
+    def _write_pending(self, pending: List[Tuple[Figure, str]]) -> None:
+
+        if not (_KALEIDO_HAS_SYNC_SERVER and hasattr(pio, "write_images")):
+            # NOTE Old kaleido keeps its renderer process alive between calls anyway
+            for fig, file_name in pending:
+                self._write_one(fig=fig, file_name=file_name)
+            return
+        try:
+            pio.write_images(
+                fig=[fig for fig, _ in pending],
+                file=[file_name for _, file_name in pending],
+                format=[get_image_format(file_name) for _, file_name in pending],
+                width=self.width,
+                height=self.height,
+                scale=self.scale,
+            )
+            self.saved_count += len(pending)
+        except Exception:  # pylint: disable=W0718
+            for fig, file_name in pending:
+                self._write_one(fig=fig, file_name=file_name)
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            if self._server_started:
+                kaleido.stop_sync_server(silence_warnings=True)  # type: ignore
+                self._server_started = False
+
+    def __enter__(self) -> "BatchImageExporter":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+def write_images_batch(
+    figures_and_files: Iterable[Tuple[Figure, str]],
+    batch_size: int = 20,
+    width: Optional[int] = None,
+    height: Optional[int] = None,
+    scale: Optional[float] = None,
+) -> Dict[str, Exception]:
+    """
+    Save many (figure, file_name) pairs through one kaleido renderer.
+    Return errors by file name, empty if all images are saved.
+    """
+    with BatchImageExporter(
+        batch_size=batch_size, width=width, height=height, scale=scale
+    ) as image_exporter:
+        for fig, file_name in figures_and_files:
+            image_exporter.add(fig=fig, file_name=file_name)
+    return image_exporter.errors
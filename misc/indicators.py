@@ -0,0 +1,306 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    # NOTE numba is optional, the plain Python loops are used without it.
+    njit = None
+
+# NOTE Positions in the state arrays of the rolling mean loop
+_SUM, _COMPENSATION_ADD, _COMPENSATION_REMOVE, _NOBS, _NEG_COUNT = 0, 1, 2, 3, 4
+_SAME_COUNT, _PREV_VALUE, _BUFFER_POSITION = 5, 6, 7
+_ROLLING_STATE_SIZE = 8
+
+# NOTE Positions in the state arrays of the EMA loop
+_WEIGHTED, _OLD_WEIGHT, _EMA_NOBS = 0, 1, 2
+_EMA_STATE_SIZE = 3
+
+
+def _get_out(values: np.ndarray, out: Optional[np.ndarray]) -> np.ndarray:
+    if out is None:
+        return np.empty(values.shape[0], dtype=np.float64)
+    if out.shape[0] != values.shape[0]:
+        raise ValueError(f"indicators: {out.shape=} must be equal to {values.shape=}")
+    return out
+
+
+def true_range(
+    high: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    True range: the largest of High - Low, |High - previous Close|
+    and |Low - previous Close|. NaN values are skipped, like in pandas max.
+    The first bar has no previous Close, its true range is High - Low.
+    Pass out to write the result into an existing array, e.g. high itself,
+    but not close.
+    """
+    out = _get_out(values=high, out=out)
+    if high.shape[0] == 0:
+        return out
+    previous_close = close[:-1]
+    high_close = np.abs(high[1:] - previous_close)
+    low_close = np.abs(low[1:] - previous_close)
+    np.subtract(high, low, out=out)
+    np.abs(out, out=out)
+    np.fmax(out[1:], high_close, out=out[1:])
+    np.fmax(out[1:], low_close, out=out[1:])
+    return out
+
+
+def _rolling_mean_loop_py(
+    values: np.ndarray,
+    window: int,
+    min_periods: int,
+    out: np.ndarray,
+    buffer: np.ndarray,
+    state: np.ndarray,
+) -> None:
+    """
+    The same compensated running sum as pandas rolling mean,
+    so that the results and their rounding are identical.
+    The last window values are kept in the ring buffer,
+    so out may be values itself and the loop can be continued
+    with the next values from the saved state.
+    """
+    for counter in range(values.shape[0]):
+        value = values[counter]
+        if value == np.inf or value == -np.inf:
+            value = np.nan
+        position = int(state[_BUFFER_POSITION])
+        if state[_BUFFER_POSITION] >= window:
+            # Remove the value that leaves the window
+            removed = buffer[position % window]
+            if removed == removed:
+                state[_NOBS] -= 1
+                y = -removed - state[_COMPENSATION_REMOVE]
+                t = state[_SUM] + y
+                state[_COMPENSATION_REMOVE] = t - state[_SUM] - y
+                state[_SUM] = t
+                if np.signbit(removed):
+                    state[_NEG_COUNT] -= 1
+        buffer[position % window] = value
+        state[_BUFFER_POSITION] = position + 1
+        if value == value:
+            state[_NOBS] += 1
+            y = value - state[_COMPENSATION_ADD]
+            t = state[_SUM] + y
+            state[_COMPENSATION_ADD] = t - state[_SUM] - y
+            state[_SUM] = t
+            if np.signbit(value):
+                state[_NEG_COUNT] += 1
+            # NOTE Like pandas, a run of equal values gives exactly that value
+            if value == state[_PREV_VALUE]:
+                state[_SAME_COUNT] += 1
+            else:
+                state[_SAME_COUNT] = 1
+            state[_PREV_VALUE] = value
+
+        nobs = state[_NOBS]
+        if nobs >= min_periods and nobs > 0:
+            result = state[_SUM] / nobs
+            if state[_SAME_COUNT] >= nobs:
+                result = state[_PREV_VALUE]
+            elif state[_NEG_COUNT] == 0 and result < 0:
+                result = 0.0
+            elif state[_NEG_COUNT] == nobs and result > 0:
+                result = 0.0
+            out[counter] = result
+        else:
+            out[counter] = np.nan
+
+
+def _ema_loop_py(
+    values: np.ndarray,
+    alpha: float,
+    min_periods: int,
+    out: np.ndarray,
+    state: np.ndarray,
+) -> None:
+    """
+    The same recursion as pandas ewm(alpha=alpha, adjust=False).mean().
+    The state is empty before the first value, i.e. its weighted value is NaN
+    and its number of observations is -1.
+    """
+    new_weight = alpha
+    old_weight_factor = 1.0 - alpha
+    for counter in range(values.shape[0]):
+        value = values[counter]
+        if value == np.inf or value == -np.inf:
+            value = np.nan
+        is_observation = value == value
+        if state[_EMA_NOBS] < 0:
+            state[_WEIGHTED] = value
+            state[_OLD_WEIGHT] = 1.0
+            state[_EMA_NOBS] = 1 if is_observation else 0
+        else:
+            if is_observation:
+                state[_EMA_NOBS] += 1
+            weighted = state[_WEIGHTED]
+            if weighted == weighted:
+                old_weight = state[_OLD_WEIGHT] * old_weight_factor
+                if is_observation:
+                    # NOTE Like pandas, avoid rounding errors on a constant series
+                    if weighted != value:
+                        weighted = old_weight * weighted + new_weight * value
+                        weighted /= old_weight + new_weight
+                    state[_WEIGHTED] = weighted
+                    state[_OLD_WEIGHT] = 1.0
+                else:
+                    # NOTE Missing values decay the weight of the previous average
+                    state[_OLD_WEIGHT] = old_weight
+            elif is_observation:
+                state[_WEIGHTED] = value
+        out[counter] = state[_WEIGHTED] if state[_EMA_NOBS] >= min_periods else np.nan
+
+
+if njit is not None:
+    _rolling_mean_loop = njit(cache=True, nogil=True)(_rolling_mean_loop_py)
+    _ema_loop = njit(cache=True, nogil=True)(_ema_loop_py)
+else:
+    _rolling_mean_loop = _rolling_mean_loop_py
+    _ema_loop = _ema_loop_py
+
+
+def _new_rolling_state(window: int) -> Tuple[np.ndarray, np.ndarray]:
+    if window <= 0:
+        raise ValueError(f"indicators: {window=} must be positive")
+    state = np.zeros(_ROLLING_STATE_SIZE, dtype=np.float64)
+    state[_PREV_VALUE] = np.nan
+    return np.full(window, np.nan, dtype=np.float64), state
+
+
+def _new_ema_state() -> np.ndarray:
+    state = np.zeros(_EMA_STATE_SIZE, dtype=np.float64)
+    state[_WEIGHTED] = np.nan
+    state[_EMA_NOBS] = -1
+    return state
+
+
+def _get_pandas_alpha(alpha: float) -> float:
+    # NOTE pandas converts alpha to center of mass and back,
+    # it may change the last bit of alpha
+    com = 1.0 / alpha - 1.0
+    return 1.0 / (1.0 + com)
+
+
+def rolling_mean(
+    values: np.ndarray,
+    window: int,
+    min_periods: Optional[int] = None,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Simple moving average, equal to pandas rolling(window, min_periods).mean().
+    By default, min_periods is window.
+    Pass out to write the result into an existing array, e.g. values itself.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    out = _get_out(values=values, out=out)
+    buffer, state = _new_rolling_state(window=window)
+    _rolling_mean_loop(
+        values,
+        window,
+        window if min_periods is None else max(min_periods, 1),
+        out,
+        buffer,
+        state,
+    )
+    return out
+
+
+def ema(
+    values: np.ndarray,
+    alpha: float,
+    min_periods: int = 0,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Exponential moving average,
+    equal to pandas ewm(alpha=alpha, min_periods=min_periods, adjust=False).mean().
+    Pass out to write the result into an existing array, e.g. values itself.
+    """
+    if not 0 < alpha <= 1:
+        raise ValueError(f"ema: {alpha=} must be in (0, 1]")
+    values = np.asarray(values, dtype=np.float64)
+    out = _get_out(values=values, out=out)
+    _ema_loop(
+        values, _get_pandas_alpha(alpha), max(min_periods, 1), out, _new_ema_state()
+    )
+    return out
+
+
+def wilder_average(
+    values: np.ndarray, n: int, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Wilder's smoothing used in his ATR: EMA with alpha 1 / n.
+    """
+    return ema(values=values, alpha=1 / n, min_periods=n, out=out)
+
+
+class StreamingTrueRange:
+    """
+    True range updated bar by bar, equal to true_range over all bars.
+    """
+
+    def __init__(self):
+        self.previous_close = np.nan
+
+    def update(self, high: float, low: float, close: float) -> float:
+        res = np.fmax(
+            np.fmax(abs(high - low), abs(high - self.previous_close)),
+            abs(low - self.previous_close),
+        )
+        self.previous_close = close
+        return float(res)
+
+
+class StreamingRollingMean:
+    """
+    Rolling mean updated value by value,
+    equal to rolling_mean over all values, including the rounding errors.
+    """
+
+    def __init__(self, window: int, min_periods: Optional[int] = None):
+        self.window = window
+        self.min_periods = window if min_periods is None else max(min_periods, 1)
+        self._buffer, self._state = _new_rolling_state(window=window)
+        self._value = np.empty(1, dtype=np.float64)
+        self._out = np.empty(1, dtype=np.float64)
+
+    def update(self, value: float) -> float:
+        self._value[0] = value
+        _rolling_mean_loop(
+            self._value,
+            self.window,
+            self.min_periods,
+            self._out,
+            self._buffer,
+            self._state,
+        )
+        return float(self._out[0])
+
+
+class StreamingEMA:
+    """
+    Exponential moving average updated value by value, equal to ema over all values.
+    """
+
+    def __init__(self, alpha: float, min_periods: int = 0):
+        if not 0 < alpha <= 1:
+            raise ValueError(f"StreamingEMA: {alpha=} must be in (0, 1]")
+        self.alpha = _get_pandas_alpha(alpha)
+        self.min_periods = max(min_periods, 1)
+        self._state = _new_ema_state()
+        self._value = np.empty(1, dtype=np.float64)
+        self._out = np.empty(1, dtype=np.float64)
+
+    def update(self, value: float) -> float:
+        self._value[0] = value
+        _ema_loop(self._value, self.alpha, self.min_periods, self._out, self._state)
+        return float(self._out[0])
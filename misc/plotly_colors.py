@@ -0,0 +1,17 @@
+# NOTE The colors of the default Plotly template,
+# so that the Agg charts look like the Plotly ones
+PLOTLY_COLORWAY = (
+    "#636efa",
+    "#EF553B",
+    "#00cc96",
+    "#ab63fa",
+    "#FFA15A",
+    "#19d3f3",
+    "#FF6692",
+    "#B6E880",
+    "#FF97FF",
+    "#FECB52",
+)
+PLOTLY_INCREASING_COLOR = "#3D9970"
+PLOTLY_DECREASING_COLOR = "#FF4136"
+PLOTLY_PLOT_BGCOLOR = "#E5ECF6"
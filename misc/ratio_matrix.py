@@ -0,0 +1,172 @@
+from dataclasses import dataclass
+from functools import reduce
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .anchored_vwap import anchored_vwaps_from_arrays
+
+# NOTE Ways to get the volume of a ratio bar from the volumes of its two tickers.
+# The anchored VWAPs of a ratio are weighted by it.
+RATIO_WEIGHTS = ("geometric", "min", "first", "second", "none")
+
+
+@dataclass
+class AlignedBars:
+    """
+    Bars of N tickers on their shared timestamps, one column per ticker
+    in every bars x tickers array.
+    """
+
+    tickers: List[str]
+    index: pd.DatetimeIndex
+    close: np.ndarray
+    typical: np.ndarray
+    volume: np.ndarray
+
+    def get_slice(self, start: int = 0) -> "AlignedBars":
+        """
+        Get the bars from the start position on, without copying them.
+        """
+        return AlignedBars(
+            tickers=self.tickers,
+            index=self.index[start:],  # type: ignore
+            close=self.close[start:],
+            typical=self.typical[start:],
+            volume=self.volume[start:],
+        )
+
+
+def align_bars(ohlc_dfs: Dict[str, pd.DataFrame]) -> AlignedBars:
+    """
+    Put the bars of all tickers on one index, the timestamps that all of them have.
+    ohlc_dfs are OHLCV DataFrames by ticker, like get_ohlc_from_yf returns.
+    The typical price is (Open + High + Low + Close) / 4, like in the VWAP charts.
+    """
+    if len(ohlc_dfs) < 2:
+        raise ValueError(f"align_bars: {len(ohlc_dfs)=}, at least 2 tickers needed")
+    tickers = list(ohlc_dfs.keys())
+    index = reduce(
+        lambda left, right: left.intersection(right),
+        [df.index for df in ohlc_dfs.values()],
+    ).sort_values()
+    close = np.empty((len(index), len(tickers)), dtype=np.float64)
+    typical = np.empty_like(close)
+    volume = np.empty_like(close)
+    for counter, df in enumerate(ohlc_dfs.values()):
+        positions = df.index.get_indexer(index)
+        close[:, counter] = df["Close"].to_numpy(dtype=np.float64)[positions]
+        typical[:, counter] = (
+            df[["Open", "High", "Low", "Close"]]
+            .to_numpy(dtype=np.float64)[positions]
+            .mean(axis=1)
+        )
+        volume[:, counter] = df["Volume"].to_numpy(dtype=np.float64)[positions]
+    return AlignedBars(
+        tickers=tickers, index=index, close=close, typical=typical, volume=volume
+    )
+
+
+def _get_pair_weights(
+    volume: np.ndarray, first: np.ndarray, second: np.ndarray, weight: str
+) -> np.ndarray:
+    if weight == "geometric":
+        return np.sqrt(volume[:, first] * volume[:, second])
+    if weight == "min":
+        return np.minimum(volume[:, first], volume[:, second])
+    if weight == "first":
+        return volume[:, first]
+    if weight == "second":
+        return volume[:, second]
+    if weight == "none":
+        return np.ones((volume.shape[0], first.shape[0]), dtype=np.float64)
+    raise ValueError(f"compute_ratio_matrix: {weight=}, must be one of {RATIO_WEIGHTS}")
+
+
+@dataclass
+class RatioMatrix:
+    """
+    Close-Close ratios of all pairs of tickers, one column per pair
+    in every bars x pairs array. The pair (A, B) is A / B,
+    the pairs follow the order of tickers, A before B.
+    """
+
+    tickers: List[str]
+    index: pd.DatetimeIndex
+    pairs: List[Tuple[str, str]]
+    ratios: np.ndarray
+    typical_ratios: np.ndarray
+    weights: np.ndarray
+
+    def get_pair_position(self, ticker_1: str, ticker_2: str) -> int:
+        try:
+            return self.pairs.index((ticker_1, ticker_2))
+        except ValueError:
+            raise ValueError(
+                f"RatioMatrix: no pair {ticker_1}/{ticker_2}, the pairs are in the order of {self.tickers}"
+            ) from None
+
+    def get_pair(self, ticker_1: str, ticker_2: str) -> pd.Series:
+        position = self.get_pair_position(ticker_1=ticker_1, ticker_2=ticker_2)
+        return pd.Series(
+            self.ratios[:, position], index=self.index, name=f"{ticker_1}/{ticker_2}"
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Get the ratios as a DataFrame with one column per pair, e.g. IWM/QQQ.
+        """
+        return pd.DataFrame(
+            self.ratios,
+            index=self.index,
+            columns=[f"{ticker_1}/{ticker_2}" for ticker_1, ticker_2 in self.pairs],
+        )
+
+    def get_anchored_vwaps(self, anchor_positions: np.ndarray) -> np.ndarray:
+        """
+        Get the anchored VWAPs of the typical ratios of all pairs,
+        weighted by the pair weights. Returns a bars x pairs x anchors array.
+        Values before the anchor position are NaN, like in anchored_vwaps_from_arrays.
+        """
+        return anchored_vwaps_from_arrays(
+            typical_x_volume=self.typical_ratios * self.weights,
+            volume=self.weights,
+            anchor_positions=np.asarray(anchor_positions, dtype=np.int64),
+        )
+
+
+def compute_ratio_matrix(
+    aligned_bars: AlignedBars, weight: str = "geometric"
+) -> RatioMatrix:
+    """
+    Compute the ratios of all N * (N - 1) / 2 pairs of tickers at once,
+    every ratio is a column of one array operation.
+    The weight of a ratio bar is one of RATIO_WEIGHTS:
+    geometric - square root of the product of the two volumes,
+    min - the smaller volume, first or second - the volume of one ticker,
+    none - all bars have the same weight.
+    """
+    first, second = np.triu_indices(len(aligned_bars.tickers), k=1)
+    weights = _get_pair_weights(
+        volume=aligned_bars.volume, first=first, second=second, weight=weight
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratios = aligned_bars.close[:, first] / aligned_bars.close[:, second]
+        typical_ratios = (
+            aligned_bars.typical[:, first] / aligned_bars.typical[:, second]
+        )
+    return RatioMatrix(
+        tickers=aligned_bars.tickers,
+        index=aligned_bars.index,
+        pairs=[
+            (
+                aligned_bars.tickers[first_position],
+                aligned_bars.tickers[second_position],
+            )
+            for first_position, second_position in zip(first, second)
+        ],
+        ratios=ratios,
+        typical_ratios=typical_ratios,
+        weights=weights,
+    )
@@ -0,0 +1,190 @@
+import contextlib
+import contextvars
+import cProfile
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+# NOTE The recorder is global, not a context variable,
+# so that the spans of the fetching threads are recorded too.
+_recorder: Optional["SpanRecorder"] = None
+_labels: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar(
+    "span_labels", default=dict()
+)
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class SpanRecorder:
+    """
+    Collect the timed spans of a run, see record_spans.
+    Every record is a dict with the span name, its start time (epoch seconds),
+    duration, process id, thread name, error flag and labels, e.g. the ticker.
+    """
+
+    def __init__(self):
+        self.records: List[Dict[str, Any]] = list()
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def extend(self, records: Iterable[Dict[str, Any]]) -> None:
+        """
+        Add the records collected elsewhere, e.g. in a worker process.
+        """
+        with self._lock:
+            self.records.extend(records)
+
+    def write_jsonl(self, file_name: str) -> None:
+        """
+        Save the records, one JSON object per line.
+        """
+        with open(file_name, "w", encoding="utf-8") as file:
+            for record in sorted(self.records, key=lambda record: record["start"]):
+                file.write(json.dumps(record, default=str) + "\n")
+
+    def get_summary(self) -> pd.DataFrame:
+        """
+        Get a table with the count, total, mean and max seconds of every span name,
+        sorted by total time. Spans of parallel threads and processes overlap,
+        so the totals may exceed the wall time of the run.
+        """
+        if len(self.records) == 0:
+            return pd.DataFrame(columns=["count", "total_s", "mean_s", "max_s"])
+        seconds = pd.DataFrame(self.records).groupby("name")["seconds"]
+        res = pd.DataFrame(
+            {
+                "count": seconds.count(),
+                "total_s": seconds.sum(),
+                "mean_s": seconds.mean(),
+                "max_s": seconds.max(),
+            }
+        )
+        return res.sort_values("total_s", ascending=False)
+
+
+class _Span:
+    __slots__ = ("recorder", "name", "labels", "start", "start_time")
+
+    def __init__(self, recorder: SpanRecorder, name: str, labels: Dict[str, Any]):
+        self.recorder = recorder
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self) -> "_Span":
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        seconds = time.perf_counter() - self.start
+        self.recorder.add(
+            {
+                "name": self.name,
+                "start": self.start_time,
+                "seconds": seconds,
+                "pid": os.getpid(),
+                "thread": threading.current_thread().name,
+                "failed": exc_type is not None,
+                **self.labels,
+            }
+        )
+
+
+def span(name: str, **labels: Any) -> contextlib.AbstractContextManager:
+    """
+    Time the block and add it to the active SpanRecorder with the labels
+    set by span_labels and the ones passed here:
+
+    with span("vwap_compute", anchors=5):
+        ...
+
+    Without an active recorder it does nothing and costs almost nothing.
+    """
+    recorder = _recorder
+    if recorder is None:
+        return _NULL_SPAN
+    return _Span(recorder=recorder, name=name, labels={**_labels.get(), **labels})
+
+
+@contextlib.contextmanager
+def span_labels(**labels: Any) -> Iterator[None]:
+    """
+    Add the labels, e.g. ticker="SPY", to all spans inside the block.
+    """
+    token = _labels.set({**_labels.get(), **labels})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def get_span_recorder() -> Optional[SpanRecorder]:
+    """
+    Get the active SpanRecorder, None if the spans are not recorded.
+    """
+    return _recorder
+
+
+@contextlib.contextmanager
+def record_spans(enabled: bool = True) -> Iterator[Optional[SpanRecorder]]:
+    """
+    Record the spans inside the block, yield the SpanRecorder.
+    If enabled is False, nothing is recorded and None is yielded.
+    """
+    global _recorder  # pylint: disable=W0603
+    if not enabled:
+        yield None
+        return
+    previous_recorder = _recorder
+    _recorder = SpanRecorder()
+    try:
+        yield _recorder
+    finally:
+        _recorder = previous_recorder
+
+
+@contextlib.contextmanager
+def profiling(file_name: Optional[str]) -> Iterator[None]:
+    """
+    Profile the block and save the results to file_name.
+    If it ends with .html, pyinstrument is used, it must be installed.
+    Otherwise, cProfile stats are saved, view them with
+    python -m pstats file_name or snakeviz.
+    If file_name is None, nothing is profiled.
+    """
+    if file_name is None:
+        yield
+        return
+    if file_name.endswith(".html"):
+        if Profiler is None:
+            raise ValueError(
+                f"profiling: {file_name=}, HTML reports need pyinstrument, "
+                "install it or use another extension for cProfile stats"
+            )
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(file_name, "w", encoding="utf-8") as file:
+                file.write(profiler.output_html())
+        return
+    c_profiler = cProfile.Profile()
+    c_profiler.enable()
+    try:
+        yield
+    finally:
+        c_profiler.disable()
+        c_profiler.dump_stats(file_name)
@@ -7,43 +7,19 @@ from plotly.graph_objects import Figure
 from plotly.subplots import make_subplots
 
 from import_ohlc import get_ohlc_from_yf
+from misc import BatchImageExporter
+from volume_profiles import compute_session_profiles, get_value_area_indexes
 
 VALUE_REGION_PERCENTILE = 0.7
 
-
-def _get_volume_profile_value_region_indexes(
-    volume_profile: np.ndarray,
-) -> Tuple[int, int]:
-    """
-    Get first and last index of the middle VALUE_REGION_PERCENTILE of the input volume profile.
-    """
-    v_p_sum = np.sum(volume_profile)
-    value_region_sum = v_p_sum * VALUE_REGION_PERCENTILE
-    volume_subtracted_from_bottom = volume_subtracted_from_top = 0
-    v_r_index_bottom = 0
-    v_r_index_top = len(volume_profile) - 1
-    iteration_num = 0
-    while v_p_sum > value_region_sum:
-        # NOTE Trying tu subtract equal volumes from top and bottom of the histogram
-        while volume_subtracted_from_bottom <= volume_subtracted_from_top:
-            if v_p_sum <= value_region_sum:
-                break
-            volume_subtracted_from_bottom += volume_profile[v_r_index_bottom]
-            v_p_sum -= volume_profile[v_r_index_bottom]
-            v_r_index_bottom += 1
-        while volume_subtracted_from_top <= volume_subtracted_from_bottom:
-            if v_p_sum <= value_region_sum:
-                break
-            volume_subtracted_from_top += volume_profile[v_r_index_top]
-            v_p_sum -= volume_profile[v_r_index_top]
-            v_r_index_top -= 1
-        iteration_num += 1
-    return v_r_index_bottom, v_r_index_top
+# NOTE All sessions share the bins, so one-day profiles need more bins
+# than the 49 of a single chart to keep the same resolution
+SESSION_PROFILE_BINS_COUNT = 200
 
 
 def get_volume_profile_colors(volume_profile: np.ndarray) -> List[str]:
-    v_r_index_first, v_r_index_last = _get_volume_profile_value_region_indexes(
-        volume_profile=volume_profile
+    v_r_index_first, v_r_index_last = get_value_area_indexes(
+        volume_profile=volume_profile, share=VALUE_REGION_PERCENTILE
     )
     volume_bar_colors = list()
     for counter in range(len(volume_profile)):
@@ -54,17 +30,37 @@ def get_volume_profile_colors(volume_profile: np.ndarray) -> List[str]:
     return volume_bar_colors
 
 
+def _trim_volume_profile(
+    volume_profile: np.ndarray, bin_edges: np.ndarray, low: float, high: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Keep only the bins that overlap the low-high price range.
+    """
+    first = max(int(np.searchsorted(bin_edges, low, side="right")) - 1, 0)
+    last = min(int(np.searchsorted(bin_edges, high, side="left")), len(volume_profile))
+    return volume_profile[first:last], bin_edges[first : last + 1]
+
+
 def create_candlestick_volume_chart(
-    df: pd.DataFrame, ticker: Optional[str] = None
+    df: pd.DataFrame,
+    ticker: Optional[str] = None,
+    volume_profile: Optional[Tuple[np.ndarray, np.ndarray]] = None,
 ) -> Figure:
     """
-    Create a candlestick chart with volume profile and price profile using Plotly
+    Create a candlestick chart with volume profile and price profile using Plotly.
+    The volume of every bar is spread across its High-Low range.
+    volume_profile is an optional precomputed (volumes, bin_edges) pair,
+    e.g. a composite of SessionVolumeProfiles, otherwise it is computed from df.
     """
     bins_count = 50
-    # Calculate volume profile
-    price_bins = np.linspace(df["Low"].min(), df["High"].max(), bins_count)
-    volume_profile, volume_bin_edges = np.histogram(
-        df["Close"], bins=price_bins, weights=df["Volume"]
+    if volume_profile is None:
+        profiles = compute_session_profiles(df, bins_count=bins_count - 1)
+        volume_profile = (profiles.composite(), profiles.bin_edges)
+    volume_profile, volume_bin_edges = _trim_volume_profile(
+        volume_profile=volume_profile[0],
+        bin_edges=volume_profile[1],
+        low=df["Low"].min(),
+        high=df["High"].max(),
     )
 
     # Calculate Price Profile (distribution of prices)
@@ -143,23 +139,32 @@ def create_candlestick_volume_chart(
     return fig
 
 
-def draw_profile_of_data(ohlc_df: pd.DataFrame, ticker: str) -> None:
+def draw_profile_of_data(
+    ohlc_df: pd.DataFrame,
+    ticker: str,
+    image_exporter: Optional[BatchImageExporter] = None,
+    volume_profile: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+) -> None:
     """
     1. Run create_candlestick_volume_chart.
-    2. Save png file
+    2. Save png file, or hand it to image_exporter if it is passed.
     """
 
-    figure = create_candlestick_volume_chart(ohlc_df, ticker=ticker)
+    figure = create_candlestick_volume_chart(
+        ohlc_df, ticker=ticker, volume_profile=volume_profile
+    )
 
-    all_index_dates = set(ohlc_df.index.date)  # type: ignore
-    len_all_index_dates = len(all_index_dates)
+    len_all_index_dates = len(ohlc_df.index.normalize().unique())  # type: ignore
     if len_all_index_dates == 1:
         index_date = ohlc_df.index[-1].date()
         chart_file_name = f"profile_{ticker}_{index_date}.png"
     else:
         chart_file_name = f"profile_{ticker}_{len_all_index_dates}d.png"
     print(chart_file_name)
-    figure.write_image(chart_file_name)
+    if image_exporter is not None:
+        image_exporter.add(fig=figure, file_name=chart_file_name)
+    else:
+        figure.write_image(chart_file_name)
 
 
 if __name__ == "__main__":
@@ -170,31 +175,39 @@ if __name__ == "__main__":
     print(data.head())
     print(data.tail())
 
-    sorted_dates = sorted(list(set(data.index.date)))  # type: ignore
-    if len(sorted_dates) != 5:
+    # NOTE Profiles of all sessions are computed once,
+    # the multi-day profiles are sums of their rows
+    profiles = compute_session_profiles(data, bins_count=SESSION_PROFILE_BINS_COUNT)
+    if len(profiles.sessions) != 5:
         raise ValueError(
-            f"We ask Yahoo Finance for 5 days of data, so len should be 5, {sorted_dates=}"
+            f"We ask Yahoo Finance for 5 days of data, so len should be 5, {profiles.sessions=}"
         )
 
-    # Draw one-day profile for yesterday
-    data_slice: pd.DataFrame = data[data.index.date == sorted_dates[-1]]  # type: ignore
-    draw_profile_of_data(ohlc_df=data_slice, ticker=TICKER)
-
-    # Draw one-day profile for the day before yesterday
-    data_slice: pd.DataFrame = data[data.index.date == sorted_dates[-2]]  # type: ignore
-    draw_profile_of_data(ohlc_df=data_slice, ticker=TICKER)
-
-    # Draw one-day profile for the day 3 days ago
-    data_slice: pd.DataFrame = data[data.index.date == sorted_dates[-3]]  # type: ignore
-    draw_profile_of_data(ohlc_df=data_slice, ticker=TICKER)
-
-    # Draw two-days profile for the day before yesterday and yesterday
-    data_slice: pd.DataFrame = data[data.index.date >= sorted_dates[-2]]  # type: ignore
-    draw_profile_of_data(ohlc_df=data_slice, ticker=TICKER)
-
-    # Draw three-days profile
-    data_slice: pd.DataFrame = data[data.index.date >= sorted_dates[-3]]  # type: ignore
-    draw_profile_of_data(ohlc_df=data_slice, ticker=TICKER)
-
-    # Draw five-days profile
-    draw_profile_of_data(ohlc_df=data, ticker=TICKER)
+    # NOTE All charts are saved through one kaleido renderer
+    with BatchImageExporter() as image_exporter:
+        # Draw one-day profiles for yesterday, the day before yesterday and 3 days ago
+        for session_number in (-1, -2, -3):
+            start = profiles.session_starts[session_number]
+            end = (
+                profiles.session_starts[session_number + 1]
+                if session_number < -1
+                else data.shape[0]
+            )
+            draw_profile_of_data(
+                ohlc_df=data.iloc[start:end],
+                ticker=TICKER,
+                image_exporter=image_exporter,
+                volume_profile=(profiles.volumes[session_number], profiles.bin_edges),
+            )
+
+        # Draw two-, three- and five-days profiles
+        for sessions_count in (2, 3, 5):
+            draw_profile_of_data(
+                ohlc_df=data.iloc[profiles.get_bars_slice(sessions_count)],
+                ticker=TICKER,
+                image_exporter=image_exporter,
+                volume_profile=(
+                    profiles.composite(sessions_count),
+                    profiles.bin_edges,
+                ),
+            )
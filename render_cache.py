@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from constants import RENDER_MANIFEST_FILE
+from import_ohlc.cache import file_lock
+
+# NOTE Bump it when a change of the rendering code changes the images,
+# so that all charts rendered before are rendered again.
+RENDER_CACHE_VERSION = 1
+
+
+def get_chart_hash(
+    df: pd.DataFrame,
+    anchor_points: List[pd.Timestamp],
+    annotation_text: str,
+    style: Dict[str, Any],
+) -> str:
+    """
+    Hash everything that reaches the figure: the timestamps, OHLC,
+    A_VWAP_* and VWAP_BAND_* values of the visible bars, the anchors in the order of their lines,
+    the annotation text and the style parameters, e.g. title and max_points.
+    Equal hashes give equal images.
+    """
+    res = hashlib.blake2b(digest_size=16)
+    params = {
+        "version": RENDER_CACHE_VERSION,
+        "anchor_points": [str(anchor) for anchor in anchor_points],
+        "annotation_text": annotation_text,
+        "style": style,
+    }
+    res.update(json.dumps(params, sort_keys=True, default=str).encode("utf-8"))
+    res.update(df.index.as_unit("ns").asi8.tobytes())  # type: ignore
+    columns = (
+        ["Open", "High", "Low", "Close"]
+        + [f"A_VWAP_{counter}" for counter in range(1, len(anchor_points) + 1)]
+        + sorted(column for column in df.columns if column.startswith("VWAP_BAND_"))
+    )
+    for column in columns:
+        res.update(column.encode("utf-8"))
+        res.update(np.ascontiguousarray(df[column].to_numpy(dtype=np.float64)).data)
+    return res.hexdigest()
+
+
+class RenderCache:
+    """
+    Manifest of the rendered charts: image file -> hash of the chart inputs,
+    see get_chart_hash, and the size and modification time of the image.
+    A chart is rendered again only if its hash changed, or the image
+    was deleted or replaced since it was recorded.
+    The manifest is a JSON file shared by processes under a lock file.
+    Call invalidate to force rendering, or just delete the manifest file.
+    """
+
+    def __init__(self, manifest_file: str = RENDER_MANIFEST_FILE):
+        self.manifest_file = manifest_file
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.manifest_file):
+            return dict()
+        with open(self.manifest_file, "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def _write(self, manifest: Dict[str, Dict[str, Any]]) -> None:
+        with open(f"{self.manifest_file}.tmp", "w", encoding="utf-8") as file:
+            json.dump(manifest, file, indent=1, sort_keys=True)
+        os.replace(f"{self.manifest_file}.tmp", self.manifest_file)
+
+    def is_fresh(self, file_name: str, chart_hash: str) -> bool:
+        """
+        Is the image file_name rendered from the inputs with chart_hash,
+        and unchanged since then.
+        """
+        entry = self._read().get(os.path.normpath(file_name))
+        if entry is None or entry["hash"] != chart_hash:
+            return False
+        try:
+            stat = os.stat(file_name)
+        except FileNotFoundError:
+            return False
+        return stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]
+
+    def record(self, file_name: str, chart_hash: str) -> None:
+        """
+        Record that the image file_name was just rendered from chart_hash.
+        """
+        stat = os.stat(file_name)
+        with file_lock(f"{self.manifest_file}.lock"):
+            manifest = self._read()
+            manifest[os.path.normpath(file_name)] = {
+                "hash": chart_hash,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "recorded_at": time.time(),
+            }
+            self._write(manifest)
+
+    def invalidate(self, file_names: Optional[List[str]] = None) -> None:
+        """
+        Forget the images file_names, or all of them if None,
+        so that they are rendered again next time.
+        """
+        with file_lock(f"{self.manifest_file}.lock"):
+            if file_names is None:
+                manifest: Dict[str, Dict[str, Any]] = dict()
+            else:
+                manifest = self._read()
+                for file_name in file_names:
+                    manifest.pop(os.path.normpath(file_name), None)
+            self._write(manifest)
@@ -1,3 +1,5 @@
+import asyncio
+
 import pandas as pd
 
 from custom import get_custom_chart_annotation_1d
@@ -7,6 +9,7 @@ from draw_ratio import draw_ratio
 from import_ohlc import get_ohlc_from_yf
 from misc import get_chart_annotation_1d
 from vwaps_plot_build_save import vwaps_plot_build_save
+from watch_intraday import WatchItem, watch_intraday
 
 
 def draw_qqq_intraday():
@@ -50,6 +53,18 @@ def draw_iwm_intraday():
     )
 
 
+def watch_qqq_iwm_intraday():
+    items = [
+        WatchItem(
+            ticker="QQQ",
+            interval="1m",
+            anchor_dates=["2024-11-21 14:30:00", "x2024-11-21 16:33:00"],
+        ),
+        WatchItem(ticker="IWM", interval="5m", anchor_dates=["2024-11-21 14:30:00"]),
+    ]
+    asyncio.run(watch_intraday(items=items))
+
+
 if __name__ == "__main__":
 
     # draw_all_daily_charts(
@@ -66,5 +81,6 @@ if __name__ == "__main__":
 
     # draw_qqq_intraday()
     # draw_iwm_intraday()
+    # watch_qqq_iwm_intraday()
 
     draw_ratio(ticker_1="IWM", ticker_2="QQQ", cutoff_date="2020-01-01")
@@ -0,0 +1,524 @@
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from constants import (
+    ATR_SMOOTHING_N,
+    BAR_STORE_DIR,
+    RECLAIM_LOOKBACK_BARS,
+    UNIVERSE_BARS_COUNT,
+    first_day_of_year,
+)
+from draw_all_daily_charts import get_custom_anchor_dates, read_watchlist
+from import_ohlc import BarStore
+from misc import find_min_max_positions, get_atr_arrays, span
+from vwaps_plot_build_save import preprocess_anchor_dates
+
+SCAN_SORT_KEYS = ("distance_atr", "reclaims")
+
+# NOTE Timestamp of the padding columns, before any bar,
+# so the count of timestamps before an anchor includes the padding
+_PADDING_TIMESTAMP = np.iinfo(np.int64).min
+
+_ANCHOR_KIND_CODES = {"custom": 0, "last_min": 1, "last_max": 2}
+_ANCHOR_KINDS = np.array(list(_ANCHOR_KIND_CODES), dtype=object)
+
+
+@dataclass
+class UniverseBars:
+    """
+    The last bars of many tickers as tickers x bars float64 arrays.
+    Every row is right-aligned: its last column is the last bar of the ticker.
+    The rows of the tickers with fewer bars start at the column starts[i],
+    the columns before it are NaN and their timestamps are _PADDING_TIMESTAMP.
+    timestamps: int64 nanoseconds, UTC-naive like the chart index.
+    typical: the Typical column if the ticker has it, e.g. resampled bars,
+    otherwise (Open + High + Low + Close) / 4.
+    truncated: True for the tickers that have more bars than the columns,
+    the anchors before their first loaded bar can't be computed.
+    errors: the tickers that could not be loaded.
+    """
+
+    tickers: List[str]
+    timestamps: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    typical: np.ndarray
+    volume: np.ndarray
+    starts: np.ndarray
+    truncated: np.ndarray
+    errors: Dict[str, Exception] = field(default_factory=dict)
+
+
+@dataclass
+class UniverseAnchors:
+    """
+    Anchors of every ticker of UniverseBars as tickers x K arrays,
+    K is the largest number of anchors of one ticker.
+    positions: columns of the anchor bars, the number of columns if no anchor.
+    kinds: codes of _ANCHOR_KIND_CODES.
+    """
+
+    positions: np.ndarray
+    kinds: np.ndarray
+
+
+def _new_universe_bars(tickers: List[str], bars_count: int) -> UniverseBars:
+    shape = (len(tickers), bars_count)
+    return UniverseBars(
+        tickers=tickers,
+        timestamps=np.full(shape, _PADDING_TIMESTAMP, dtype=np.int64),
+        high=np.full(shape, np.nan),
+        low=np.full(shape, np.nan),
+        close=np.full(shape, np.nan),
+        typical=np.full(shape, np.nan),
+        volume=np.full(shape, np.nan),
+        starts=np.full(len(tickers), bars_count, dtype=np.int64),
+        truncated=np.zeros(len(tickers), dtype=bool),
+    )
+
+
+def _fill_row(
+    universe_bars: UniverseBars,
+    row: int,
+    timestamps: np.ndarray,
+    columns: Dict[str, np.ndarray],
+) -> None:
+    """
+    Copy the last bars of one ticker to the row of universe_bars.
+    Only the copied bars are read, e.g. from the memory-mapped files.
+    """
+    bars_count = universe_bars.timestamps.shape[1]
+    count = min(timestamps.shape[0], bars_count)
+    start = bars_count - count
+    universe_bars.starts[row] = start
+    universe_bars.truncated[row] = timestamps.shape[0] > bars_count
+    if count == 0:
+        return
+    universe_bars.timestamps[row, start:] = timestamps[-count:]
+    universe_bars.high[row, start:] = columns["High"][-count:]
+    universe_bars.low[row, start:] = columns["Low"][-count:]
+    universe_bars.close[row, start:] = columns["Close"][-count:]
+    universe_bars.volume[row, start:] = columns["Volume"][-count:]
+    typical = universe_bars.typical[row, start:]
+    if "Typical" in columns:
+        typical[:] = columns["Typical"][-count:]
+    else:
+        # NOTE The same operations as get_typical_x_volume
+        typical[:] = columns["Open"][-count:]
+        typical += universe_bars.high[row, start:]
+        typical += universe_bars.low[row, start:]
+        typical += universe_bars.close[row, start:]
+        typical /= 4
+
+
+def load_universe_bars(
+    tickers: List[str],
+    interval: str = "1d",
+    bars_count: int = UNIVERSE_BARS_COUNT,
+    store_dir: str = BAR_STORE_DIR,
+) -> UniverseBars:
+    """
+    Load the last bars_count bars of every ticker from the BarStore in store_dir.
+    The stored files are memory-mapped, only the loaded bars are read.
+    Tickers that are not in the store are reported, skipped
+    and saved in the errors of the result.
+    """
+    if bars_count <= 0:
+        raise ValueError(f"load_universe_bars: {bars_count=} must be positive")
+    bar_store = BarStore(store_dir=store_dir)
+    all_stored_bars = list()
+    errors: Dict[str, Exception] = dict()
+    with span("universe_load", tickers=len(tickers)):
+        for ticker in tickers:
+            try:
+                all_stored_bars.append(bar_store.open(ticker=ticker, interval=interval))
+            except Exception as load_error:  # pylint: disable=W0718
+                print(f"load_universe_bars: {ticker=} skipped, {load_error=}")
+                errors[ticker] = load_error
+        res = _new_universe_bars(
+            tickers=[stored_bars.ticker for stored_bars in all_stored_bars],
+            bars_count=min(
+                bars_count,
+                max((len(stored_bars) for stored_bars in all_stored_bars), default=0),
+            ),
+        )
+        for row, stored_bars in enumerate(all_stored_bars):
+            _fill_row(
+                universe_bars=res,
+                row=row,
+                timestamps=stored_bars.timestamps,
+                columns=stored_bars.columns,
+            )
+    res.errors = errors
+    return res
+
+
+def universe_bars_from_frames(
+    ohlc_dfs: Dict[str, pd.DataFrame], bars_count: int = UNIVERSE_BARS_COUNT
+) -> UniverseBars:
+    """
+    Build UniverseBars from OHLC DataFrames by ticker,
+    e.g. those of get_ohlc_from_yf. The index must be sorted ascending.
+    """
+    if bars_count <= 0:
+        raise ValueError(f"universe_bars_from_frames: {bars_count=} must be positive")
+    res = _new_universe_bars(
+        tickers=list(ohlc_dfs),
+        bars_count=min(
+            bars_count, max((df.shape[0] for df in ohlc_dfs.values()), default=0)
+        ),
+    )
+    for row, df in enumerate(ohlc_dfs.values()):
+        index = df.index
+        if index.tz is not None:  # type: ignore
+            index = index.tz_convert(None)  # type: ignore
+        _fill_row(
+            universe_bars=res,
+            row=row,
+            timestamps=index.as_unit("ns").asi8,  # type: ignore
+            columns={
+                column: df[column].to_numpy(dtype=np.float64)
+                for column in df.columns
+                if column in ("Open", "High", "Low", "Close", "Volume", "Typical")
+            },
+        )
+    return res
+
+
+def get_universe_atr(universe_bars: UniverseBars) -> np.ndarray:
+    """
+    Get the atr_{ATR_SMOOTHING_N} column of add_atr_col_to_df
+    for every ticker, computed from its loaded bars only.
+    """
+    res = np.full(universe_bars.close.shape, np.nan)
+    for row, start in enumerate(universe_bars.starts):
+        if start == res.shape[1]:
+            continue
+        _, res[row, start:] = get_atr_arrays(
+            high=universe_bars.high[row, start:],
+            low=universe_bars.low[row, start:],
+            close=universe_bars.close[row, start:],
+        )
+    return res
+
+
+def resolve_universe_anchors(
+    universe_bars: UniverseBars,
+    atr: np.ndarray,
+    anchor_dates: Optional[List] = None,
+    custom_anchor_dates: Optional[Dict[str, List]] = None,
+    add_last_min_max: bool = True,
+) -> UniverseAnchors:
+    """
+    Get the anchor positions of every ticker:
+    1. anchor_dates shared by all tickers, e.g. the year's 1st day.
+    2. The custom anchor dates of the ticker from custom_anchor_dates.
+    3. The last min and max, found by find_min_max_positions in the loaded bars.
+
+    Like get_anchor_positions, the anchor bar is the first bar
+    with timestamp greater than or equal to the anchor date.
+    The dates before the first loaded bar of a truncated ticker are skipped,
+    its VWAP needs the bars that were not loaded.
+    Anchors that fall on the same bar are kept once.
+    """
+    timestamps = universe_bars.timestamps
+    tickers_count, bars_count = timestamps.shape
+    rows = np.arange(tickers_count)
+    first_timestamps = timestamps[
+        rows, np.minimum(universe_bars.starts, bars_count - 1)
+    ]
+
+    def _skip_before_loaded(positions: np.ndarray, anchor_ns: np.ndarray) -> None:
+        # NOTE The first loaded bar of a truncated ticker is not
+        # the first bar after the anchor, the bars between them are missing
+        positions[universe_bars.truncated & (anchor_ns < first_timestamps)] = bars_count
+
+    all_positions = list()
+    all_kinds = list()
+    shared_anchor_points, _ = preprocess_anchor_dates(anchor_dates=anchor_dates or [])
+    for anchor_point in sorted(shared_anchor_points):
+        anchor_ns = np.full(tickers_count, pd.Timestamp(anchor_point).value)
+        # NOTE The padding timestamps are before any anchor, so the count
+        # is the position in the right-aligned row, vectorized over the tickers
+        positions = (timestamps < anchor_ns[:, None]).sum(axis=1)
+        _skip_before_loaded(positions=positions, anchor_ns=anchor_ns)
+        all_positions.append(positions)
+        all_kinds.append(np.full(tickers_count, _ANCHOR_KIND_CODES["custom"]))
+
+    if custom_anchor_dates:
+        custom_anchor_points = [
+            sorted(
+                preprocess_anchor_dates(
+                    anchor_dates=custom_anchor_dates.get(ticker, [])
+                )[0]
+            )
+            for ticker in universe_bars.tickers
+        ]
+        for counter in range(max(len(points) for points in custom_anchor_points)):
+            positions = np.full(tickers_count, bars_count, dtype=np.int64)
+            anchor_ns = np.full(tickers_count, np.iinfo(np.int64).max)
+            for row, points in enumerate(custom_anchor_points):
+                if counter < len(points):
+                    anchor_ns[row] = pd.Timestamp(points[counter]).value
+                    positions[row] = np.searchsorted(
+                        timestamps[row], anchor_ns[row], side="left"
+                    )
+            _skip_before_loaded(positions=positions, anchor_ns=anchor_ns)
+            all_positions.append(positions)
+            all_kinds.append(np.full(tickers_count, _ANCHOR_KIND_CODES["custom"]))
+
+    if add_last_min_max:
+        last_min_positions = np.full(tickers_count, bars_count, dtype=np.int64)
+        last_max_positions = np.full(tickers_count, bars_count, dtype=np.int64)
+        for row, start in enumerate(universe_bars.starts):
+            if start == bars_count:
+                continue
+            min_positions, max_positions = find_min_max_positions(
+                close=universe_bars.close[row, start:], atr=atr[row, start:]
+            )
+            if min_positions.shape[0] > 0:
+                last_min_positions[row] = start + min_positions[-1]
+            if max_positions.shape[0] > 0:
+                last_max_positions[row] = start + max_positions[-1]
+        all_positions.extend([last_min_positions, last_max_positions])
+        all_kinds.append(np.full(tickers_count, _ANCHOR_KIND_CODES["last_min"]))
+        all_kinds.append(np.full(tickers_count, _ANCHOR_KIND_CODES["last_max"]))
+
+    if len(all_positions) == 0:
+        raise ValueError("resolve_universe_anchors: no anchors to resolve")
+    positions = np.stack(all_positions, axis=1).astype(np.int64)
+    kinds = np.stack(all_kinds, axis=1)
+    # NOTE Sort the anchors of every ticker by position, drop the repeated ones
+    # and move the missing ones to the end, then cut the columns without anchors
+    order = np.argsort(positions, axis=1, kind="stable")
+    positions = np.take_along_axis(positions, order, axis=1)
+    kinds = np.take_along_axis(kinds, order, axis=1)
+    is_repeated = np.zeros(positions.shape, dtype=bool)
+    is_repeated[:, 1:] = positions[:, 1:] == positions[:, :-1]
+    positions[is_repeated] = bars_count
+    order = np.argsort(positions, axis=1, kind="stable")
+    positions = np.take_along_axis(positions, order, axis=1)
+    kinds = np.take_along_axis(kinds, order, axis=1)
+    anchors_count = max(int((positions < bars_count).sum(axis=1).max()), 1)
+    return UniverseAnchors(
+        positions=positions[:, :anchors_count], kinds=kinds[:, :anchors_count]
+    )
+
+
+def get_universe_vwaps(
+    universe_bars: UniverseBars, anchor_positions: np.ndarray, last_bars: int = 1
+) -> np.ndarray:
+    """
+    Calculate the anchored VWAPs of all tickers and anchors
+    for the last_bars bars in one pass over the arrays.
+    Returns a tickers x K x last_bars array, K is the number of anchor columns.
+    Like anchored_vwaps_from_arrays, both cumulative sums are taken once
+    per ticker, and the VWAP is the difference of the sums at the bar
+    and just before the anchor. The values before the anchor are NaN.
+    """
+    bars_count = universe_bars.close.shape[1]
+    last_bars = min(last_bars, bars_count)
+    # NOTE Like anchored_vwaps_from_arrays, skip NaN values in the running sums,
+    # but keep NaN in the result for the bars where the input is NaN.
+    # The padding columns add nothing to the sums. The sums are taken in place,
+    # the arrays of all tickers are large.
+    cum_tpv = universe_bars.typical * universe_bars.volume
+    bar_is_nan = np.isnan(cum_tpv[:, -last_bars:]) | np.isnan(
+        universe_bars.volume[:, -last_bars:]
+    )
+    np.nan_to_num(cum_tpv, copy=False)
+    np.cumsum(cum_tpv, axis=1, out=cum_tpv)
+    cum_vol = np.nan_to_num(universe_bars.volume)
+    np.cumsum(cum_vol, axis=1, out=cum_vol)
+    # base_*[k] is the sum of all bars before anchor k, zero for the first bar
+    before_anchor = np.maximum(anchor_positions - 1, 0)
+    is_first_bar = anchor_positions == 0
+    base_tpv = np.take_along_axis(cum_tpv, before_anchor, axis=1)
+    base_tpv[is_first_bar] = 0.0
+    base_vol = np.take_along_axis(cum_vol, before_anchor, axis=1)
+    base_vol[is_first_bar] = 0.0
+
+    res = cum_tpv[:, None, -last_bars:] - base_tpv[:, :, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        res /= cum_vol[:, None, -last_bars:] - base_vol[:, :, None]
+    bar_positions = np.arange(bars_count - last_bars, bars_count)
+    res[bar_positions[None, None, :] < anchor_positions[:, :, None]] = np.nan
+    res[np.broadcast_to(bar_is_nan[:, None, :], res.shape)] = np.nan
+    return res
+
+
+def scan_universe(
+    universe_bars: UniverseBars,
+    anchor_dates: Optional[List] = None,
+    custom_anchor_dates: Optional[Dict[str, List]] = None,
+    add_last_min_max: bool = True,
+    sort_by: str = "distance_atr",
+    reclaim_bars: int = RECLAIM_LOOKBACK_BARS,
+) -> pd.DataFrame:
+    """
+    Rank the tickers of universe_bars by their anchored VWAPs
+    at the last bar, without building any chart.
+    The anchors are those of draw_all_daily_charts chart 1:
+    anchor_dates shared by all tickers (the year's 1st day by default),
+    the custom anchor dates of every ticker and its last low and high,
+    see resolve_universe_anchors.
+
+    One row per ticker:
+    nearest_*: the VWAP closest to the last Close, its anchor kind and date.
+    distance_atr: (Close - nearest VWAP) / ATR.
+    vwaps_below: the number of VWAPs below Close.
+    reclaims: the VWAPs that Close crossed from below to above
+    in the last reclaim_bars bars and is still above. losses: the opposite.
+
+    sort_by "distance_atr": the tickers closest to a VWAP first.
+    sort_by "reclaims": the most reclaims first, then the closest.
+    """
+    if sort_by not in SCAN_SORT_KEYS:
+        raise ValueError(f"scan_universe: {sort_by=}, must be one of {SCAN_SORT_KEYS}")
+    if reclaim_bars <= 0:
+        raise ValueError(f"scan_universe: {reclaim_bars=} must be positive")
+    if anchor_dates is None:
+        anchor_dates = [first_day_of_year]
+    tickers_count, bars_count = universe_bars.close.shape
+    if tickers_count == 0 or bars_count == 0:
+        raise ValueError("scan_universe: universe_bars have no bars")
+
+    with span("universe_scan", tickers=tickers_count, bars=bars_count):
+        with span("indicators"):
+            atr = get_universe_atr(universe_bars=universe_bars)
+        with span("anchor_resolution"):
+            anchors = resolve_universe_anchors(
+                universe_bars=universe_bars,
+                atr=atr,
+                anchor_dates=anchor_dates,
+                custom_anchor_dates=custom_anchor_dates,
+                add_last_min_max=add_last_min_max,
+            )
+        with span("vwap_compute", anchors=anchors.positions.shape[1]):
+            vwaps = get_universe_vwaps(
+                universe_bars=universe_bars,
+                anchor_positions=anchors.positions,
+                last_bars=reclaim_bars + 1,
+            )
+
+        closes = universe_bars.close[:, None, -vwaps.shape[2] :]
+        is_above = closes >= vwaps
+        is_below = closes < vwaps
+        reclaims = (
+            (is_below[:, :, :-1] & is_above[:, :, 1:]).any(axis=2) & is_above[:, :, -1]
+        ).sum(axis=1)
+        losses = (
+            (is_above[:, :, :-1] & is_below[:, :, 1:]).any(axis=2) & is_below[:, :, -1]
+        ).sum(axis=1)
+
+        close = universe_bars.close[:, -1]
+        atr_last = atr[:, -1]
+        last_vwaps = vwaps[:, :, -1]
+        # NOTE The nearest VWAP in ATR units is the nearest in price units,
+        # the ATR of a ticker is the same for all its VWAPs
+        abs_distance = np.abs(close[:, None] - last_vwaps)
+        has_vwap = ~np.isnan(abs_distance).all(axis=1)
+        nearest = np.argmin(np.where(np.isnan(abs_distance), np.inf, abs_distance), 1)
+        rows = np.arange(tickers_count)
+        nearest_vwap = np.where(has_vwap, last_vwaps[rows, nearest], np.nan)
+        nearest_position = anchors.positions[rows, nearest]
+        nearest_anchor = np.where(
+            has_vwap,
+            universe_bars.timestamps[
+                rows, np.minimum(nearest_position, bars_count - 1)
+            ],
+            np.iinfo(np.int64).min,
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            distance_atr = np.where(
+                atr_last > 0, (close - nearest_vwap) / atr_last, np.nan
+            )
+        res = pd.DataFrame(
+            {
+                "ticker": universe_bars.tickers,
+                "date": pd.DatetimeIndex(
+                    universe_bars.timestamps[:, -1].view("datetime64[ns]")
+                ),
+                "close": close,
+                f"atr_{ATR_SMOOTHING_N}": atr_last,
+                "vwaps_count": (~np.isnan(last_vwaps)).sum(axis=1),
+                "vwaps_below": is_above[:, :, -1].sum(axis=1),
+                "nearest_anchor": pd.DatetimeIndex(
+                    nearest_anchor.view("datetime64[ns]")
+                ),
+                "nearest_anchor_kind": np.where(
+                    has_vwap, _ANCHOR_KINDS[anchors.kinds[rows, nearest]], None
+                ),
+                "nearest_vwap": nearest_vwap,
+                "distance_atr": distance_atr,
+                "distance_pct": (close - nearest_vwap) / nearest_vwap * 100,
+                "reclaims": reclaims,
+                "losses": losses,
+            }
+        )
+        res["abs_distance_atr"] = res["distance_atr"].abs()
+        if sort_by == "reclaims":
+            res = res.sort_values(
+                ["reclaims", "abs_distance_atr"],
+                ascending=[False, True],
+                na_position="last",
+                kind="stable",
+            )
+        else:
+            res = res.sort_values("abs_distance_atr", na_position="last", kind="stable")
+        res = res.drop(columns="abs_distance_atr").reset_index(drop=True)
+    return res
+
+
+def write_universe_scan(
+    tickers: Optional[List[str]] = None,
+    file_name: str = "universe_scan.csv",
+    interval: str = "1d",
+    store_dir: str = BAR_STORE_DIR,
+    bars_count: int = UNIVERSE_BARS_COUNT,
+    custom_anchor_dates: Optional[Dict[str, List]] = None,
+    watchlist_file: Optional[str] = "tickers_follow_daily.xlsx",
+    sort_by: str = "distance_atr",
+    reclaim_bars: int = RECLAIM_LOOKBACK_BARS,
+) -> pd.DataFrame:
+    """
+    Scan the tickers of the BarStore in store_dir, all stored tickers
+    of the interval by default, see scan_universe.
+    Fill the store with fill_bar_store first.
+    If custom_anchor_dates are not passed, they are read from the
+    Anchor_Dates worksheet of watchlist_file, like draw_all_daily_charts does,
+    so the scan ranks the same anchors as chart 1.
+    Pass watchlist_file=None to scan without custom anchor dates.
+    Save the ranked table to file_name (.csv or .parquet).
+    """
+    if os.path.splitext(file_name)[1] not in (".csv", ".parquet"):
+        raise ValueError(f"write_universe_scan: {file_name=} must be .csv or .parquet")
+    if tickers is None:
+        tickers = BarStore(store_dir=store_dir).get_tickers(interval=interval)
+    universe_bars = load_universe_bars(
+        tickers=tickers, interval=interval, bars_count=bars_count, store_dir=store_dir
+    )
+    if custom_anchor_dates is None and watchlist_file is not None:
+        _, tickers_anchor_dates = read_watchlist(file_name=watchlist_file)
+        custom_anchor_dates = {
+            ticker: get_custom_anchor_dates(
+                ticker=ticker, tickers_anchor_dates=tickers_anchor_dates
+            )
+            for ticker in universe_bars.tickers
+        }
+    res = scan_universe(
+        universe_bars=universe_bars,
+        custom_anchor_dates=custom_anchor_dates,
+        sort_by=sort_by,
+        reclaim_bars=reclaim_bars,
+    )
+    if file_name.endswith(".parquet"):
+        res.to_parquet(file_name, index=False)
+    else:
+        res.to_csv(file_name, index=False)
+    return res
@@ -0,0 +1,384 @@
+import os
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from constants import VOLUME_PROFILE_STORE_DIR, VOLUME_PROFILE_TICK_SIZE
+from import_ohlc import get_ohlc_from_yf
+from import_ohlc.cache import file_lock
+
+VALUE_AREA_SHARE = 0.7
+
+# NOTE Number of cells of the bars x bins matrix built at once,
+# it limits the memory used by distribute_volume.
+DISTRIBUTE_CHUNK_CELLS = 5_000_000
+
+
+def get_sessions(index: pd.DatetimeIndex) -> Tuple[pd.DatetimeIndex, np.ndarray]:
+    """
+    Get session dates and the session number of every bar.
+    The session is the calendar date in the timezone of the index,
+    e.g. America/New_York for Yahoo Finance intraday data.
+    The index must be sorted.
+    """
+    normalized = index.normalize()
+    values = normalized.asi8
+    is_session_start = np.ones(len(values), dtype=bool)
+    is_session_start[1:] = values[1:] != values[:-1]
+    session_codes = np.cumsum(is_session_start) - 1
+    return normalized[is_session_start], session_codes
+
+
+def get_tick_bins(low: float, high: float, tick_size: float) -> Tuple[int, np.ndarray]:
+    """
+    Get fixed tick-size bins that cover the low-high range.
+    Bin k spans [k * tick_size, (k + 1) * tick_size), so the bins
+    of any profiles with the same tick_size are aligned and can be added.
+    Return the number of the first bin and the bin edges.
+    """
+    if tick_size <= 0:
+        raise ValueError(f"get_tick_bins: {tick_size=} must be positive")
+    first_bin = int(np.floor(low / tick_size))
+    last_bin = int(np.floor(high / tick_size))
+    # NOTE Rounding errors may put an edge on the wrong side of the price
+    if first_bin * tick_size > low:
+        first_bin -= 1
+    if (last_bin + 1) * tick_size < high:
+        last_bin += 1
+    return first_bin, np.arange(first_bin, last_bin + 2) * tick_size
+
+
+def get_value_area_indexes(
+    volume_profile: np.ndarray, share: float = VALUE_AREA_SHARE
+) -> Tuple[int, int]:
+    """
+    Get the first and the last bin of the value area, the middle share
+    of the profile volume: equal volumes are cut from the bottom and the top.
+    Uses prefix sums and binary search instead of trimming bin by bin.
+    """
+    cum_volume = np.cumsum(volume_profile, dtype=np.float64)
+    if len(cum_volume) == 0 or cum_volume[-1] <= 0:
+        return 0, len(volume_profile) - 1
+    total_volume = cum_volume[-1]
+    cut_volume = total_volume * (1 - share) / 2
+    first = int(np.searchsorted(cum_volume, cut_volume, side="right"))
+    last = int(np.searchsorted(cum_volume, total_volume - cut_volume, side="left"))
+    return first, min(last, len(cum_volume) - 1)
+
+
+def distribute_volume(
+    low: np.ndarray,
+    high: np.ndarray,
+    close: np.ndarray,
+    volume: np.ndarray,
+    bin_edges: np.ndarray,
+) -> np.ndarray:
+    """
+    Spread the volume of every bar uniformly across its Low-High range.
+    Return a bars x bins matrix, the rows sum to the bar volumes
+    if the bars are inside the bin edges.
+    The volume of a bar with High == Low goes to the bin of its Close.
+    """
+    low = low[:, None]
+    high = high[:, None]
+    bar_range = high - low
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Share of the bar range below every bin edge
+        share_below = np.clip((bin_edges[None, :] - low) / bar_range, 0, 1)
+    res = np.diff(share_below, axis=1) * volume[:, None]
+
+    flat_positions = np.flatnonzero(bar_range[:, 0] <= 0)
+    if len(flat_positions) > 0:
+        flat_close = close[flat_positions]
+        # Like np.histogram, the last bin includes its right edge
+        flat_bins = np.clip(
+            np.searchsorted(bin_edges, flat_close, side="right") - 1,
+            0,
+            len(bin_edges) - 2,
+        )
+        inside = (flat_close >= bin_edges[0]) & (flat_close <= bin_edges[-1])
+        res[flat_positions] = 0
+        res[flat_positions[inside], flat_bins[inside]] = volume[flat_positions[inside]]
+    return np.nan_to_num(res)
+
+
+@dataclass
+class SessionVolumeProfiles:
+    """
+    Volume profiles of all sessions on common price bins.
+    volumes is a sessions x bins matrix.
+    session_starts[k] is the position of the first bar of session k in the source df.
+    """
+
+    sessions: pd.DatetimeIndex
+    session_starts: np.ndarray
+    bin_edges: np.ndarray
+    volumes: np.ndarray
+
+    def composite(self, last_sessions_count: Optional[int] = None) -> np.ndarray:
+        """
+        Get the volume profile of the last sessions, or of all sessions if None.
+        It is a sum of the rows of the matrix, no raw bars are needed.
+        """
+        if last_sessions_count is None:
+            return self.volumes.sum(axis=0)
+        return self.volumes[-last_sessions_count:].sum(axis=0)
+
+    def get_bars_slice(self, last_sessions_count: int) -> slice:
+        """
+        Get the slice of the source df rows that belong to the last sessions.
+        """
+        return slice(int(self.session_starts[-last_sessions_count]), None)
+
+
+def compute_session_profiles(
+    df: pd.DataFrame,
+    bins_count: int = 49,
+    bin_edges: Optional[np.ndarray] = None,
+) -> SessionVolumeProfiles:
+    """
+    Compute volume profiles of every session of df in one vectorized pass.
+    By default, the bins_count bins span from the lowest Low to the highest High.
+    The df index must be sorted.
+    """
+    if not df.index.is_monotonic_increasing:
+        raise ValueError("compute_session_profiles: df index must be sorted ascending")
+    low = df["Low"].to_numpy(dtype=np.float64)
+    high = df["High"].to_numpy(dtype=np.float64)
+    close = df["Close"].to_numpy(dtype=np.float64)
+    volume = df["Volume"].to_numpy(dtype=np.float64)
+    if bin_edges is None:
+        bin_edges = np.linspace(np.nanmin(low), np.nanmax(high), bins_count + 1)
+
+    sessions, session_codes = get_sessions(index=df.index)  # type: ignore
+    session_starts = np.searchsorted(session_codes, np.arange(len(sessions)))
+    volumes = np.zeros((len(sessions), len(bin_edges) - 1), dtype=np.float64)
+    chunk_size = max(DISTRIBUTE_CHUNK_CELLS // (len(bin_edges) - 1), 1)
+    for chunk_start in range(0, df.shape[0], chunk_size):
+        chunk = slice(chunk_start, chunk_start + chunk_size)
+        bars_volumes = distribute_volume(
+            low=low[chunk],
+            high=high[chunk],
+            close=close[chunk],
+            volume=volume[chunk],
+            bin_edges=bin_edges,
+        )
+        # NOTE The bars are sorted, so the bars of every session are consecutive
+        chunk_codes = session_codes[chunk]
+        group_starts = np.flatnonzero(np.diff(chunk_codes, prepend=-1) != 0)
+        volumes[chunk_codes[group_starts]] += np.add.reduceat(
+            bars_volumes, group_starts, axis=0
+        )
+    return SessionVolumeProfiles(
+        sessions=sessions,
+        session_starts=session_starts,
+        bin_edges=bin_edges,
+        volumes=volumes,
+    )
+
+
+@dataclass
+class VolumeProfile:
+    """
+    Volume profile on price bins, volumes[k] is between bin_edges[k] and bin_edges[k + 1].
+    """
+
+    bin_edges: np.ndarray
+    volumes: np.ndarray
+
+    def get_point_of_control(self) -> float:
+        """
+        Get the middle price of the bin with the largest volume.
+        """
+        index = int(np.argmax(self.volumes))
+        return float((self.bin_edges[index] + self.bin_edges[index + 1]) / 2)
+
+    def get_value_area(self, share: float = VALUE_AREA_SHARE) -> Tuple[float, float]:
+        """
+        Get the low and the high price of the value area.
+        """
+        first, last = get_value_area_indexes(volume_profile=self.volumes, share=share)
+        return float(self.bin_edges[first]), float(self.bin_edges[last + 1])
+
+
+class VolumeProfileStore:
+    """
+    Per-session volume profiles of one ticker on fixed tick-size bins.
+    Profiles of any sessions can be added together, so composites for
+    any date range are built without the raw bars.
+
+    Only the bins between the lowest and the highest traded price
+    of a session are kept, in a CSR-like layout:
+    the profile of session k starts at bin first_bins[k],
+    its volumes are data[offsets[k]:offsets[k + 1]].
+    Sessions are the calendar dates of the bars, sorted.
+    """
+
+    def __init__(self, tick_size: float = VOLUME_PROFILE_TICK_SIZE):
+        self.tick_size = tick_size
+        self.sessions = np.empty(0, dtype="datetime64[ns]")
+        self.first_bins = np.empty(0, dtype=np.int64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.data = np.empty(0, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    @classmethod
+    def load(
+        cls, file_name: str, tick_size: float = VOLUME_PROFILE_TICK_SIZE
+    ) -> "VolumeProfileStore":
+        """
+        Load the store from the .npz file, or return an empty store if there is no file.
+        """
+        res = cls(tick_size=tick_size)
+        if not os.path.exists(file_name):
+            return res
+        with np.load(file_name) as arrays:
+            stored_tick_size = float(arrays["tick_size"])
+            if not np.isclose(stored_tick_size, tick_size):
+                raise ValueError(
+                    f"VolumeProfileStore.load: {file_name=} has {stored_tick_size=}, {tick_size=}"
+                )
+            res.sessions = arrays["sessions"]
+            res.first_bins = arrays["first_bins"]
+            res.offsets = arrays["offsets"]
+            res.data = arrays["data"]
+        return res
+
+    def save(self, file_name: str) -> None:
+        # NOTE Write to a temporary file and rename it,
+        # so that readers never see a half-written file.
+        with open(f"{file_name}.tmp", "wb") as file:
+            np.savez(
+                file,
+                tick_size=np.float64(self.tick_size),
+                sessions=self.sessions,
+                first_bins=self.first_bins,
+                offsets=self.offsets,
+                data=self.data,
+            )
+        os.replace(f"{file_name}.tmp", file_name)
+
+    def add_bars(self, df: pd.DataFrame) -> None:
+        """
+        Compute profiles of the sessions of df and add them to the store.
+        Stored sessions that are present in df are replaced,
+        because the last of them may have been incomplete.
+        """
+        if df.shape[0] == 0:
+            return
+        first_bin, bin_edges = get_tick_bins(
+            low=np.nanmin(df["Low"].to_numpy(dtype=np.float64)),
+            high=np.nanmax(df["High"].to_numpy(dtype=np.float64)),
+            tick_size=self.tick_size,
+        )
+        profiles = compute_session_profiles(df, bin_edges=bin_edges)
+        new_sessions = profiles.sessions
+        if new_sessions.tz is not None:
+            new_sessions = new_sessions.tz_localize(None)
+        new_sessions = new_sessions.to_numpy(dtype="datetime64[ns]")
+
+        # Trim the empty bins below and above the traded range of every session
+        has_volume = profiles.volumes > 0
+        bins_count = has_volume.shape[1]
+        lows = np.argmax(has_volume, axis=1)
+        highs = bins_count - np.argmax(has_volume[:, ::-1], axis=1)
+        highs[~has_volume.any(axis=1)] = lows[~has_volume.any(axis=1)]
+
+        rows: List[Tuple[np.datetime64, int, np.ndarray]] = [
+            (
+                self.sessions[counter],
+                int(self.first_bins[counter]),
+                self.data[self.offsets[counter] : self.offsets[counter + 1]],
+            )
+            for counter in np.flatnonzero(~np.isin(self.sessions, new_sessions))
+        ]
+        rows.extend(
+            (
+                new_sessions[counter],
+                first_bin + int(lows[counter]),
+                profiles.volumes[counter, lows[counter] : highs[counter]],
+            )
+            for counter in range(len(new_sessions))
+        )
+        rows.sort(key=lambda row: row[0])
+
+        self.sessions = np.array([row[0] for row in rows], dtype="datetime64[ns]")
+        self.first_bins = np.array([row[1] for row in rows], dtype=np.int64)
+        self.offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum([len(row[2]) for row in rows])
+        self.data = np.concatenate([row[2] for row in rows]).astype(np.float64)
+
+    def composite(
+        self,
+        start: Optional[Union[str, pd.Timestamp]] = None,
+        end: Optional[Union[str, pd.Timestamp]] = None,
+    ) -> VolumeProfile:
+        """
+        Get the composite profile of the sessions from start to end, both included.
+        None means the first or the last stored session.
+        """
+        first = 0
+        last = len(self.sessions)
+        if start is not None:
+            first = int(
+                np.searchsorted(
+                    self.sessions, np.datetime64(pd.Timestamp(start)), "left"
+                )
+            )
+        if end is not None:
+            last = int(
+                np.searchsorted(
+                    self.sessions, np.datetime64(pd.Timestamp(end)), "right"
+                )
+            )
+        if first >= last:
+            raise ValueError(
+                f"VolumeProfileStore.composite: no sessions between {start=} and {end=}"
+            )
+
+        first_bins = self.first_bins[first:last]
+        offsets = self.offsets[first : last + 1]
+        lengths = np.diff(offsets)
+        min_bin = int(first_bins.min())
+        max_bin = int((first_bins + lengths).max())
+        # NOTE Position of every stored volume in the composite bins,
+        # all sessions are added in one bincount call
+        positions = np.repeat(first_bins - min_bin - offsets[:-1], lengths) + np.arange(
+            offsets[0], offsets[-1]
+        )
+        volumes = np.bincount(
+            positions,
+            weights=self.data[offsets[0] : offsets[-1]],
+            minlength=max_bin - min_bin,
+        )
+        return VolumeProfile(
+            bin_edges=np.arange(min_bin, max_bin + 1) * self.tick_size, volumes=volumes
+        )
+
+
+def update_volume_profile_store(
+    ticker: str,
+    tick_size: float = VOLUME_PROFILE_TICK_SIZE,
+    store_dir: str = VOLUME_PROFILE_STORE_DIR,
+    get_ohlc_func: Callable = get_ohlc_from_yf,
+    period: str = "5d",
+    interval: str = "1m",
+) -> VolumeProfileStore:
+    """
+    Fetch the recent intraday bars of the ticker, add their session profiles
+    to its store file in store_dir and return the store.
+    Yahoo Finance gives 1m bars for the last days only, so run it regularly
+    to accumulate months of profiles.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    file_name = os.path.join(store_dir, f"{ticker}_{interval}.npz")
+    ohlc_df = get_ohlc_func(ticker=ticker, period=period, interval=interval)
+    with file_lock(f"{file_name}.lock"):
+        store = VolumeProfileStore.load(file_name=file_name, tick_size=tick_size)
+        store.add_bars(ohlc_df)
+        store.save(file_name=file_name)
+    return store
@@ -1,20 +1,63 @@
 import datetime
-from typing import Callable, List, Optional, Set, Tuple
+import os
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable, List, Optional, Set, Tuple, Union
 
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 
 from constants import ATR_SMOOTHING_N, DEFAULT_RESULTS_FILE
-from misc import fill_is_min_max, get_chart_annotation_1d
+from misc import (
+    PLOTLY_COLORWAY,
+    PLOTLY_PLOT_BGCOLOR,
+    BatchImageExporter,
+    add_atr_col_to_df,
+    anchored_vwaps_and_stds_from_arrays,
+    anchored_vwaps_from_arrays,
+    decimate_line,
+    decimate_ohlc,
+    fill_is_min_max,
+    get_anchor_positions,
+    get_chart_annotation_1d,
+    get_image_format,
+    get_typical_x_volume,
+    get_vwap_band_column,
+    span,
+    update_min_max_checkpoint_file,
+)
+from render_cache import RenderCache, get_chart_hash
 
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
 
-def _add_last_min_max_dates(
-    input_df: pd.DataFrame, anchor_dates: Set[pd.Timestamp]
-) -> Tuple[pd.DataFrame, Set[pd.Timestamp]]:
+# NOTE plotly: Plotly figure saved with kaleido, agg: Matplotlib figure
+# drawn with the Agg rasterizer, much faster for many charts
+CHART_BACKENDS = ("plotly", "agg")
+
+# NOTE Hours of the tz-naive chart index hidden by hide_extended_hours,
+# from 21:00 to 13:30. You may have to adjust these bounds for hours.
+_EXTENDED_HOURS_BOUNDS = [21, 13.5]
+
+
+def _get_last_min_max_dates(
+    df: pd.DataFrame,
+    min_max_checkpoint_file: Optional[str] = None,
+) -> Tuple[pd.DataFrame, Optional[pd.Timestamp], Optional[pd.Timestamp]]:
     """
-    Add dates of last min and max to the set of dates.
+    Get dates of last min and max.
+    If min_max_checkpoint_file is passed, continue the search
+    from the state saved there and process only the new bars.
+    The new columns are added to df itself, pass a shallow copy
+    if the caller's DataFrame must stay unchanged.
     """
-    df = input_df.copy()
+    if min_max_checkpoint_file is not None:
+        if f"atr_{ATR_SMOOTHING_N}" not in df.columns:
+            df = add_atr_col_to_df(df=df, inplace=True)
+        checkpoint = update_min_max_checkpoint_file(
+            df=df, checkpoint_file=min_max_checkpoint_file
+        )
+        return df, checkpoint.last_min_date, checkpoint.last_max_date
     if (
         f"atr_{ATR_SMOOTHING_N}" not in df.columns
         or "is_min" not in df.columns
@@ -23,15 +66,18 @@ def _add_last_min_max_dates(
         df = fill_is_min_max(df=df)
     last_min_date = df[df["is_min"] == True].index.max()  # pylint: disable=C0121
     last_max_date = df[df["is_max"] == True].index.max()  # pylint: disable=C0121
-    anchor_dates.update({last_min_date, last_max_date})
 
-    # NOTE return not only anchor_dates but also pd.DataFrame,
+    # NOTE return not only the dates but also pd.DataFrame,
     # because you may want later to use somewhere
     # the new columns is_min, is_max, atr_{ATR_SMOOTHING_N}
-    return df, anchor_dates
+    return (
+        df,
+        None if pd.isna(last_min_date) else last_min_date,
+        None if pd.isna(last_max_date) else last_max_date,
+    )
 
 
-def _preprocess_anchor_dates(
+def preprocess_anchor_dates(
     anchor_dates: List[str],
 ) -> Tuple[Set[pd.Timestamp], Optional[pd.Timestamp]]:
     """
@@ -69,6 +115,522 @@ def _preprocess_anchor_dates(
     return set(anchor_points_ts), min_anchor_date
 
 
+@dataclass
+class VWAPChartData:
+    """
+    Result of the compute stage of vwaps_plot_build_save.
+    df: bars from min_threshold_point on, with A_VWAP_1 ... A_VWAP_K columns,
+    and the VWAP band columns if band_multipliers are not empty.
+    anchor_points: anchors in the order of A_VWAP_1 ... A_VWAP_K columns.
+    """
+
+    df: pd.DataFrame
+    anchor_points: List[pd.Timestamp]
+    min_threshold_point: pd.Timestamp
+    last_min_date: Optional[pd.Timestamp]
+    last_max_date: Optional[pd.Timestamp]
+    interval: Optional[str]
+    band_multipliers: List[float] = field(default_factory=list)
+
+    def get_band_columns(self) -> List[Tuple[int, str]]:
+        """
+        Get (anchor number, column) of all VWAP band columns,
+        see get_vwap_band_column.
+        """
+        return [
+            (counter, get_vwap_band_column(counter, multiplier, side))
+            for counter in range(1, len(self.anchor_points) + 1)
+            for multiplier in self.band_multipliers
+            for side in ("UP", "DN")
+        ]
+
+    def get_levels(self) -> pd.DataFrame:
+        """
+        Get the last values of all anchored VWAPs as a table,
+        one row per anchor, with the distance from the last Close
+        in price units, percent and ATR units.
+        """
+        last_row = self.df.iloc[-1]
+        close = float(last_row["Close"])
+        atr = np.nan
+        if f"atr_{ATR_SMOOTHING_N}" in self.df.columns:
+            atr = float(last_row[f"atr_{ATR_SMOOTHING_N}"])
+        rows = list()
+        for counter, anchor in enumerate(self.anchor_points, start=1):
+            vwap = float(last_row[f"A_VWAP_{counter}"])
+            anchor_kind = "custom"
+            if anchor == self.last_min_date:
+                anchor_kind = "last_min"
+            elif anchor == self.last_max_date:
+                anchor_kind = "last_max"
+            rows.append(
+                {
+                    "ticker": self.df.attrs.get("ticker"),
+                    "interval": self.interval,
+                    "date": self.df.index[-1],
+                    "close": close,
+                    f"atr_{ATR_SMOOTHING_N}": atr,
+                    "anchor": anchor,
+                    "anchor_kind": anchor_kind,
+                    "vwap": vwap,
+                    "distance": close - vwap,
+                    "distance_pct": (close - vwap) / vwap * 100,
+                    "distance_atr": (close - vwap) / atr if atr > 0 else np.nan,
+                    "last_min_date": self.last_min_date,
+                    "last_max_date": self.last_max_date,
+                }
+            )
+        return pd.DataFrame(rows).sort_values("anchor", ignore_index=True)
+
+
+@dataclass
+class ChartBars:
+    """
+    Bars prepared once and shared by all charts of a ticker, see prepare_chart_bars.
+    df: the input bars with tz-naive index, plus the ATR, is_min and is_max columns
+    if the last min and max were searched. Its OHLCV data is not copied.
+    typical_x_volume and volume: float64 arrays for the anchored VWAPs.
+    """
+
+    df: pd.DataFrame
+    typical_x_volume: np.ndarray
+    volume: np.ndarray
+    last_min_max_searched: bool
+    last_min_date: Optional[pd.Timestamp]
+    last_max_date: Optional[pd.Timestamp]
+
+
+def prepare_chart_bars(
+    input_df: pd.DataFrame,
+    add_last_min_max: bool = False,
+    min_max_checkpoint_file: Optional[str] = None,
+) -> ChartBars:
+    """
+    Compute everything that doesn't depend on the anchor dates:
+    the typical price multiplied by volume, the ATR and the last min and max.
+    Pass the result as chart_bars to compute_vwaps or vwaps_plot_build_save
+    to build several charts of the same bars without computing it again.
+    input_df is not changed.
+    """
+    # NOTE The shallow copy shares the data with input_df.
+    # The columns added later go to the copy only.
+    df = input_df.copy(deep=False)
+
+    # Otherwise, TypeError: Invalid comparison between
+    # dtype=datetime64[ns, America/New_York] and Timestamp
+    if df.index.tz is not None:  # type: ignore
+        df.index = df.index.tz_convert(None)  # type: ignore
+
+    last_min_date = last_max_date = None
+    if add_last_min_max:
+        with span("indicators", bars=df.shape[0]):
+            df, last_min_date, last_max_date = _get_last_min_max_dates(
+                df=df,
+                min_max_checkpoint_file=min_max_checkpoint_file,
+            )
+    typical_x_volume, volume = get_typical_x_volume(df=df)
+    return ChartBars(
+        df=df,
+        typical_x_volume=typical_x_volume,
+        volume=volume,
+        last_min_max_searched=add_last_min_max,
+        last_min_date=last_min_date,
+        last_max_date=last_max_date,
+    )
+
+
+def compute_vwaps(
+    input_df: pd.DataFrame,
+    anchor_dates: List[str],
+    add_last_min_max: bool = False,
+    min_max_checkpoint_file: Optional[str] = None,
+    chart_bars: Optional[ChartBars] = None,
+    band_multipliers: Optional[List[float]] = None,
+) -> VWAPChartData:
+    """
+    Compute stage of vwaps_plot_build_save, without any plotting.
+    1. Transform every element of anchor_dates to pd.Timestamp.
+    2. Compute the typical price, see prepare_chart_bars.
+    3. For each anchor date, create a column with Anchored VWAP.
+    4. Cut the bars before the chart start date.
+
+    If chart_bars prepared from input_df is passed, step 2 and the search
+    for the last min and max are skipped.
+
+    If band_multipliers are passed, e.g. [1, 2], the VWAP bands are added
+    for every anchor: the VWAP plus and minus multiplier volume-weighted
+    standard deviations of the typical price since the anchor.
+    They come from the same running sums as the VWAPs,
+    see anchored_vwaps_and_stds_from_arrays.
+    """
+    band_multipliers = list(band_multipliers) if band_multipliers else list()
+    if any(multiplier <= 0 for multiplier in band_multipliers):
+        raise ValueError(f"compute_vwaps: {band_multipliers=} must be positive")
+    if chart_bars is None:
+        chart_bars = prepare_chart_bars(
+            input_df=input_df,
+            add_last_min_max=add_last_min_max,
+            min_max_checkpoint_file=min_max_checkpoint_file,
+        )
+    elif add_last_min_max and not chart_bars.last_min_max_searched:
+        raise ValueError(
+            "compute_vwaps: add_last_min_max is True, but chart_bars were prepared without it"
+        )
+
+    df = chart_bars.df
+    if not df.index.is_monotonic_increasing:
+        raise ValueError("compute_vwaps: df index must be sorted ascending")
+    with span("anchor_resolution"):
+        anchor_points, min_threshold_point = preprocess_anchor_dates(
+            anchor_dates=anchor_dates
+        )
+        last_min_date = last_max_date = None
+        if add_last_min_max:
+            last_min_date = chart_bars.last_min_date
+            last_max_date = chart_bars.last_max_date
+            anchor_points.update(
+                {date for date in (last_min_date, last_max_date) if date is not None}
+            )
+        if min_threshold_point is None:
+            min_threshold_point = min(anchor_points)
+        anchor_points_list = list(anchor_points)
+        anchor_positions = get_anchor_positions(
+            index=df.index, anchors=anchor_points_list  # type: ignore
+        )
+        first_position = int(df.index.searchsorted(min_threshold_point, side="left"))
+
+    # Add anchored VWAP column for every date passed in anchor_points.
+    # NOTE All anchors share the same two cumulative sums,
+    # see compute_anchored_vwaps for details.
+    # VWAPs are computed only for the bars on the chart.
+    with span(
+        "vwap_compute",
+        bars=df.shape[0] - first_position,
+        anchors=len(anchor_points_list),
+    ):
+        stds = None
+        if len(band_multipliers) > 0:
+            vwaps, stds = anchored_vwaps_and_stds_from_arrays(
+                typical_x_volume=chart_bars.typical_x_volume,
+                volume=chart_bars.volume,
+                anchor_positions=anchor_positions,
+                first_position=first_position,
+            )
+        else:
+            vwaps = anchored_vwaps_from_arrays(
+                typical_x_volume=chart_bars.typical_x_volume,
+                volume=chart_bars.volume,
+                anchor_positions=anchor_positions,
+                first_position=first_position,
+            )
+        df = df.iloc[first_position:]
+        for counter in range(len(anchor_points_list)):
+            df[f"A_VWAP_{counter + 1}"] = vwaps[:, counter]
+        if stds is not None:
+            for counter in range(len(anchor_points_list)):
+                for multiplier in band_multipliers:
+                    band_width = multiplier * stds[:, counter]
+                    df[get_vwap_band_column(counter + 1, multiplier, "UP")] = (
+                        vwaps[:, counter] + band_width
+                    )
+                    df[get_vwap_band_column(counter + 1, multiplier, "DN")] = (
+                        vwaps[:, counter] - band_width
+                    )
+
+    return VWAPChartData(
+        df=df,
+        anchor_points=anchor_points_list,
+        min_threshold_point=min_threshold_point,
+        last_min_date=last_min_date,
+        last_max_date=last_max_date,
+        interval=input_df.attrs.get("interval"),
+        band_multipliers=band_multipliers,
+    )
+
+
+def render_vwaps_chart(
+    chart_data: VWAPChartData,
+    chart_title: str = "",
+    chart_annotation_func: Callable = get_chart_annotation_1d,
+    file_name: str = DEFAULT_RESULTS_FILE,
+    hide_extended_hours: bool = False,
+    image_exporter: Optional[BatchImageExporter] = None,
+    max_points: Optional[int] = None,
+    backend: str = "plotly",
+    show_bands: bool = True,
+) -> Union[go.Figure, "Figure"]:
+    """
+    Render stage of vwaps_plot_build_save.
+    Build a candlestick chart with all Anchored VWAPs and save it.
+    If image_exporter is passed, the figure is handed to it
+    instead of being saved immediately. See BatchImageExporter.
+
+    If max_points is passed, at most max_points candles and VWAP points
+    are sent to the renderer. Candles are merged into OHLC buckets,
+    VWAP lines are downsampled with LTTB. The annotation uses all bars.
+
+    backend is one of CHART_BACKENDS. With agg, a Matplotlib figure
+    of the same size, colors and layout is drawn and saved without kaleido,
+    see _render_vwaps_chart_agg. image_exporter works with plotly only.
+
+    The VWAP bands of chart_data, if any, are drawn as dotted lines
+    of the color of their VWAP, unless show_bands is False.
+    """
+    if backend not in CHART_BACKENDS:
+        raise ValueError(
+            f"render_vwaps_chart: {backend=}, must be one of {CHART_BACKENDS}"
+        )
+    if backend == "agg":
+        if image_exporter is not None:
+            raise ValueError(
+                "render_vwaps_chart: image_exporter works with the plotly backend only"
+            )
+        return _render_vwaps_chart_agg(
+            chart_data=chart_data,
+            chart_title=chart_title,
+            annotation_text=chart_annotation_func(df=chart_data.df),
+            file_name=file_name,
+            hide_extended_hours=hide_extended_hours,
+            max_points=max_points,
+            show_bands=show_bands,
+        )
+
+    with span("figure_build", bars=chart_data.df.shape[0], max_points=max_points):
+        df = chart_data.df
+        candles_df = df
+        if max_points is not None:
+            candles_df = decimate_ohlc(df=df, max_points=max_points)
+        # NOTE The traces are passed as dicts, not as go.Candlestick and go.Scatter.
+        # go.Figure deep-copies trace objects, so their data would be copied twice.
+        plot_data = [
+            dict(
+                type="candlestick",
+                x=candles_df.index,
+                open=candles_df["Open"],
+                high=candles_df["High"],
+                low=candles_df["Low"],
+                close=candles_df["Close"],
+                line=dict(width=1),
+            )
+        ]
+        for counter in range(1, len(chart_data.anchor_points) + 1):
+            vwap_line = df[f"A_VWAP_{counter}"]
+            if max_points is not None:
+                vwap_line = decimate_line(series=vwap_line, max_points=max_points)
+            plot_data.append(
+                dict(
+                    type="scatter",
+                    x=vwap_line.index,
+                    y=vwap_line,
+                    mode="lines",
+                ),
+            )
+        # NOTE The bands come after all VWAP lines,
+        # so that the VWAP lines keep their default colors
+        if show_bands:
+            for counter, band_column in chart_data.get_band_columns():
+                band_line = df[band_column]
+                if max_points is not None:
+                    band_line = decimate_line(series=band_line, max_points=max_points)
+                plot_data.append(
+                    dict(
+                        type="scatter",
+                        x=band_line.index,
+                        y=band_line,
+                        mode="lines",
+                        line=dict(
+                            color=PLOTLY_COLORWAY[counter % len(PLOTLY_COLORWAY)],
+                            width=1,
+                            dash="dot",
+                        ),
+                    ),
+                )
+        fig = go.Figure(data=plot_data)
+        # fig.update_layout(
+        #     margin=dict(l=10, r=10, t=10, b=10),
+        # )
+
+        # Add title to the chart if data is available
+        # and increase the top margin to fit the title
+        fig.update_layout(
+            title=chart_title,
+            title_x=0.5,
+            title_y=0.99,
+            margin=dict(l=10, r=10, t=20, b=10),
+        )
+        fig.add_annotation(
+            xref="x domain",
+            yref="y domain",
+            x=0.01,
+            y=0.99,
+            text=chart_annotation_func(df=df),
+            showarrow=False,
+            # row=1,
+            # col=1,
+        )
+
+        fig.update_xaxes(
+            rangeslider_visible=False,
+            rangebreaks=[
+                dict(bounds=["sat", "mon"]),  # hide weekends, Saturday to before Monday
+            ],
+        )
+        if hide_extended_hours and (chart_data.interval != "1d"):
+            fig.update_xaxes(
+                rangebreaks=[
+                    dict(
+                        bounds=_EXTENDED_HOURS_BOUNDS,
+                        pattern="hour",
+                    ),  # hide hours outside of trading hours
+                ],
+            )
+
+        fig.update_layout(showlegend=False)
+
+    # NOTE it requires kaleido package,
+    # see https://stackoverflow.com/a/59819140/3139228
+    if image_exporter is not None:
+        image_exporter.add(fig=fig, file_name=file_name)
+    else:
+        with span("image_write", images=1):
+            fig.write_image(file_name)
+    return fig
+
+
+def _render_vwaps_chart_agg(
+    chart_data: VWAPChartData,
+    chart_title: str,
+    annotation_text: str,
+    file_name: str,
+    hide_extended_hours: bool,
+    max_points: Optional[int],
+    show_bands: bool,
+) -> "Figure":
+    """
+    Agg backend of render_vwaps_chart.
+    Like with the rangebreaks of the Plotly chart, the weekends take no space,
+    and if hide_extended_hours is True, the hours of _EXTENDED_HOURS_BOUNDS
+    don't either, the intraday bars in them are not drawn.
+    Holidays and the other gaps are shown, see get_chart_x.
+    The candles are two collections, see draw_candles.
+    """
+    # NOTE matplotlib is loaded only when an Agg chart is drawn,
+    # not by every import of misc or of this module
+    # pylint: disable=C0415
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    from misc.agg_chart import draw_candles, get_chart_x, set_position_axis_dates
+
+    image_format = get_image_format(file_name=file_name)
+    with span(
+        "figure_build",
+        bars=chart_data.df.shape[0],
+        max_points=max_points,
+        backend="agg",
+    ):
+        df = chart_data.df
+        hidden_hours = None
+        if hide_extended_hours and (chart_data.interval != "1d"):
+            hidden_hours = _EXTENDED_HOURS_BOUNDS
+            hours = df.index.hour + df.index.minute / 60  # type: ignore
+            df = df[
+                (hours >= _EXTENDED_HOURS_BOUNDS[1])
+                & (hours < _EXTENDED_HOURS_BOUNDS[0])
+            ]
+        # NOTE The time of the daily bars may move by an hour with DST
+        chart_x = get_chart_x(
+            index=(
+                df.index.normalize()  # type: ignore
+                if chart_data.interval == "1d"
+                else df.index
+            ),
+            hidden_hours=hidden_hours,
+        )
+        candles_df = df
+        if max_points is not None:
+            candles_df = decimate_ohlc(df=df, max_points=max_points)
+        # NOTE The buckets of decimate_ohlc are as wide as the bars merged into them
+        candle_width = 0.8 * max(df.shape[0] / max(candles_df.shape[0], 1), 1)
+
+        # NOTE 700 x 500 pixels at dpi 100, the default image size of kaleido
+        fig = Figure(figsize=(7, 5))
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        ax.set_facecolor(PLOTLY_PLOT_BGCOLOR)
+        ax.grid(color="white", linewidth=1)
+        ax.set_axisbelow(True)
+        for spine in ax.spines.values():
+            spine.set_visible(False)
+        ax.tick_params(length=0, labelsize=8)
+
+        draw_candles(
+            ax=ax,
+            x=chart_x[df.index.get_indexer(candles_df.index)],
+            open_values=candles_df["Open"].to_numpy(),
+            high=candles_df["High"].to_numpy(),
+            low=candles_df["Low"].to_numpy(),
+            close=candles_df["Close"].to_numpy(),
+            width=candle_width,
+        )
+        for counter in range(1, len(chart_data.anchor_points) + 1):
+            vwap_line = df[f"A_VWAP_{counter}"]
+            if max_points is not None:
+                vwap_line = decimate_line(series=vwap_line, max_points=max_points)
+            # NOTE The candles are the first trace, like in the Plotly chart
+            ax.plot(
+                chart_x[df.index.get_indexer(vwap_line.index)],
+                vwap_line.to_numpy(),
+                color=PLOTLY_COLORWAY[counter % len(PLOTLY_COLORWAY)],
+                linewidth=2,
+            )
+        if show_bands:
+            for counter, band_column in chart_data.get_band_columns():
+                band_line = df[band_column]
+                if max_points is not None:
+                    band_line = decimate_line(series=band_line, max_points=max_points)
+                ax.plot(
+                    chart_x[df.index.get_indexer(band_line.index)],
+                    band_line.to_numpy(),
+                    color=PLOTLY_COLORWAY[counter % len(PLOTLY_COLORWAY)],
+                    linewidth=1,
+                    linestyle=":",
+                )
+        set_position_axis_dates(
+            ax=ax,
+            index=df.index,  # type: ignore
+            date_format=(
+                "%Y-%m-%d"
+                if chart_data.interval in ("1d", "5d", "1wk", "1mo", "3mo")
+                else "%m-%d %H:%M"
+            ),
+            x=chart_x,
+        )
+        ax.set_xlim(-1, chart_x[-1] + 1 if chart_x.shape[0] > 0 else 1)
+
+        fig.suptitle(chart_title, y=0.99, fontsize=12)
+        ax.text(
+            0.01,
+            0.99,
+            annotation_text.replace("<br>", "\n"),
+            transform=ax.transAxes,
+            ha="left",
+            va="top",
+            fontsize=9,
+        )
+        fig.subplots_adjust(left=0.08, right=0.98, top=0.94, bottom=0.06)
+
+    with span("image_write", images=1, backend="agg"):
+        # NOTE The fastest zlib level, the charts are mostly background
+        fig.savefig(
+            file_name,
+            format=image_format,
+            dpi=100,
+            pil_kwargs={"compress_level": 1} if image_format == "png" else None,
+        )
+    return fig
+
+
 def vwaps_plot_build_save(
     input_df: pd.DataFrame,
     anchor_dates: List[str],
@@ -78,10 +640,18 @@ def vwaps_plot_build_save(
     file_name: str = DEFAULT_RESULTS_FILE,
     print_df: bool = True,
     hide_extended_hours: bool = False,
-) -> None:
+    min_max_checkpoint_file: Optional[str] = None,
+    image_exporter: Optional[BatchImageExporter] = None,
+    max_points: Optional[int] = None,
+    chart_bars: Optional[ChartBars] = None,
+    render_cache: Optional[RenderCache] = None,
+    backend: str = "plotly",
+    band_multipliers: Optional[List[float]] = None,
+    show_bands: bool = True,
+) -> VWAPChartData:
     """
     1. Transform every element of anchor_dates to pd.Timestamp.
-    2. Add a new column with a typical price.
+    2. Compute the typical price.
     3. For each anchor date, create a column with Anchored VWAP.
     4. Build a candlestick chart with all Anchored VWAPs and save it.
 
@@ -89,113 +659,85 @@ def vwaps_plot_build_save(
     For example, x2024-08-03 00:00:00 instead of 2024-08-03 00:00:00.
     By default, the chart will start from the minimum date in the anchor_dates list.
     See example in the readme.
-    """
 
-    df = input_df.copy()
+    If add_last_min_max is True and min_max_checkpoint_file is passed,
+    the search for the last min and max continues from the state
+    saved in that file, so only the new bars are processed.
 
-    # Otherwise, TypeError: Invalid comparison between
-    # dtype=datetime64[ns, America/New_York] and Timestamp
-    df.index = df.index.tz_convert(None)  # type: ignore
+    If image_exporter is passed, the figure is handed to it
+    instead of being saved immediately. See BatchImageExporter.
 
-    anchor_points, min_threshold_point = _preprocess_anchor_dates(
-        anchor_dates=anchor_dates
-    )
-    if add_last_min_max:
-        df, anchor_points = _add_last_min_max_dates(
-            input_df=df, anchor_dates=anchor_points
-        )
-    if min_threshold_point is None:
-        min_threshold_point = min(anchor_points)
-
-    if "Typical" not in df.columns:
-        df["Typical"] = (df["Open"] + df["High"] + df["Low"] + df["Close"]) / 4
-    if "TypicalMultiplyVolume" not in df.columns:
-        df["TypicalMultiplyVolume"] = df["Typical"] * df["Volume"]
-
-    # Add anchored VWAP column for every date passed in anchor_points
-    counter = 0
-    for anchor_dt in anchor_points:
-        counter = counter + 1
-        df[f"A_VWAP_{counter}"] = (
-            df["TypicalMultiplyVolume"]
-            .where(df.index >= anchor_dt)
-            .groupby(df.index >= anchor_dt)
-            .cumsum()
-            / df["Volume"]
-            .where(df.index >= anchor_dt)
-            .groupby(df.index >= anchor_dt)
-            .cumsum()
-        )
-
-    df = df[df.index >= min_threshold_point]
+    Pass max_points, e.g. 1000, to keep the rendering fast for long histories
+    or 1-minute data, see render_vwaps_chart.
+    Pass backend="agg" to draw the chart with Matplotlib instead of Plotly
+    and kaleido, it is much faster for many charts, see CHART_BACKENDS.
+    Pass band_multipliers, e.g. VWAP_BAND_MULTIPLIERS, to add the VWAP bands,
+    see compute_vwaps. Pass show_bands=False to keep them off the chart.
 
-    if print_df:
-        print(df[["Open", "High", "Low", "Close", "Volume", f"atr_{ATR_SMOOTHING_N}"]])
-    # df.to_excel("DF_before_plot_VWAP.xlsx")
-    del df["TypicalMultiplyVolume"]
-    del df["Typical"]
-
-    plot_data = [
-        go.Candlestick(
-            x=df.index,
-            open=df["Open"],
-            high=df["High"],
-            low=df["Low"],
-            close=df["Close"],
-            line=dict(width=1),
-        )
-    ]
-    for counter in range(1, len(anchor_points) + 1):
-        plot_data.append(
-            go.Scatter(
-                x=df.index,
-                y=df[f"A_VWAP_{counter}"],
-                mode="lines",
-            ),
+    Steps 1-3 are done by compute_vwaps, step 4 by render_vwaps_chart.
+    Call compute_vwaps alone if you need only the numbers.
+    To build several charts of the same bars, call prepare_chart_bars once
+    and pass its result as chart_bars.
+
+    If render_cache is passed, step 4 is skipped when file_name was rendered
+    from the same visible bars, anchors, annotation and style before,
+    see RenderCache. It can't be combined with image_exporter,
+    the image must be written before it is recorded.
+    """
+    if render_cache is not None and image_exporter is not None:
+        raise ValueError(
+            "vwaps_plot_build_save: render_cache and image_exporter can't be combined"
         )
-    fig = go.Figure(data=plot_data)
-    # fig.update_layout(
-    #     margin=dict(l=10, r=10, t=10, b=10),
-    # )
-
-    # Add title to the chart if data is available
-    # and increase the top margin to fit the title
-    fig.update_layout(
-        title=chart_title,
-        title_x=0.5,
-        title_y=0.99,
-        margin=dict(l=10, r=10, t=20, b=10),
-    )
-    fig.add_annotation(
-        xref="x domain",
-        yref="y domain",
-        x=0.01,
-        y=0.99,
-        text=chart_annotation_func(df=df),
-        showarrow=False,
-        # row=1,
-        # col=1,
+    chart_data = compute_vwaps(
+        input_df=input_df,
+        anchor_dates=anchor_dates,
+        add_last_min_max=add_last_min_max,
+        min_max_checkpoint_file=min_max_checkpoint_file,
+        chart_bars=chart_bars,
+        band_multipliers=band_multipliers,
     )
 
-    fig.update_xaxes(
-        rangeslider_visible=False,
-        rangebreaks=[
-            dict(bounds=["sat", "mon"]),  # hide weekends, Saturday to before Monday
-        ],
-    )
-    if hide_extended_hours and (input_df.attrs["interval"] != "1d"):
-        fig.update_xaxes(
-            rangebreaks=[
-                dict(
-                    # NOTE You may have to adjust these bounds for hours
-                    bounds=[21, 13.5],
-                    pattern="hour",
-                ),  # hide hours outside of trading hours, in my case 21:00-13:30
-            ],
-        )
+    if print_df:
+        columns_to_print = [
+            column
+            for column in ["Open", "High", "Low", "Close", "Volume"]
+            + [f"atr_{ATR_SMOOTHING_N}"]
+            if column in chart_data.df.columns
+        ]
+        print(chart_data.df[columns_to_print])
+    # chart_data.df.to_excel("DF_before_plot_VWAP.xlsx")
 
-    fig.update_layout(showlegend=False)
+    chart_hash = None
+    if render_cache is not None:
+        with span("render_cache_check"):
+            chart_hash = get_chart_hash(
+                df=chart_data.df,
+                anchor_points=chart_data.anchor_points,
+                annotation_text=chart_annotation_func(df=chart_data.df),
+                style=dict(
+                    chart_title=chart_title,
+                    image_format=os.path.splitext(file_name)[1],
+                    hide_extended_hours=hide_extended_hours,
+                    max_points=max_points,
+                    interval=chart_data.interval,
+                    backend=backend,
+                    show_bands=show_bands,
+                ),
+            )
+            if render_cache.is_fresh(file_name=file_name, chart_hash=chart_hash):
+                return chart_data
 
-    # NOTE it requires kaleido package,
-    # see https://stackoverflow.com/a/59819140/3139228
-    fig.write_image(file_name)
+    render_vwaps_chart(
+        chart_data=chart_data,
+        chart_title=chart_title,
+        chart_annotation_func=chart_annotation_func,
+        file_name=file_name,
+        hide_extended_hours=hide_extended_hours,
+        image_exporter=image_exporter,
+        max_points=max_points,
+        backend=backend,
+        show_bands=show_bands,
+    )
+    if render_cache is not None:
+        render_cache.record(file_name=file_name, chart_hash=chart_hash)  # type: ignore
+    return chart_data
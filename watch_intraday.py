@@ -0,0 +1,433 @@
+"""
+Long-running watch mode for intraday Anchored VWAP charts.
+Every ticker of the watchlist is polled on the schedule of its interval,
+only the new bars are merged, the VWAPs are updated incrementally,
+and the chart is rendered again only if its content has changed.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from import_ohlc import get_ohlc_from_yf
+from misc import AnchoredVWAPState, get_chart_annotation_1d, span
+from vwaps_plot_build_save import (
+    VWAPChartData,
+    preprocess_anchor_dates,
+    render_vwaps_chart,
+)
+
+# NOTE Bar durations of the intervals that Yahoo Finance accepts for intraday data
+INTERVAL_SECONDS = {
+    "1m": 60,
+    "2m": 120,
+    "5m": 300,
+    "15m": 900,
+    "30m": 1800,
+    "60m": 3600,
+    "90m": 5400,
+    "1h": 3600,
+}
+
+# NOTE Wait a little after the bar closes, so that the provider has it
+POLL_DELAY_SECONDS = 2.0
+
+
+@dataclass
+class WatchItem:
+    """
+    One chart of the watchlist. anchor_dates are like in vwaps_plot_build_save,
+    the x-marked one sets the chart start.
+    period is fetched once at the start, poll_period on every poll after that.
+    poll_seconds is the interval duration by default.
+    """
+
+    ticker: str
+    anchor_dates: List[str]
+    interval: str = "1m"
+    period: str = "5d"
+    poll_period: str = "1d"
+    poll_seconds: Optional[float] = None
+    file_name: Optional[str] = None
+    hide_extended_hours: bool = True
+    max_points: Optional[int] = None
+
+    def get_poll_seconds(self) -> float:
+        if self.poll_seconds is not None:
+            return self.poll_seconds
+        if self.interval not in INTERVAL_SECONDS:
+            raise ValueError(
+                f"WatchItem: {self.interval=}, must be one of {list(INTERVAL_SECONDS)} or pass poll_seconds"
+            )
+        return INTERVAL_SECONDS[self.interval]
+
+    def get_file_name(self) -> str:
+        if self.file_name is not None:
+            return self.file_name
+        return f"intraday_{self.ticker}_{self.interval}.png"
+
+
+@dataclass
+class WatchStats:
+    """
+    Counters of one watched chart.
+    skipped_renders: polls without changes on the chart.
+    superseded_renders: charts not rendered because newer data
+    arrived while the previous render was running.
+    """
+
+    polls: int = 0
+    new_bars: int = 0
+    renders: int = 0
+    skipped_renders: int = 0
+    superseded_renders: int = 0
+    errors: List[Exception] = field(default_factory=list)
+
+
+_CHART_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+
+class _WatchedChart:
+    """
+    Bars and anchored VWAPs of one watched chart, updated poll by poll.
+    Only the bars from the chart start on are kept, together with their VWAPs,
+    in arrays that grow by doubling. So a poll costs O(new bars * K),
+    however long the session. The sums of the earlier bars are in vwap_state.
+    """
+
+    def __init__(self, item: WatchItem):
+        self.item = item
+        anchor_points, min_threshold_point = preprocess_anchor_dates(
+            anchor_dates=item.anchor_dates
+        )
+        self.anchor_points = sorted(anchor_points)
+        self.min_threshold_point = (
+            min_threshold_point
+            if min_threshold_point is not None
+            else min(self.anchor_points)
+        )
+        self.vwap_state = AnchoredVWAPState(anchors=self.anchor_points)
+        self.last_date: Optional[pd.Timestamp] = None
+        # NOTE Rows of the chart bars: OHLCV, then A_VWAP_1 ... A_VWAP_K
+        self._timestamps = np.empty(0, dtype="datetime64[ns]")
+        self._values = np.empty((0, len(_CHART_COLUMNS) + len(self.anchor_points)))
+        self._count = 0
+        self._rendered_signature: Optional[Tuple] = None
+
+    def _reserve(self, count: int) -> None:
+        if count <= self._timestamps.shape[0]:
+            return
+        capacity = max(count, 2 * self._timestamps.shape[0])
+        timestamps = np.empty(capacity, dtype="datetime64[ns]")
+        timestamps[: self._count] = self._timestamps[: self._count]
+        values = np.empty((capacity, self._values.shape[1]))
+        values[: self._count] = self._values[: self._count]
+        self._timestamps = timestamps
+        self._values = values
+
+    def merge(self, new_bars: pd.DataFrame) -> int:
+        """
+        Merge the bars that are not older than the last bar received,
+        the last bar is replaced because it may have been incomplete.
+        Return the number of new bars.
+        """
+        new_bars = new_bars[_CHART_COLUMNS]
+        if new_bars.index.tz is not None:  # type: ignore
+            new_bars = new_bars.tz_convert(None)  # type: ignore
+        new_count = new_bars.shape[0]
+        if self.last_date is not None:
+            new_bars = new_bars[new_bars.index >= self.last_date]
+            new_count = int((new_bars.index > self.last_date).sum())
+        if new_bars.shape[0] == 0:
+            return 0
+        self.vwap_state.extend(new_bars)
+        self.last_date = new_bars.index[-1]
+
+        # NOTE Only the merged bars are computed, the replaced last bar included
+        vwaps = self.vwap_state.tail_values(bars_count=new_bars.shape[0])
+        is_visible = new_bars.index >= self.min_threshold_point
+        if not is_visible.any():
+            return new_count
+        timestamps = new_bars.index[is_visible].as_unit("ns").to_numpy()
+        values = np.hstack(
+            [new_bars.to_numpy(dtype=np.float64), vwaps], dtype=np.float64
+        )[is_visible]
+        start = self._count
+        if start > 0 and timestamps[0] == self._timestamps[start - 1]:
+            start -= 1
+        self._reserve(start + timestamps.shape[0])
+        self._timestamps[start : start + timestamps.shape[0]] = timestamps
+        self._values[start : start + timestamps.shape[0]] = values
+        self._count = start + timestamps.shape[0]
+        return new_count
+
+    def get_chart_data(self) -> Optional[VWAPChartData]:
+        """
+        Get the chart data if the chart content has changed
+        since the last call that returned it, otherwise None.
+        """
+        if self._count == 0:
+            return None
+        signature = (
+            self._count,
+            self._timestamps[self._count - 1],
+            tuple(self._values[self._count - 1]),
+        )
+        if signature == self._rendered_signature:
+            return None
+        self._rendered_signature = signature
+
+        # NOTE Copy the rows, the last one may be replaced by the next poll
+        # while the chart is being rendered in another thread
+        values = self._values[: self._count].copy()
+        columns = _CHART_COLUMNS + [
+            f"A_VWAP_{counter + 1}" for counter in range(len(self.anchor_points))
+        ]
+        df = pd.DataFrame(
+            values,
+            index=pd.DatetimeIndex(self._timestamps[: self._count].copy()),
+            columns=columns,
+            copy=False,
+        )
+        df.attrs = {"ticker": self.item.ticker, "interval": self.item.interval}
+        return VWAPChartData(
+            df=df,
+            anchor_points=self.anchor_points,
+            min_threshold_point=self.min_threshold_point,
+            last_min_date=None,
+            last_max_date=None,
+            interval=self.item.interval,
+        )
+
+
+def render_watched_chart(
+    chart_data: VWAPChartData,
+    item: WatchItem,
+    chart_annotation_func: Callable = get_chart_annotation_1d,
+) -> None:
+    """
+    Default render_func of watch_intraday.
+    """
+    chart_title = {"ticker": item.ticker, "interval": item.interval}
+    render_vwaps_chart(
+        chart_data=chart_data,
+        chart_title=str(chart_title),
+        chart_annotation_func=chart_annotation_func,
+        file_name=item.get_file_name(),
+        hide_extended_hours=item.hide_extended_hours,
+        max_points=item.max_points,
+    )
+
+
+class _RenderSlot:
+    """
+    Latest-wins render queue of one chart. At most one render runs at a time.
+    If new chart data arrives during a render, it waits in the slot
+    and replaces the data that is waiting there, which is never rendered.
+    Polls only put data in the slot, so a slow render never delays them.
+    """
+
+    def __init__(self, render: Callable, stats: WatchStats):
+        self._render = render
+        self._stats = stats
+        self._pending: Optional[VWAPChartData] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def submit(self, chart_data: VWAPChartData) -> None:
+        if self._pending is not None:
+            self._stats.superseded_renders += 1
+        self._pending = chart_data
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._render_pending())
+
+    async def _render_pending(self) -> None:
+        while self._pending is not None:
+            chart_data = self._pending
+            self._pending = None
+            try:
+                await self._render(chart_data)
+                self._stats.renders += 1
+            except Exception as error:  # pylint: disable=W0718
+                self._stats.errors.append(error)
+
+    async def wait(self) -> None:
+        if self._task is not None:
+            await self._task
+
+
+async def _watch_chart(
+    item: WatchItem,
+    get_ohlc_func: Callable,
+    render_slot: _RenderSlot,
+    stats: WatchStats,
+    stop_event: asyncio.Event,
+    max_polls: Optional[int],
+    fetch_timeout: float,
+) -> None:
+    chart = _WatchedChart(item=item)
+    poll_seconds = item.get_poll_seconds()
+    loop = asyncio.get_running_loop()
+    while not stop_event.is_set():
+        period = item.period if chart.last_date is None else item.poll_period
+        try:
+            with span("fetch", ticker=item.ticker, interval=item.interval):
+                new_bars = await asyncio.wait_for(
+                    loop.run_in_executor(
+                        None,
+                        lambda period=period: get_ohlc_func(
+                            ticker=item.ticker, period=period, interval=item.interval
+                        ),
+                    ),
+                    timeout=fetch_timeout,
+                )
+            stats.new_bars += chart.merge(new_bars=new_bars)
+            chart_data = chart.get_chart_data()
+            if chart_data is None:
+                stats.skipped_renders += 1
+            else:
+                render_slot.submit(chart_data)
+        except Exception as error:  # pylint: disable=W0718
+            stats.errors.append(error)
+        stats.polls += 1
+        if max_polls is not None and stats.polls >= max_polls:
+            return
+
+        # NOTE Poll right after the next bar closes, on the wall clock schedule,
+        # e.g. at hh:mm:02 for 1-minute bars, whatever the poll itself took.
+        delay = poll_seconds - time.time() % poll_seconds
+        if item.poll_seconds is None:
+            delay += POLL_DELAY_SECONDS
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def watch_intraday(
+    items: List[WatchItem],
+    get_ohlc_func: Callable = get_ohlc_from_yf,
+    render_func: Callable = render_watched_chart,
+    render_workers: int = 2,
+    stop_event: Optional[asyncio.Event] = None,
+    max_polls: Optional[int] = None,
+    fetch_timeout: float = 30,
+) -> Dict[Tuple[str, str], WatchStats]:
+    """
+    Watch intraday charts until stop_event is set
+    or every chart is polled max_polls times.
+    1. Poll every item on the schedule of its interval, in its own task.
+    The first poll fetches item.period, the next ones item.poll_period.
+    2. Merge only the bars that are new or update the last bar.
+    3. Update the anchored VWAPs incrementally, see AnchoredVWAPState.
+    4. If the chart content has changed, render it with
+    render_func(chart_data, item) in a pool of render_workers threads.
+    While a chart is being rendered, only the newest data waits for its turn,
+    and the polls go on.
+
+    Return WatchStats by (ticker, interval), so the same ticker
+    can be watched at several intervals. Errors of fetching and rendering
+    are kept in the stats, they don't stop the watch.
+    Use ReplayBarSource as get_ohlc_func to replay a recorded day.
+    Run it with asyncio.run(watch_intraday(...)), stop it with Ctrl+C.
+    """
+    keys = [(item.ticker, item.interval) for item in items]
+    if len(set(keys)) < len(keys):
+        raise ValueError(
+            "watch_intraday: every (ticker, interval) must be watched only once"
+        )
+    if stop_event is None:
+        stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    stats = {key: WatchStats() for key in keys}
+    with ThreadPoolExecutor(max_workers=render_workers) as render_executor:
+        render_slots = dict()
+        for key, item in zip(keys, items):
+
+            async def _render(chart_data: VWAPChartData, item: WatchItem = item):
+                await loop.run_in_executor(
+                    render_executor, render_func, chart_data, item
+                )
+
+            render_slots[key] = _RenderSlot(render=_render, stats=stats[key])
+        await asyncio.gather(
+            *[
+                _watch_chart(
+                    item=item,
+                    get_ohlc_func=get_ohlc_func,
+                    render_slot=render_slots[key],
+                    stats=stats[key],
+                    stop_event=stop_event,
+                    max_polls=max_polls,
+                    fetch_timeout=fetch_timeout,
+                )
+                for key, item in zip(keys, items)
+            ]
+        )
+        for render_slot in render_slots.values():
+            await render_slot.wait()
+    return stats
+
+
+class ReplayBarSource:
+    """
+    Fake get_ohlc_func that replays recorded bars faster than real time.
+    At the start, the bars up to start_date are visible.
+    After that, every second of real time reveals speed seconds of bars.
+    For example, with speed=600 a 1-minute bar arrives every 0.1 seconds.
+    Record a day with get_ohlc_from_yf and save it with to_parquet,
+    then load it with from_parquet.
+    """
+
+    def __init__(
+        self,
+        bars: Dict[str, pd.DataFrame],
+        speed: float = 60,
+        start_date: Optional[pd.Timestamp] = None,
+    ):
+        if speed <= 0:
+            raise ValueError(f"ReplayBarSource: {speed=} must be positive")
+        self.bars = bars
+        self.speed = speed
+        if start_date is None:
+            start_date = min(df.index[0] for df in bars.values())
+        self.start_date = pd.Timestamp(start_date)
+        self._start_time: Optional[float] = None
+
+    @classmethod
+    def from_parquet(
+        cls, file_names: Dict[str, str], speed: float = 60, **kwargs
+    ) -> "ReplayBarSource":
+        return cls(
+            bars={
+                ticker: pd.read_parquet(file_name)
+                for ticker, file_name in file_names.items()
+            },
+            speed=speed,
+            **kwargs,
+        )
+
+    def get_replay_date(self) -> pd.Timestamp:
+        """
+        The time of the recorded day that the replay has reached.
+        The clock starts at the first call.
+        """
+        if self._start_time is None:
+            self._start_time = time.monotonic()
+        elapsed = (time.monotonic() - self._start_time) * self.speed
+        return self.start_date + pd.Timedelta(seconds=elapsed)
+
+    def __call__(self, ticker: str, period: str, interval: str) -> pd.DataFrame:
+        df = self.bars[ticker]
+        replay_date = self.get_replay_date()
+        res = df[df.index <= replay_date]
+        if res.shape[0] == 0:
+            raise RuntimeError(
+                f"ReplayBarSource: no bars of {ticker=} before {replay_date}"
+            )
+        res.attrs = {"ticker": ticker, "period": period, "interval": interval}
+        return res